@@ -0,0 +1,346 @@
+"""Offline performance benchmark for the Avi-on Mesh integration.
+
+Runs the integration inside a real Home Assistant core against the stand-ins
+in fake_mesh.py and reports, as JSON:
+
+- import time of the integration, and whether that loaded the mesh library
+- setup time per phase of the service
+- entity setup time of ``light.async_setup_entry``
+- command latency from ``async_turn_on`` to the mesh handler dequeue
+- status latency from ``status_queue`` to ``async_write_ha_state``
+- event loop time spent routing each status
+
+Example::
+
+    python benchmarks/bench_avion_mesh.py --devices 500 --groups 50 \
+        --status-rate 500 --output bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from homeassistant import config_entries, loader  # noqa: E402
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.helpers import device_registry as dr  # noqa: E402
+from homeassistant.helpers import entity  # noqa: E402
+from homeassistant.helpers import entity_registry as er  # noqa: E402
+from homeassistant.helpers.entity_platform import EntityPlatform  # noqa: E402
+
+import avionhttp  # noqa: E402
+import avionmesh  # noqa: E402
+from custom_components.avion_mesh import ha_service, light, mesh_session  # noqa: E402
+from custom_components.avion_mesh.commands import payload_cache_stats  # noqa: E402
+from custom_components.avion_mesh.const import (  # noqa: E402
+    CONF_COMMAND_RATE_LIMIT,
+    CONF_MESH_LINKS,
+    DOMAIN,
+)
+from custom_components.avion_mesh.mesh_session import MeshStatusRouter  # noqa: E402
+from fake_mesh import (  # noqa: E402
+    FakeMeshHandler,
+    fake_http_list_devices,
+    synthetic_locations,
+)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Summarize latency samples (seconds) in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def stand_ins(handler: FakeMeshHandler, locations: List[dict], adapters: int) -> ExitStack:
+    """Swap the cloud API and mesh handler for local stand-ins."""
+    http_list_devices = fake_http_list_devices(locations)
+    stack = ExitStack()
+    # The integration looks these up in the libraries when it uses them
+    for target, name, value in (
+        (avionhttp, "http_list_devices", http_list_devices),
+        (avionmesh, "mesh_handler", handler),
+        (mesh_session.ha_bluetooth, "async_get_scanner", MagicMock()),
+        (mesh_session.ha_bluetooth, "async_scanner_count", MagicMock(return_value=adapters)),
+    ):
+        stack.enter_context(patch.object(target, name, value))
+    return stack
+
+
+async def async_create_hass(config_dir: str) -> HomeAssistant:
+    """Create a Home Assistant core with registries and config entries loaded."""
+    hass = HomeAssistant(config_dir)
+    loader.async_setup(hass)
+    entity.async_setup(hass)
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    await hass.config_entries.async_initialize()
+    await er.async_load(hass)
+    await dr.async_load(hass)
+    return hass
+
+
+def create_entry(hass: HomeAssistant, args: argparse.Namespace) -> config_entries.ConfigEntry:
+    """Create and register a config entry without setting it up."""
+    entry = config_entries.ConfigEntry(
+        version=1,
+        minor_version=1,
+        domain=DOMAIN,
+        title="Avi-on Mesh (benchmark)",
+        data={
+            "username": "benchmark@example.com",
+            "password": "benchmark",
+            "exclude_in_group": args.exclude_in_group,
+            "all_import": True,
+            CONF_COMMAND_RATE_LIMIT: args.rate_limit,
+            CONF_MESH_LINKS: args.links,
+        },
+        source=config_entries.SOURCE_USER,
+    )
+    # Same approach as Home Assistant's own MockConfigEntry.add_to_hass
+    hass.config_entries._entries[entry.entry_id] = entry  # pylint: disable=protected-access
+    return entry
+
+
+async def async_add_lights(
+    hass: HomeAssistant, entry: config_entries.ConfigEntry
+) -> List[light.AvionMeshLight]:
+    """Set up the light platform of a set up service and add its entities to a real platform."""
+    platform = EntityPlatform(
+        hass=hass,
+        logger=logging.getLogger(__name__),
+        domain="light",
+        platform_name=DOMAIN,
+        platform=None,
+        scan_interval=timedelta(seconds=30),
+        entity_namespace=None,
+    )
+    platform.config_entry = entry
+    entities: List[light.AvionMeshLight] = []
+    await light.async_setup_entry(
+        hass, entry, lambda new, update_before_add=False: entities.extend(new)
+    )
+    await platform.async_add_entities(entities)
+    return entities
+
+
+def measure_import() -> dict:
+    """Import the integration in a fresh interpreter, as Home Assistant would load it.
+
+    Home Assistant and its bluetooth integration are loaded first, since they
+    are already loaded when the integration is.
+    """
+    code = (
+        "import sys, time, json\n"
+        "import homeassistant.components.bluetooth, homeassistant.components.light\n"
+        "start = time.perf_counter()\n"
+        "import custom_components.avion_mesh, custom_components.avion_mesh.light\n"
+        "print(json.dumps({'import_ms': (time.perf_counter() - start) * 1000,\n"
+        "    'mesh_library_loaded': 'avionmesh' in sys.modules,\n"
+        "    'cloud_library_loaded': 'avionhttp' in sys.modules}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+async def async_run(args: argparse.Namespace) -> dict:
+    """Run all benchmark phases and return the results."""
+    locations = synthetic_locations(args.locations, args.devices, args.groups)
+    handler = FakeMeshHandler(send_delay=args.send_delay, locations=locations)
+    results: dict = {
+        "parameters": {
+            "locations": args.locations,
+            "devices": args.devices,
+            "groups": args.groups,
+            "commands": args.commands,
+            "status_rate": args.status_rate,
+            "status_duration": args.status_duration,
+            "send_delay": args.send_delay,
+            "rate_limit": args.rate_limit,
+            "links": args.links,
+        }
+    }
+
+    results["import"] = measure_import()
+
+    with tempfile.TemporaryDirectory() as config_dir, stand_ins(handler, locations, args.links):
+        hass = await async_create_hass(config_dir)
+        entry = create_entry(hass, args)
+
+        service = ha_service.AvionMeshService(hass, entry)
+        start = time.perf_counter()
+        await service.async_initialize()
+        results["service_initialize_ms"] = (time.perf_counter() - start) * 1000
+        results["setup_timings_ms"] = dict(service.setup_timings)
+        hass.data.setdefault(DOMAIN, {})[entry.entry_id] = service
+
+        # Entity setup, including adding the entities to a real platform
+        start = time.perf_counter()
+        entities = await async_add_lights(hass, entry)
+        results["entity_setup_ms"] = (time.perf_counter() - start) * 1000
+        results["entities"] = len(entities)
+        await hass.async_block_till_done()
+        results["hydration"] = await async_wait_for_hydration(service)
+
+        results["command_latency"] = await async_measure_commands(hass, handler, entities, args)
+        results["status"] = await async_measure_statuses(handler, entities, locations, args)
+        results["command_stats"] = service.get_command_stats()
+        results["status_stats"] = service.get_status_stats()
+        results["payload_cache"] = payload_cache_stats()
+        results["links"] = {
+            location_id: [link["sent"] for link in metrics["links"]]
+            for location_id, metrics in service.get_metrics().items()
+        }
+
+        await service.async_shutdown()
+        await hass.async_stop(force=True)
+
+    return results
+
+
+async def async_wait_for_hydration(service: ha_service.AvionMeshService) -> Dict[int, dict]:
+    """Wait for the startup hydration sweep of every location to finish."""
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        progress = {
+            location_id: metrics["hydration"]
+            for location_id, metrics in service.get_metrics().items()
+        }
+        if all(p is None or p["complete"] for p in progress.values()):
+            break
+        await asyncio.sleep(0.05)
+    return progress
+
+
+async def async_measure_commands(
+    hass: HomeAssistant,
+    handler: FakeMeshHandler,
+    entities: List[light.AvionMeshLight],
+    args: argparse.Namespace,
+) -> Dict[str, float]:
+    """Measure latency from async_turn_on until the handler dequeues the command."""
+    dequeued: Dict[int, asyncio.Event] = {}
+
+    def on_dequeue(_: float, command: dict) -> None:
+        if (event := dequeued.get(command.get("avid"))) is not None:
+            event.set()
+
+    handler.dequeue_listeners.append(on_dequeue)
+    samples = []
+    for i in range(args.commands):
+        entity = entities[i % len(entities)]
+        event = dequeued[entity._avid] = asyncio.Event()  # pylint: disable=protected-access
+        start = time.perf_counter()
+        await entity.async_turn_on(brightness=1 + i % 254)
+        await event.wait()
+        samples.append(time.perf_counter() - start)
+    handler.dequeue_listeners.remove(on_dequeue)
+    await hass.async_block_till_done()
+    return summarize(samples)
+
+
+async def async_measure_statuses(
+    handler: FakeMeshHandler,
+    entities: List[light.AvionMeshLight],
+    locations: List[dict],
+    args: argparse.Namespace,
+) -> dict:
+    """Measure status latency to state write and loop time spent per status."""
+    # avid -> put times of statuses not yet reflected in a state write
+    pending: Dict[int, List[float]] = {}
+    samples: List[float] = []
+    route_time = 0.0
+
+    def on_put(put_at: float, status: dict) -> None:
+        pending.setdefault(status["avid"], []).append(put_at)
+
+    original_write = light.AvionMeshLight.async_write_ha_state
+    original_route = MeshStatusRouter.async_route
+
+    def timed_write(entity: light.AvionMeshLight) -> None:
+        original_write(entity)
+        now = time.perf_counter()
+        samples.extend(now - put_at for put_at in pending.pop(entity._avid, ()))  # pylint: disable=protected-access
+
+    def timed_route(router: MeshStatusRouter, status: dict) -> None:
+        nonlocal route_time
+        start = time.perf_counter()
+        original_route(router, status)
+        route_time += time.perf_counter() - start
+
+    avids = [d["avid"] for d in locations[0]["devices"]]
+    with patch.object(light.AvionMeshLight, "async_write_ha_state", timed_write), patch.object(
+        MeshStatusRouter, "async_route", timed_route
+    ):
+        emitted = await handler.emit_statuses(
+            locations[0]["passphrase"], avids, args.status_rate, args.status_duration, on_put
+        )
+        # Let the listener drain the last batch
+        await asyncio.sleep(0.5)
+
+    return {
+        "emitted": emitted,
+        "latency_to_state_write": summarize(samples),
+        "superseded_before_write": sum(len(v) for v in pending.values()),
+        "route_time_per_status_us": route_time / emitted * 1e6 if emitted else 0.0,
+    }
+
+
+def main() -> None:
+    """Parse arguments, run the benchmark and emit JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--locations", type=int, default=1)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--status-rate", type=float, default=200.0, help="statuses per second")
+    parser.add_argument("--status-duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--send-delay", type=float, default=0.0, help="simulated BLE write time")
+    parser.add_argument(
+        "--rate-limit", type=float, default=0.0, help="packets per second, 0 for no limit"
+    )
+    parser.add_argument(
+        "--links", type=int, default=1, help="mesh connections per location, one per adapter"
+    )
+    parser.add_argument("--exclude-in-group", action="store_true")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Color mode deprecation warnings would drown out the results
+    logging.getLogger("homeassistant.components.light").setLevel(logging.ERROR)
+    results = asyncio.run(async_run(args))
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
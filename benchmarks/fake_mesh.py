@@ -0,0 +1,168 @@
+"""Local stand-ins for the Avi-on cloud API and BLE mesh handler.
+
+These replace ``avionhttp.http_list_devices`` and ``avionmesh.mesh_handler``
+so that the integration can be exercised offline against synthetic
+locations of any size.
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from custom_components.avion_mesh.mesh_session import MeshStatus
+
+# Device avids start where the mesh stops treating an avid as a group
+FIRST_DEVICE_AVID = 32896
+FIRST_GROUP_AVID = 1
+
+
+def synthetic_location(
+    devices: int, groups: int, location_id: int = 0, product_id: int = 134
+) -> dict:
+    """Build a location with devices spread round-robin across groups."""
+    prefix = f"l{location_id}"
+    location_devices = [
+        {
+            "pid": f"{prefix}-device-{i}",
+            "product_id": product_id,
+            "avid": FIRST_DEVICE_AVID + i,
+            "name": f"Device {location_id}.{i}",
+            "mac_address": f"{location_id:02x}:00:00:00:{i >> 8 & 0xFF:02x}:{i & 0xFF:02x}",
+        }
+        for i in range(devices)
+    ]
+    location_groups = [
+        {
+            "pid": f"{prefix}-group-{j}",
+            "product_id": 0,
+            "avid": FIRST_GROUP_AVID + j,
+            "name": f"Group {location_id}.{j}",
+            "devices": [d["pid"] for d in location_devices[j::groups]],
+        }
+        for j in range(groups)
+    ]
+    return {
+        "passphrase": f"passphrase-{location_id}",
+        "devices": location_devices,
+        "groups": location_groups,
+    }
+
+
+def synthetic_locations(locations: int, devices: int, groups: int) -> List[dict]:
+    """Build several synthetic locations of the same size."""
+    return [synthetic_location(devices, groups, location_id) for location_id in range(locations)]
+
+
+def fake_http_list_devices(locations: List[dict]) -> Callable:
+    """Return a stand-in for avionhttp.http_list_devices serving locations."""
+
+    async def http_list_devices(email: str, password: str, *args, **kwargs) -> List[dict]:
+        return locations
+
+    return http_list_devices
+
+
+def status_for_command(command: dict) -> Optional[dict]:
+    """Return the status the mesh would acknowledge a command with."""
+    if command.get("command") != "update":
+        return None
+    payload = json.loads(command["json"])
+    if "color_temp" in payload:
+        return {"avid": command["avid"], "color_temp": payload["color_temp"]}
+    if "brightness" in payload:
+        return {"avid": command["avid"], "brightness": payload["brightness"]}
+    return {"avid": command["avid"], "brightness": 255 if payload.get("state") == "ON" else 0}
+
+
+class FakeMeshHandler:
+    """Stand-in for avionmesh.mesh_handler that records and acknowledges commands."""
+
+    def __init__(
+        self,
+        send_delay: float = 0.0,
+        echo: bool = True,
+        locations: Optional[List[dict]] = None,
+    ) -> None:
+        """Initialize the handler.
+
+        send_delay simulates the time a BLE write takes per packet. Like the
+        library, every write is acknowledged to the connection that sent it;
+        with echo, the devices also report the new state to every connection.
+        With the locations, read_all is answered with the state of every
+        device.
+        """
+        self.send_delay = send_delay
+        self.echo = echo
+        # A read is broadcast, so every device of the location replies
+        self.avids_by_passphrase = {
+            location["passphrase"]: [device["avid"] for device in location["devices"]]
+            for location in locations or []
+        }
+        # avid -> last acknowledged brightness
+        self.brightness: Dict[int, int] = {}
+        self.dequeued: List[Tuple[float, dict]] = []
+        # Every connection to a location hears all of its statuses
+        self.status_queues: Dict[str, List[asyncio.Queue]] = {}
+        self.dequeue_listeners: List[Callable[[float, dict], None]] = []
+
+    async def __call__(
+        self,
+        passphrase: str,
+        target_devices: List[str],
+        command_queue: asyncio.Queue,
+        status_queue: asyncio.Queue,
+        scanner: object,
+    ) -> None:
+        """Run like mesh_handler: consume commands and acknowledge them."""
+        self.status_queues.setdefault(passphrase, []).append(status_queue)
+        while True:
+            command = await command_queue.get()
+            dequeued_at = time.perf_counter()
+            self.dequeued.append((dequeued_at, command.data))
+            for listener in self.dequeue_listeners:
+                listener(dequeued_at, command.data)
+
+            if self.send_delay:
+                await asyncio.sleep(self.send_delay)
+            if command.data.get("command") == "read_all":
+                for avid in self.avids_by_passphrase.get(passphrase, ()):
+                    status = {"avid": avid, "brightness": self.brightness.get(avid, 0)}
+                    await self.broadcast(passphrase, status)
+            elif (status := status_for_command(command.data)) is not None:
+                if "brightness" in status:
+                    self.brightness[status["avid"]] = status["brightness"]
+                await status_queue.put(MeshStatus(data=dict(status)))
+                if self.echo:
+                    await self.broadcast(passphrase, status)
+            command_queue.task_done()
+
+    async def broadcast(self, passphrase: str, status: dict) -> None:
+        """Deliver a status to every connection to the location."""
+        for status_queue in self.status_queues[passphrase]:
+            await status_queue.put(MeshStatus(data=dict(status)))
+
+    async def emit_statuses(
+        self,
+        passphrase: str,
+        avids: List[int],
+        rate: float,
+        duration: float,
+        on_put: Optional[Callable[[float, dict], None]] = None,
+        seed: int = 0,
+    ) -> int:
+        """Broadcast random brightness statuses at rate per second for duration seconds."""
+        rng = random.Random(seed)
+        interval = 1 / rate
+        count = 0
+        start = time.perf_counter()
+        while (now := time.perf_counter()) - start < duration:
+            status = {"avid": rng.choice(avids), "brightness": rng.randrange(256)}
+            if on_put:
+                on_put(now, status)
+            await self.broadcast(passphrase, status)
+            count += 1
+            # Pace against the schedule rather than the previous put
+            delay = start + count * interval - time.perf_counter()
+            await asyncio.sleep(max(delay, 0))
+        return count
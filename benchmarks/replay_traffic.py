@@ -0,0 +1,331 @@
+"""Replay a recorded mesh traffic capture through the Avi-on Mesh integration offline.
+
+Enable "Record mesh traffic" in the integration options to write a capture to
+``<config>/avion_mesh/traffic-<entry id>.jsonl``. This feeds its commands to
+the service and its statuses to the stand-in mesh handler of fake_mesh.py at
+their recorded pace, or faster, and reports as JSON:
+
+- how far the replay fell behind the recorded schedule
+- the handoffs to the mesh in the capture and in the replay
+- state writes, the loop time they took and the time spent routing statuses
+- the command latency, command and status counters of the service
+
+The stand-in does not acknowledge commands: the statuses in the capture
+include the acknowledgements the real mesh sent.
+
+Example::
+
+    python benchmarks/replay_traffic.py traffic-0123.jsonl --speed 10 \\
+        --locations-file .storage/avion_mesh.0123.locations
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from homeassistant.core import Context  # noqa: E402
+
+from bench_avion_mesh import (  # noqa: E402
+    async_add_lights,
+    async_create_hass,
+    async_wait_for_hydration,
+    create_entry,
+    stand_ins,
+    summarize,
+)
+from custom_components.avion_mesh import ha_service, light  # noqa: E402
+from custom_components.avion_mesh.commands import LightCommand  # noqa: E402
+from custom_components.avion_mesh.const import AVID_ALL, DOMAIN  # noqa: E402
+from custom_components.avion_mesh.ha_service import location_key  # noqa: E402
+from custom_components.avion_mesh.mesh_session import MeshStatusRouter  # noqa: E402
+from custom_components.avion_mesh.queues import PRIORITY_INTERACTIVE  # noqa: E402
+from custom_components.avion_mesh.recorder import (  # noqa: E402
+    EVENT_COMMANDS,
+    EVENT_HANDOFF,
+    EVENT_HEADER,
+    EVENT_PLANNED,
+    EVENT_STATUS,
+    capture_files,
+)
+from fake_mesh import FIRST_DEVICE_AVID, FakeMeshHandler  # noqa: E402
+
+
+def load_capture(path: str) -> List[list]:
+    """Load the events of a capture and its rotated files, on one timeline.
+
+    A recording restarted in the same file starts over at 0; its events are
+    shifted to follow the previous recording.
+    """
+    events: List[list] = []
+    started = None
+    offset = 0.0
+    for file in capture_files(path):
+        with open(file, encoding="utf-8") as capture:
+            for line in capture:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # The last line of a capture cut short
+                    continue
+                if event[0] == EVENT_HEADER:
+                    if event[2] != started:
+                        started = event[2]
+                        offset = events[-1][1] if events else 0.0
+                    continue
+                event[1] += offset
+                events.append(event)
+    return events
+
+
+def capture_locations(events: List[list], locations_file: Optional[str]) -> List[dict]:
+    """Return the locations to replay against, each at the position of its id.
+
+    Without the cached locations of the entry, a location is made up of the
+    avids seen in the capture, devices and groups told apart by their avid.
+    """
+    if locations_file:
+        cached = json.loads(Path(locations_file).read_text())
+        # Either the Home Assistant store file or the bare list
+        if not isinstance(cached, dict):
+            return cached
+        locations = cached["data"]["locations"]
+        if not (location_ids := cached["data"].get("location_ids")):
+            return locations
+        # The capture knows locations by the ids the entry gave them
+        by_id = {location_ids[location_key(location)]: location for location in locations}
+        return [
+            by_id.get(
+                location_id,
+                {"passphrase": f"replay-{location_id}", "devices": [], "groups": []},
+            )
+            for location_id in range(max(by_id, default=-1) + 1)
+        ]
+
+    avids: Dict[int, set] = {}
+    for event in events:
+        location_avids = avids.setdefault(event[2], set())
+        if event[0] in (EVENT_COMMANDS, EVENT_PLANNED):
+            location_avids.update(avid for avid, _, _ in event[4])
+        elif event[0] == EVENT_HANDOFF:
+            location_avids.add(event[4])
+        elif event[0] == EVENT_STATUS and "avid" in event[3]:
+            location_avids.add(event[3]["avid"])
+
+    locations = []
+    for location_id in range(max(avids, default=0) + 1):
+        location_avids = sorted(avids.get(location_id, set()) - {AVID_ALL})
+        locations.append(
+            {
+                "passphrase": f"replay-{location_id}",
+                "devices": [
+                    {
+                        "pid": f"replay-{location_id}-{avid}",
+                        "product_id": 134,
+                        "avid": avid,
+                        "name": f"Device {location_id}.{avid}",
+                        "mac_address": f"{location_id:02x}:00:00:00:"
+                        f"{avid >> 8 & 0xFF:02x}:{avid & 0xFF:02x}",
+                    }
+                    for avid in location_avids
+                    if avid >= FIRST_DEVICE_AVID
+                ],
+                "groups": [
+                    {
+                        "pid": f"replay-{location_id}-group-{avid}",
+                        "product_id": 0,
+                        "avid": avid,
+                        "name": f"Group {location_id}.{avid}",
+                        "devices": [],
+                    }
+                    for avid in location_avids
+                    if avid < FIRST_DEVICE_AVID
+                ],
+            }
+        )
+    return locations
+
+
+def _context(priority: int) -> Context:
+    """Return a context the service gives the recorded priority."""
+    return Context(user_id="replay") if priority == PRIORITY_INTERACTIVE else Context()
+
+
+async def async_replay(
+    service: ha_service.AvionMeshService,
+    handler: FakeMeshHandler,
+    events: List[list],
+    locations: List[dict],
+    speed: float,
+) -> Dict[str, float]:
+    """Feed the events to the service and handler on their recorded schedule.
+
+    Returns how late events were fed, in seconds. A speed of 0 feeds them as
+    fast as the event loop allows.
+    """
+    lateness: List[float] = []
+    sends: List[asyncio.Task] = []
+    first = events[0][1] if events else 0.0
+    start = time.perf_counter()
+    for event in events:
+        kind, at, location_id = event[0], event[1], event[2]
+        if speed > 0:
+            due = start + (at - first) / speed
+            if (delay := due - time.perf_counter()) > 0:
+                await asyncio.sleep(delay)
+            lateness.append(max(time.perf_counter() - due, 0.0))
+
+        if kind == EVENT_COMMANDS:
+            commands = [LightCommand(avid, op, value) for avid, op, value in event[4]]
+            # Sending waits for the planner window; keep to the schedule meanwhile
+            sends.append(
+                asyncio.create_task(
+                    service.async_send_many({location_id: commands}, _context(event[3]))
+                )
+            )
+        elif kind == EVENT_PLANNED:
+            commands = [LightCommand(avid, op, value) for avid, op, value in event[4]]
+            statuses = [{"avid": command.avid, **command.expected} for command in commands]
+            sends.append(
+                asyncio.create_task(
+                    service.async_send_planned(
+                        {location_id: commands}, {location_id: statuses}, _context(event[3])
+                    )
+                )
+            )
+        elif kind == EVENT_STATUS and location_id < len(locations):
+            await handler.broadcast(locations[location_id]["passphrase"], event[3])
+        else:
+            # Handoffs are what the replay reproduces, not what it feeds
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*sends, return_exceptions=True)
+    return {
+        "duration_s": time.perf_counter() - start,
+        "recorded_duration_s": (events[-1][1] - first) if events else 0.0,
+        "max_lateness_ms": max(lateness, default=0.0) * 1000,
+        "mean_lateness_ms": sum(lateness) / len(lateness) * 1000 if lateness else 0.0,
+    }
+
+
+async def async_run(args: argparse.Namespace) -> dict:
+    """Replay the capture and return the results."""
+    events = load_capture(args.capture)
+    locations = capture_locations(events, args.locations_file)
+    handler = FakeMeshHandler(send_delay=args.send_delay, echo=False, locations=locations)
+    results: dict = {
+        "parameters": {
+            "capture": args.capture,
+            "speed": args.speed,
+            "send_delay": args.send_delay,
+            "rate_limit": args.rate_limit,
+            "links": args.links,
+        },
+        "capture": {
+            kind: sum(1 for event in events if event[0] == kind)
+            for kind in (EVENT_COMMANDS, EVENT_PLANNED, EVENT_HANDOFF, EVENT_STATUS)
+        },
+    }
+
+    write_samples: List[float] = []
+    route_time = 0.0
+    original_write = light.AvionMeshLight.async_write_ha_state
+    original_route = MeshStatusRouter.async_route
+
+    def timed_write(entity: light.AvionMeshLight) -> None:
+        start = time.perf_counter()
+        original_write(entity)
+        write_samples.append(time.perf_counter() - start)
+
+    def timed_route(router: MeshStatusRouter, status: dict) -> None:
+        nonlocal route_time
+        start = time.perf_counter()
+        original_route(router, status)
+        route_time += time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as config_dir, stand_ins(handler, locations, args.links):
+        hass = await async_create_hass(config_dir)
+        entry = create_entry(hass, args)
+        service = ha_service.AvionMeshService(hass, entry)
+        await service.async_initialize()
+        hass.data.setdefault(DOMAIN, {})[entry.entry_id] = service
+        entities = await async_add_lights(hass, entry)
+        results["entities"] = len(entities)
+        await hass.async_block_till_done()
+        await async_wait_for_hydration(service)
+        # Leave the startup reads out of the replayed handoffs
+        handler.dequeued.clear()
+
+        with patch.object(light.AvionMeshLight, "async_write_ha_state", timed_write), patch.object(
+            MeshStatusRouter, "async_route", timed_route
+        ):
+            results["replay"] = await async_replay(
+                service, handler, events, locations, args.speed
+            )
+            # Let the queues and the status listener drain
+            await asyncio.sleep(1.0)
+            await hass.async_block_till_done()
+
+        statuses = results["capture"][EVENT_STATUS]
+        results["handoffs"] = {
+            "recorded": results["capture"][EVENT_HANDOFF],
+            "replayed": len(handler.dequeued),
+        }
+        results["state_writes"] = summarize(write_samples)
+        results["route_time_per_status_us"] = route_time / statuses * 1e6 if statuses else 0.0
+        results["command_latency"] = {
+            location_id: metrics["command_latency"]
+            for location_id, metrics in service.get_metrics().items()
+        }
+        results["command_stats"] = service.get_command_stats()
+        results["status_stats"] = service.get_status_stats()
+
+        await service.async_shutdown()
+        await hass.async_stop(force=True)
+
+    return results
+
+
+def main() -> None:
+    """Parse arguments, replay the capture and emit JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="capture file; its rotated files are replayed first")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="replay speed, 0 for as fast as possible"
+    )
+    parser.add_argument(
+        "--locations-file", help="cached locations of the entry, from .storage"
+    )
+    parser.add_argument("--send-delay", type=float, default=0.0, help="simulated BLE write time")
+    parser.add_argument(
+        "--rate-limit", type=float, default=0.0, help="packets per second, 0 for no limit"
+    )
+    parser.add_argument(
+        "--links", type=int, default=1, help="mesh connections per location, one per adapter"
+    )
+    parser.add_argument("--exclude-in-group", action="store_true")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Color mode deprecation warnings would drown out the results
+    logging.getLogger("homeassistant.components.light").setLevel(logging.ERROR)
+    results = asyncio.run(async_run(args))
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
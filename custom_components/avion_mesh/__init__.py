@@ -1,7 +1,8 @@
 """Avi-on Mesh Mesh integration for Home Assistant."""
 import asyncio
 import logging
-from typing import Optional
+import time
+from typing import List, Optional
 
 import voluptuous as vol
 from homeassistant.config_entries import ConfigEntry
@@ -10,11 +11,12 @@ from homeassistant.core import Config, HomeAssistant, ServiceCall
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.typing import ConfigType
 
-from .ha_service import AvionMeshService
+from .const import CONF_METRICS_SENSORS, DOMAIN
+from .ha_service import AvionMeshService, entry_config
+from .services import async_setup_services
 
 _LOGGER = logging.getLogger(__name__)
 
-DOMAIN = "avion_mesh"
 CONF_SETTINGS_YAML = "settings_yaml"
 
 CONFIG_SCHEMA = vol.Schema(
@@ -34,9 +36,18 @@ CONFIG_SCHEMA = vol.Schema(
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     """Set up the Avi-on Mesh integration."""
     hass.data.setdefault(DOMAIN, {})
+    async_setup_services(hass)
     return True
 
 
+def _platforms(entry: ConfigEntry) -> List[str]:
+    """Return the platforms to set up for a config entry."""
+    platforms = ["light", "scene"]
+    if entry_config(entry).get(CONF_METRICS_SENSORS, False):
+        platforms.append("sensor")
+    return platforms
+
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Avi-on Mesh from a config entry."""
     _LOGGER.info("Setting up Avi-on Mesh integration")
@@ -47,23 +58,37 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         await service.async_initialize()
         hass.data[DOMAIN][entry.entry_id] = service
 
-        # Forward entry setup to light platform
-        await hass.config_entries.async_forward_entry_setups(entry, ["light"])
+        # Forward entry setup to light (and optional metrics sensor) platforms
+        started = time.perf_counter()
+        await hass.config_entries.async_forward_entry_setups(entry, _platforms(entry))
+        service.setup_timings["platforms"] = (time.perf_counter() - started) * 1000
 
-        _LOGGER.info("Avi-on Mesh integration setup completed successfully")
+        # Options are applied to the running service, without a reload
+        entry.async_on_unload(entry.add_update_listener(_async_update_listener))
+
+        _LOGGER.info(
+            "Avi-on Mesh integration setup completed successfully in "
+            f"{service.setup_timings['initialize'] + service.setup_timings['platforms']:.1f} ms"
+        )
         return True
     except Exception as e:
         _LOGGER.error(f"Failed to set up Avi-on Mesh integration: {e}")
         return False
 
 
+async def _async_update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Apply changed options to the running service."""
+    service: AvionMeshService = hass.data[DOMAIN][entry.entry_id]
+    service.async_apply_options()
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     service: AvionMeshService = hass.data[DOMAIN][entry.entry_id]
     await service.async_shutdown()
 
     # Unload platforms
-    unload_ok = await hass.config_entries.async_unload_platforms(entry, ["light"])
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, _platforms(entry))
 
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id)
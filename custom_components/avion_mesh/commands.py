@@ -0,0 +1,90 @@
+"""Typed Avi-on mesh commands and the payloads handed to the mesh library."""
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from .const import AVID_ALL
+
+# Packet kinds: on/off and brightness are both written as a dimming packet,
+# color temperature as a color packet
+OP_DIMMING = "dimming"
+OP_COLOR = "color"
+OP_READ_ALL = "read_all"
+
+# Status value a packet kind sets
+STATUS_KEYS = {OP_DIMMING: "brightness", OP_COLOR: "color_temp"}
+
+# Encoded payloads kept for reuse; homes use the same few values over and over
+PAYLOAD_CACHE_SIZE = 1024
+
+
+@dataclass(frozen=True, slots=True)
+class LightCommand:
+    """A write of one value to a device or group, or a read of every device."""
+
+    avid: int
+    op: str
+    value: int = 0
+
+    @property
+    def key(self) -> Tuple[int, str]:
+        """Return the key under which pending commands for the same target collapse.
+
+        The command queue takes key[0] as the avid to take turns between.
+        """
+        return (self.avid, self.op)
+
+    @property
+    def expected(self) -> Dict[str, int]:
+        """Return the status values the mesh reports once the command is applied."""
+        key = STATUS_KEYS.get(self.op)
+        return {key: self.value} if key is not None else {}
+
+    @property
+    def ack(self) -> Optional[dict]:
+        """Return the status the mesh library reports for the command once it sent it.
+
+        The library acknowledges every write to itself, whether or not any
+        device heard it; a read has no acknowledgement.
+        """
+        if not (expected := self.expected):
+            return None
+        return {"avid": self.avid, **expected}
+
+    @property
+    def payload(self) -> dict:
+        """Return the command as the mesh library takes it."""
+        return encode_payload(self.avid, self.op, self.value)
+
+
+# The mesh only reads every device at once
+READ_ALL = LightCommand(AVID_ALL, OP_READ_ALL)
+
+
+def dimming(avid: int, brightness: int) -> LightCommand:
+    """Return a command setting brightness, 0 for off."""
+    return LightCommand(avid, OP_DIMMING, brightness)
+
+
+def color_temp(avid: int, kelvin: int) -> LightCommand:
+    """Return a command setting the color temperature."""
+    return LightCommand(avid, OP_COLOR, kelvin)
+
+
+@lru_cache(maxsize=PAYLOAD_CACHE_SIZE)
+def encode_payload(avid: int, op: str, value: int) -> dict:
+    """Return the command dict the mesh library sends, encoded once per value.
+
+    The dict is shared by every command with the same avid, kind and value
+    and must not be modified.
+    """
+    if op == OP_READ_ALL:
+        return {"command": "read_all"}
+    return {"avid": avid, "command": "update", "json": json.dumps({STATUS_KEYS[op]: value})}
+
+
+def payload_cache_stats() -> Dict[str, int]:
+    """Return the counters of the payload cache."""
+    info = encode_payload.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
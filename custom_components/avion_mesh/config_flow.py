@@ -8,7 +8,26 @@ from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
 from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
 
-from . import DOMAIN
+from .const import (
+    CONF_COMMAND_QUEUE_SIZE,
+    CONF_COMMAND_RATE_LIMIT,
+    CONF_MESH_LINKS,
+    CONF_METRICS_SENSORS,
+    CONF_OFFLINE_AFTER,
+    CONF_QUEUE_BLOCK_TIMEOUT,
+    CONF_QUEUE_OVERFLOW_POLICY,
+    CONF_STATUS_QUEUE_SIZE,
+    CONF_TRAFFIC_RECORDING,
+    DEFAULT_COMMAND_QUEUE_SIZE,
+    DEFAULT_COMMAND_RATE_LIMIT,
+    DEFAULT_MESH_LINKS,
+    DEFAULT_OFFLINE_AFTER,
+    DEFAULT_QUEUE_BLOCK_TIMEOUT,
+    DEFAULT_QUEUE_OVERFLOW_POLICY,
+    DEFAULT_STATUS_QUEUE_SIZE,
+    DOMAIN,
+)
+from .queues import OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -38,6 +57,21 @@ class AvionMeshConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 all_name = user_input.get("all_name", "All Avi-on Devices")
                 cap_dimming = user_input.get("cap_dimming", "")
                 cap_color_temp = user_input.get("cap_color_temp", "")
+                command_queue_size = user_input.get(
+                    CONF_COMMAND_QUEUE_SIZE, DEFAULT_COMMAND_QUEUE_SIZE
+                )
+                status_queue_size = user_input.get(CONF_STATUS_QUEUE_SIZE, DEFAULT_STATUS_QUEUE_SIZE)
+                queue_overflow_policy = user_input.get(
+                    CONF_QUEUE_OVERFLOW_POLICY, DEFAULT_QUEUE_OVERFLOW_POLICY
+                )
+                queue_block_timeout = user_input.get(
+                    CONF_QUEUE_BLOCK_TIMEOUT, DEFAULT_QUEUE_BLOCK_TIMEOUT
+                )
+                command_rate_limit = user_input.get(
+                    CONF_COMMAND_RATE_LIMIT, DEFAULT_COMMAND_RATE_LIMIT
+                )
+                mesh_links = user_input.get(CONF_MESH_LINKS, DEFAULT_MESH_LINKS)
+                metrics_sensors = user_input.get(CONF_METRICS_SENSORS, False)
 
                 if not username:
                     errors["base"] = "missing_username"
@@ -66,6 +100,15 @@ class AvionMeshConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                             # capability overrides (comma-separated ids)
                             "cap_dimming": str(cap_dimming),
                             "cap_color_temp": str(cap_color_temp),
+                            # queue bounds and overflow policy
+                            CONF_COMMAND_QUEUE_SIZE: int(command_queue_size),
+                            CONF_STATUS_QUEUE_SIZE: int(status_queue_size),
+                            CONF_QUEUE_OVERFLOW_POLICY: str(queue_overflow_policy),
+                            CONF_QUEUE_BLOCK_TIMEOUT: float(queue_block_timeout),
+                            CONF_COMMAND_RATE_LIMIT: float(command_rate_limit),
+                            CONF_MESH_LINKS: int(mesh_links),
+                            # diagnostic metric sensors
+                            CONF_METRICS_SENSORS: bool(metrics_sensors),
                         },
                     )
             except Exception as e:
@@ -89,6 +132,25 @@ class AvionMeshConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     vol.Optional("all_name", default="All Avi-on Devices"): str,
                     vol.Optional("cap_dimming", default=""): str,
                     vol.Optional("cap_color_temp", default=""): str,
+                    vol.Optional(
+                        CONF_COMMAND_QUEUE_SIZE, default=DEFAULT_COMMAND_QUEUE_SIZE
+                    ): vol.All(int, vol.Range(min=0)),
+                    vol.Optional(
+                        CONF_STATUS_QUEUE_SIZE, default=DEFAULT_STATUS_QUEUE_SIZE
+                    ): vol.All(int, vol.Range(min=0)),
+                    vol.Optional(
+                        CONF_QUEUE_OVERFLOW_POLICY, default=DEFAULT_QUEUE_OVERFLOW_POLICY
+                    ): vol.In([OVERFLOW_DROP_OLDEST, OVERFLOW_BLOCK]),
+                    vol.Optional(
+                        CONF_QUEUE_BLOCK_TIMEOUT, default=DEFAULT_QUEUE_BLOCK_TIMEOUT
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                    vol.Optional(
+                        CONF_COMMAND_RATE_LIMIT, default=DEFAULT_COMMAND_RATE_LIMIT
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                    vol.Optional(
+                        CONF_MESH_LINKS, default=DEFAULT_MESH_LINKS
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1, max=4)),
+                    vol.Optional(CONF_METRICS_SENSORS, default=False): bool,
                 }
             ),
             errors=errors,
@@ -104,6 +166,11 @@ class AvionMeshConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         return AvionMeshOptionsFlow(config_entry)
 
 
+def _valid_product_ids(value: str) -> bool:
+    """Return True if value is a comma-separated list of product ids."""
+    return all(s.strip().isdigit() for s in value.split(",") if s.strip())
+
+
 class AvionMeshOptionsFlow(config_entries.OptionsFlow):
     """Handle options for Avi-on Mesh."""
 
@@ -112,5 +179,66 @@ class AvionMeshOptionsFlow(config_entries.OptionsFlow):
         self.config_entry = config_entry
 
     async def async_step_init(self, user_input: Optional[Dict[str, Any]] = None) -> FlowResult:
-        """Manage the options."""
-        return self.async_show_form(step_id="init")
+        """Manage the device, group, capability, rate limit, recording and liveness options."""
+        errors: Dict[str, str] = {}
+
+        if user_input is not None:
+            if not all(
+                _valid_product_ids(user_input.get(key, ""))
+                for key in ("cap_dimming", "cap_color_temp")
+            ):
+                errors["base"] = "invalid_product_ids"
+            else:
+                return self.async_create_entry(title="", data=user_input)
+
+        # Options set before take precedence over the data the entry was created with
+        current = {**self.config_entry.data, **self.config_entry.options}
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        "import_devices", default=current.get("import_devices", True)
+                    ): bool,
+                    vol.Optional(
+                        "import_groups", default=current.get("import_groups", True)
+                    ): bool,
+                    vol.Optional(
+                        "exclude_in_group", default=current.get("exclude_in_group", True)
+                    ): bool,
+                    vol.Optional(
+                        "devices_include", default=current.get("devices_include", "")
+                    ): str,
+                    vol.Optional(
+                        "devices_exclude", default=current.get("devices_exclude", "")
+                    ): str,
+                    vol.Optional(
+                        "groups_include", default=current.get("groups_include", "")
+                    ): str,
+                    vol.Optional(
+                        "groups_exclude", default=current.get("groups_exclude", "")
+                    ): str,
+                    vol.Optional("all_import", default=current.get("all_import", False)): bool,
+                    vol.Optional(
+                        "all_name", default=current.get("all_name", "All Avi-on Devices")
+                    ): str,
+                    vol.Optional("cap_dimming", default=current.get("cap_dimming", "")): str,
+                    vol.Optional(
+                        "cap_color_temp", default=current.get("cap_color_temp", "")
+                    ): str,
+                    vol.Optional(
+                        CONF_COMMAND_RATE_LIMIT,
+                        default=current.get(CONF_COMMAND_RATE_LIMIT, DEFAULT_COMMAND_RATE_LIMIT),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                    vol.Optional(
+                        CONF_TRAFFIC_RECORDING,
+                        default=current.get(CONF_TRAFFIC_RECORDING, False),
+                    ): bool,
+                    vol.Optional(
+                        CONF_OFFLINE_AFTER,
+                        default=current.get(CONF_OFFLINE_AFTER, DEFAULT_OFFLINE_AFTER),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=0)),
+                }
+            ),
+            errors=errors,
+        )
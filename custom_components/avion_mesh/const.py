@@ -0,0 +1,45 @@
+"""Constants for the Avi-on Mesh integration."""
+
+DOMAIN = "avion_mesh"
+
+STORAGE_VERSION = 1
+STORAGE_KEY_LOCATIONS = DOMAIN + ".{entry_id}.locations"
+STORAGE_KEY_STATES = DOMAIN + ".{entry_id}.states"
+STORAGE_KEY_NODES = DOMAIN + ".{entry_id}.nodes"
+STORAGE_KEY_SCENES = DOMAIN + ".{entry_id}.scenes"
+# Seconds to collect state changes before writing them to storage
+STATES_SAVE_DELAY = 30
+
+SIGNAL_LOCATION_UPDATED = DOMAIN + "_location_updated_{entry_id}"
+SIGNAL_SCENES_UPDATED = DOMAIN + "_scenes_updated_{entry_id}"
+
+# avid used by the mesh to address every device in a location
+AVID_ALL = 0
+
+# Queue bounds and overflow policy ("drop_oldest" or "block")
+CONF_COMMAND_QUEUE_SIZE = "command_queue_size"
+CONF_STATUS_QUEUE_SIZE = "status_queue_size"
+CONF_QUEUE_OVERFLOW_POLICY = "queue_overflow_policy"
+CONF_QUEUE_BLOCK_TIMEOUT = "queue_block_timeout"
+# Packets per second handed to the mesh (0 for no limit)
+CONF_COMMAND_RATE_LIMIT = "command_rate_limit"
+# Parallel mesh connections per location, bounded by the Bluetooth adapters
+CONF_MESH_LINKS = "mesh_links"
+
+DEFAULT_COMMAND_QUEUE_SIZE = 256
+DEFAULT_STATUS_QUEUE_SIZE = 1024
+DEFAULT_QUEUE_OVERFLOW_POLICY = "drop_oldest"
+DEFAULT_QUEUE_BLOCK_TIMEOUT = 5.0
+DEFAULT_COMMAND_RATE_LIMIT = 20.0
+DEFAULT_MESH_LINKS = 1
+
+# Expose queue and latency metrics as diagnostic sensors
+CONF_METRICS_SENSORS = "metrics_sensors"
+
+# Record the mesh traffic to a capture file for offline replay
+CONF_TRAFFIC_RECORDING = "traffic_recording"
+
+# Seconds a device may stay silent before it is probed and then shown
+# unavailable (0 to keep every device available)
+CONF_OFFLINE_AFTER = "offline_after"
+DEFAULT_OFFLINE_AFTER = 1800
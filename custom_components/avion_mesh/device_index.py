@@ -0,0 +1,176 @@
+"""Precompiled device index for an Avi-on location."""
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, FrozenSet, Mapping, Optional, Tuple
+
+from .const import AVID_ALL
+
+DEFAULT_ALL_NAME = "All Avi-on Devices"
+
+
+def _split(value: str) -> Tuple[str, ...]:
+    """Split a comma separated config string."""
+    return tuple(s.strip() for s in value.split(",") if s.strip())
+
+
+@dataclass(frozen=True)
+class MeshOptions:
+    """Device, group and capability options parsed once from the config entry."""
+
+    import_devices: bool = True
+    import_groups: bool = True
+    exclude_in_group: bool = True
+    devices_include: FrozenSet[str] = frozenset()
+    devices_exclude: FrozenSet[str] = frozenset()
+    groups_include: FrozenSet[str] = frozenset()
+    groups_exclude: FrozenSet[str] = frozenset()
+    all_import: bool = False
+    all_name: str = DEFAULT_ALL_NAME
+    cap_dimming: FrozenSet[int] = frozenset()
+    cap_color_temp: FrozenSet[int] = frozenset()
+
+    @classmethod
+    def from_config(cls, data: Mapping[str, Any]) -> "MeshOptions":
+        """Parse the options from config entry data."""
+        return cls(
+            import_devices=bool(data.get("import_devices", True)),
+            import_groups=bool(data.get("import_groups", True)),
+            exclude_in_group=bool(data.get("exclude_in_group", True)),
+            devices_include=frozenset(_split(data.get("devices_include", ""))),
+            devices_exclude=frozenset(_split(data.get("devices_exclude", ""))),
+            groups_include=frozenset(_split(data.get("groups_include", ""))),
+            groups_exclude=frozenset(_split(data.get("groups_exclude", ""))),
+            all_import=bool(data.get("all_import", False)),
+            all_name=data.get("all_name", DEFAULT_ALL_NAME),
+            # Product ids are ints in the device data, so compare them as ints
+            cap_dimming=frozenset(int(s) for s in _split(data.get("cap_dimming", ""))),
+            cap_color_temp=frozenset(int(s) for s in _split(data.get("cap_color_temp", ""))),
+        )
+
+
+@dataclass(frozen=True)
+class IndexedDevice:
+    """A device, group or 'all' target with its capabilities resolved."""
+
+    location_id: int
+    pid: str
+    avid: int
+    name: str
+    product_id: int
+    model: str
+    dimming: bool
+    color_temp: bool
+    is_group: bool = False
+
+
+@dataclass(frozen=True)
+class DeviceIndex:
+    """Immutable lookup tables for one location, built once per location update."""
+
+    location_id: int
+    # avid -> device / group
+    devices: Mapping[int, IndexedDevice]
+    groups: Mapping[int, IndexedDevice]
+    # device avid -> avids of the groups it belongs to
+    device_groups: Mapping[int, Tuple[int, ...]]
+    # group avid -> member device avids
+    group_members: Mapping[int, FrozenSet[int]]
+    # avid -> every avid a status for it applies to (itself, members, ...)
+    fanout: Mapping[int, Tuple[int, ...]]
+    # Groups that can stand in for their members, largest first
+    coverable_groups: Tuple[Tuple[int, FrozenSet[int]], ...]
+    # Targets exposed as entities after include/exclude filtering
+    entities: Tuple[IndexedDevice, ...]
+
+    def get(self, avid: int) -> Optional[IndexedDevice]:
+        """Return the device or group with the given avid."""
+        return self.devices.get(avid) or self.groups.get(avid)
+
+    @classmethod
+    def build(cls, location_id: int, location: dict, options: MeshOptions) -> "DeviceIndex":
+        """Build the index for a location."""
+        # Imported in the executor during setup, before the first index is built
+        from avionmesh.Mesh import CAPABILITIES, PRODUCT_NAMES
+
+        dimming = CAPABILITIES["dimming"] | options.cap_dimming
+        color_temp = CAPABILITIES["color_temp"] | options.cap_color_temp
+
+        def index(item: dict, is_group: bool = False) -> IndexedDevice:
+            product_id = item.get("product_id", 0)
+            return IndexedDevice(
+                location_id=location_id,
+                pid=item.get("pid", item.get("avid")),
+                avid=item.get("avid"),
+                name=item.get("name", f"Unknown ({item.get('avid')})"),
+                product_id=product_id,
+                model=PRODUCT_NAMES.get(product_id, f"Unknown ({product_id})"),
+                dimming=product_id in dimming,
+                color_temp=product_id in color_temp,
+                is_group=is_group,
+            )
+
+        devices = {d["avid"]: index(d) for d in location.get("devices", [])}
+        pid_to_avid = {device.pid: avid for avid, device in devices.items()}
+
+        groups = {}
+        group_members = {}
+        device_groups: dict = {}
+        coverable = []
+        grouped_pids = set()
+        for group in location.get("groups", []):
+            groups[group["avid"]] = index(group, is_group=True)
+            pids = group.get("devices", [])
+            grouped_pids.update(pids)
+            members = frozenset(pid_to_avid[pid] for pid in pids if pid in pid_to_avid)
+            group_members[group["avid"]] = members
+            for avid in members:
+                device_groups.setdefault(avid, []).append(group["avid"])
+            # A group command would also reach members we know nothing about,
+            # and addressing a single device through its group saves nothing
+            if len(members) > 1 and len(members) == len(pids):
+                coverable.append((group["avid"], members))
+
+        fanout = {avid: (avid, *members) for avid, members in group_members.items()}
+        fanout[AVID_ALL] = (AVID_ALL, *groups, *devices)
+
+        entities = []
+        if options.import_groups:
+            entities.extend(
+                group
+                for group in groups.values()
+                if _should_include(group.pid, options.groups_include, options.groups_exclude)
+            )
+        if options.import_devices:
+            devices_exclude = options.devices_exclude
+            if options.exclude_in_group:
+                devices_exclude = devices_exclude | grouped_pids
+            entities.extend(
+                device
+                for device in devices.values()
+                if _should_include(device.pid, options.devices_include, devices_exclude)
+            )
+        if options.all_import:
+            # One 'all' entity per location; the first keeps the original id
+            all_pid = f"avion_all_{location_id}" if location_id else "avion_all"
+            all_name = (
+                f"{options.all_name} {location_id + 1}" if location_id else options.all_name
+            )
+            entities.append(index({"pid": all_pid, "product_id": 0, "avid": AVID_ALL, "name": all_name}))
+
+        return cls(
+            location_id=location_id,
+            devices=MappingProxyType(devices),
+            groups=MappingProxyType(groups),
+            device_groups=MappingProxyType({k: tuple(v) for k, v in device_groups.items()}),
+            group_members=MappingProxyType(group_members),
+            fanout=MappingProxyType(fanout),
+            coverable_groups=tuple(sorted(coverable, key=lambda g: len(g[1]), reverse=True)),
+            entities=tuple(entities),
+        )
+
+
+def _should_include(pid: str, include: FrozenSet[str], exclude: FrozenSet[str]) -> bool:
+    """Apply include/exclude lists; a non-empty include list wins."""
+    if include:
+        return pid in include
+    return pid not in exclude
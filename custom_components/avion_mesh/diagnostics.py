@@ -0,0 +1,37 @@
+"""Diagnostics support for the Avi-on Mesh integration."""
+from typing import Any, Dict
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN
+from .ha_service import AvionMeshService
+
+TO_REDACT = {CONF_USERNAME, CONF_PASSWORD}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> Dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    service: AvionMeshService = hass.data[DOMAIN][entry.entry_id]
+
+    metrics = service.get_metrics()
+    for location_metrics in metrics.values():
+        location_metrics["last_seen"] = {
+            str(avid): dt_util.utc_from_timestamp(seen).isoformat()
+            for avid, seen in location_metrics["last_seen"].items()
+        }
+
+    return {
+        "entry": async_redact_data(dict(entry.data), TO_REDACT),
+        "options": dict(entry.options),
+        "setup_timings_ms": service.setup_timings,
+        "traffic_recording": service.get_recording(),
+        "transitions": service.get_ramp_stats(),
+        "availability_transitions": service.get_availability_transitions(),
+        "locations": {str(location_id): m for location_id, m in metrics.items()},
+    }
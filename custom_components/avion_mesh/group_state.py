@@ -0,0 +1,79 @@
+"""Group and 'all' state derived incrementally from member device statuses."""
+from typing import Dict, Tuple
+
+from .const import AVID_ALL
+from .device_index import DeviceIndex
+
+
+class GroupStateAggregator:
+    """Running on-count and brightness sum per group, kept from member brightness.
+
+    The mesh only reports a group's own status when the group itself was
+    addressed; a member switched at the wall leaves the group untouched. Each
+    member brightness update adjusts the aggregates of the groups it belongs
+    to (and of 'all') in O(1) per group, so group state is always available
+    without reading the group from the mesh.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the aggregator."""
+        # device avid -> last known brightness
+        self._brightness: Dict[int, int] = {}
+        # device avid -> avids of the groups including it, and 'all'
+        self._groups_of: Dict[int, Tuple[int, ...]] = {}
+        # group avid -> number of members on / brightness sum of members on
+        self._on_count: Dict[int, int] = {}
+        self._brightness_sum: Dict[int, int] = {}
+        # Groups whose aggregates changed since they were last taken
+        self._dirty: Dict[int, None] = {}
+
+    def set_index(self, index: DeviceIndex) -> None:
+        """Adopt the group membership of a location's device index."""
+        self._groups_of = {
+            avid: (*index.device_groups.get(avid, ()), AVID_ALL) for avid in index.devices
+        }
+        self._brightness = {
+            avid: brightness
+            for avid, brightness in self._brightness.items()
+            if avid in self._groups_of
+        }
+        # Membership changes are rare, recount from scratch
+        self._on_count = dict.fromkeys((*index.groups, AVID_ALL), 0)
+        self._brightness_sum = dict.fromkeys(self._on_count, 0)
+        # Only groups with a member state known can be derived
+        self._dirty = {}
+        for avid, brightness in self._brightness.items():
+            for group in self._groups_of[avid]:
+                self._dirty[group] = None
+                if brightness > 0:
+                    self._on_count[group] += 1
+                    self._brightness_sum[group] += brightness
+
+    def update(self, avid: int, brightness: int) -> None:
+        """Record the brightness of a member device."""
+        groups = self._groups_of.get(avid)
+        if groups is None:
+            return
+        previous = self._brightness.get(avid)
+        if previous == brightness:
+            return
+        self._brightness[avid] = brightness
+        previous = previous or 0
+
+        on_delta = (brightness > 0) - (previous > 0)
+        sum_delta = brightness - previous
+        for group in groups:
+            self._on_count[group] += on_delta
+            self._brightness_sum[group] += sum_delta
+            self._dirty[group] = None
+
+    def status(self, group: int) -> dict:
+        """Return a status for group: on if any member is, at their mean brightness."""
+        on_count = self._on_count.get(group, 0)
+        brightness = self._brightness_sum[group] // on_count if on_count else 0
+        return {"avid": group, "brightness": brightness}
+
+    def take_dirty(self) -> Tuple[int, ...]:
+        """Return and reset the groups whose aggregates changed."""
+        dirty, self._dirty = tuple(self._dirty), {}
+        return dirty
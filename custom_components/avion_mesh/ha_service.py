@@ -1,40 +1,117 @@
 """Avi-on Mesh service for Home Assistant."""
 import asyncio
+import hashlib
+import importlib
 import logging
 import sys
-from dataclasses import dataclass
-from pathlib import Path
-from typing import Dict, List, Optional
+import time
+from types import ModuleType
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 
-from homeassistant.components import bluetooth as ha_bluetooth
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import CALLBACK_TYPE, Context, HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.storage import Store
+
+from .commands import STATUS_KEYS, LightCommand, payload_cache_stats
+from .const import (
+    CONF_COMMAND_QUEUE_SIZE,
+    CONF_COMMAND_RATE_LIMIT,
+    CONF_MESH_LINKS,
+    CONF_OFFLINE_AFTER,
+    CONF_QUEUE_BLOCK_TIMEOUT,
+    CONF_QUEUE_OVERFLOW_POLICY,
+    CONF_STATUS_QUEUE_SIZE,
+    CONF_TRAFFIC_RECORDING,
+    DEFAULT_COMMAND_QUEUE_SIZE,
+    DEFAULT_COMMAND_RATE_LIMIT,
+    DEFAULT_MESH_LINKS,
+    DEFAULT_OFFLINE_AFTER,
+    DEFAULT_QUEUE_BLOCK_TIMEOUT,
+    DEFAULT_QUEUE_OVERFLOW_POLICY,
+    DEFAULT_STATUS_QUEUE_SIZE,
+    DOMAIN,
+    SIGNAL_LOCATION_UPDATED,
+    SIGNAL_SCENES_UPDATED,
+    STATES_SAVE_DELAY,
+    STORAGE_KEY_LOCATIONS,
+    STORAGE_KEY_NODES,
+    STORAGE_KEY_SCENES,
+    STORAGE_KEY_STATES,
+    STORAGE_VERSION,
+)
+from .device_index import DeviceIndex, MeshOptions
+from .liveness import LivenessTracker
+from .mesh_session import MeshCommand, MeshSession, MeshStatus  # noqa: F401
+from .queues import PRIORITY_BULK, PRIORITY_INTERACTIVE, QueueLimits
+from .ramps import RampEngine
+from .recorder import TrafficRecorder
 
-# Add the source module to path for imports
-sys.path.insert(0, str(Path(__file__).parent.parent.parent / "src"))
+_LOGGER = logging.getLogger(__name__)
 
-from avionhttp import http_list_devices
-from avionmesh.Mesh import apply_overrides_from_settings
-from avionmesh import mesh_handler
+_T = TypeVar("_T")
+
+# Libraries imported on first use: they cost more to import than the rest of
+# the integration together
+MESH_LIBRARY = "avionmesh"
+CLOUD_LIBRARY = "avionhttp"
+
+
+async def async_import_library(hass: HomeAssistant, name: str) -> ModuleType:
+    """Import a library in the executor, so that the event loop never waits on it."""
+    if (module := sys.modules.get(name)) is not None:
+        return module
+    return await hass.async_add_executor_job(importlib.import_module, name)
+
+
+def entry_config(config_entry: ConfigEntry) -> Dict[str, Any]:
+    """Return the entry's setup data with the options changed since applied over it."""
+    return {**config_entry.data, **config_entry.options}
 
-_LOGGER = logging.getLogger(__name__)
 
-SIGNAL_MESH_STATUS_UPDATE = "avion_direct_mesh_status_update"
+def location_key(location: dict) -> str:
+    """Return the stable key of a location.
 
+    The Avi-on API names no id for a location and may list them in any
+    order; the mesh passphrase identifies it, and is stored only as a hash.
+    """
+    return hashlib.sha256(location.get("passphrase", "").encode()).hexdigest()[:16]
 
-@dataclass
-class MeshCommand:
-    """Command to be sent to mesh."""
 
-    data: dict
+def _location_pids(location: dict) -> set:
+    """Return the pids of the devices of a location."""
+    return {device["pid"] for device in location.get("devices", [])}
 
 
-@dataclass
-class MeshStatus:
-    """Status update from mesh."""
+def diff_locations(old: dict, new: dict) -> Dict[str, list]:
+    """Compare two locations and describe what changed between them."""
+    old_devices = {d["pid"]: d for d in old.get("devices", [])}
+    new_devices = {d["pid"]: d for d in new.get("devices", [])}
+    old_groups = {g["pid"]: g for g in old.get("groups", [])}
+    new_groups = {g["pid"]: g for g in new.get("groups", [])}
 
-    data: dict
+    return {
+        "added_devices": [d for pid, d in new_devices.items() if pid not in old_devices],
+        "removed_devices": [pid for pid in old_devices if pid not in new_devices],
+        "added_groups": [g for pid, g in new_groups.items() if pid not in old_groups],
+        "removed_groups": [pid for pid in old_groups if pid not in new_groups],
+        "renamed": [
+            item
+            for new_items, old_items in ((new_devices, old_devices), (new_groups, old_groups))
+            for pid, item in new_items.items()
+            if pid in old_items and old_items[pid].get("name") != item.get("name")
+        ],
+    }
+
+
+def _priority(context: Optional[Context]) -> int:
+    """Return the priority of commands sent on behalf of context.
+
+    Commands a user issued (UI, app, user service calls) are sent ahead of
+    those from automations, scripts and the integration itself.
+    """
+    return PRIORITY_INTERACTIVE if context and context.user_id else PRIORITY_BULK
 
 
 class AvionMeshService:
@@ -44,143 +121,673 @@ class AvionMeshService:
         """Initialize the service."""
         self.hass = hass
         self.config_entry = config_entry
-        self.command_queue: asyncio.Queue[MeshCommand] = asyncio.Queue()
-        self.status_queue: asyncio.Queue[MeshStatus] = asyncio.Queue()
-        self._mesh_handler_task: Optional[asyncio.Task] = None
-        self._status_listener_task: Optional[asyncio.Task] = None
-        self._location: Optional[dict] = None
-        self._target_devices: List[str] = []
-        self._passphrase: str = ""
+        # One mesh session per location, keyed by the location id stored for
+        # the location's passphrase key in _location_ids
+        self._sessions: Dict[int, MeshSession] = {}
+        config = entry_config(config_entry)
+        # Device, group and capability options, parsed once per change
+        self._options = MeshOptions.from_config(config)
+        self._queue_limits = QueueLimits(
+            command_queue_size=int(
+                config.get(CONF_COMMAND_QUEUE_SIZE, DEFAULT_COMMAND_QUEUE_SIZE)
+            ),
+            status_queue_size=int(config.get(CONF_STATUS_QUEUE_SIZE, DEFAULT_STATUS_QUEUE_SIZE)),
+            overflow_policy=config.get(CONF_QUEUE_OVERFLOW_POLICY, DEFAULT_QUEUE_OVERFLOW_POLICY),
+            block_timeout=float(
+                config.get(CONF_QUEUE_BLOCK_TIMEOUT, DEFAULT_QUEUE_BLOCK_TIMEOUT)
+            ),
+            rate_limit=float(config.get(CONF_COMMAND_RATE_LIMIT, DEFAULT_COMMAND_RATE_LIMIT)),
+        )
+        self._mesh_links = int(config.get(CONF_MESH_LINKS, DEFAULT_MESH_LINKS))
+        self._store: Store = Store(
+            hass,
+            STORAGE_VERSION,
+            STORAGE_KEY_LOCATIONS.format(entry_id=config_entry.entry_id),
+        )
+        # Last reported light states, restored on the next start
+        self._states_store: Store = Store(
+            hass,
+            STORAGE_VERSION,
+            STORAGE_KEY_STATES.format(entry_id=config_entry.entry_id),
+        )
+        # Location key -> avid -> state
+        self._saved_states: Dict[str, Dict[str, dict]] = {}
+        # Whether a save of the states is scheduled and not yet written
+        self._states_save_pending = False
+        # Mesh nodes that gave a working link, per location and link
+        self._nodes_store: Store = Store(
+            hass,
+            STORAGE_VERSION,
+            STORAGE_KEY_NODES.format(entry_id=config_entry.entry_id),
+        )
+        # Location key -> preferred node per link
+        self._saved_nodes: Dict[str, List[Optional[str]]] = {}
+        # Location key -> the id its session, entities and scenes go by
+        self._location_ids: Dict[str, int] = {}
+        # Set once the sessions of the cached locations exist
+        self._sessions_created = asyncio.Event()
+        # Scenes snapshotted from the lights, by scene id
+        self._scenes_store: Store = Store(
+            hass,
+            STORAGE_VERSION,
+            STORAGE_KEY_SCENES.format(entry_id=config_entry.entry_id),
+        )
+        self._scenes: Dict[str, dict] = {}
+        # Setup phase -> milliseconds it took
+        self.setup_timings: Dict[str, float] = {}
+        # Capture of the mesh traffic of every location, while enabled
+        self._recorder: Optional[TrafficRecorder] = None
+        # Light transitions of every location
+        self._ramps = RampEngine(self._async_send_ramp_step)
+        # Availability of the devices of every location
+        self._liveness = LivenessTracker(
+            hass,
+            float(config.get(CONF_OFFLINE_AFTER, DEFAULT_OFFLINE_AFTER)),
+            self._probe_location,
+        )
 
     async def async_initialize(self) -> None:
-        """Initialize the service and load configuration."""
-        _LOGGER.info("Initializing Avi-on Mesh service")
+        """Initialize the service and load configuration.
 
-        # Build settings from config entry data (moved from YAML into UI)
-        settings = {}
-        # Devices
-        devices_cfg = {
-            "import": bool(self.config_entry.data.get("import_devices", True)),
-            "include": [
-                s.strip()
-                for s in self.config_entry.data.get("devices_include", "").split(",")
-                if s.strip()
-            ],
-            "exclude": [
-                s.strip()
-                for s in self.config_entry.data.get("devices_exclude", "").split(",")
-                if s.strip()
-            ],
-        }
-        devices_cfg["exclude_in_group"] = bool(self.config_entry.data.get("exclude_in_group", True))
-        settings["devices"] = devices_cfg
-
-        # Groups
-        groups_cfg = {
-            "import": bool(self.config_entry.data.get("import_groups", True)),
-            "include": [
-                s.strip()
-                for s in self.config_entry.data.get("groups_include", "").split(",")
-                if s.strip()
-            ],
-            "exclude": [
-                s.strip()
-                for s in self.config_entry.data.get("groups_exclude", "").split(",")
-                if s.strip()
-            ],
-        }
-        settings["groups"] = groups_cfg
+        Loading the location, loading the saved state and importing the mesh
+        library do not depend on each other and run concurrently.
+        """
+        _LOGGER.info("Initializing Avi-on Mesh service")
+        started = time.perf_counter()
 
-        # Single device and 'all' options
-        if bool(self.config_entry.data.get("all_import", False)):
-            settings.setdefault("all", {})["import"] = True
-            settings["all"]["name"] = self.config_entry.data.get("all_name", "All Avi-on Devices")
+        locations, legacy_state, _ = await asyncio.gather(
+            self._async_timed("locations", self._async_load_locations()),
+            self._async_timed("saved_state", self._async_load_saved_state()),
+            self._async_timed("mesh_library", async_import_library(self.hass, MESH_LIBRARY)),
+        )
+        self._migrate_saved_state(*legacy_state)
+
+        self._set_recording(bool(entry_config(self.config_entry).get(CONF_TRAFFIC_RECORDING)))
+        sessions_started = time.perf_counter()
+        for location_id, location in self._match_locations(locations).items():
+            session = self._create_session(location_id, location)
+            _LOGGER.info(
+                f"Resolved {len(session.target_devices)} devices in location {location_id}"
+            )
+        self._sessions_created.set()
+
+        # Start a mesh handler, status listener and command pump per location
+        for session in self._sessions.values():
+            session.start()
+        self._liveness.async_start()
+        self.setup_timings["sessions"] = (time.perf_counter() - sessions_started) * 1000
+        self.setup_timings["initialize"] = (time.perf_counter() - started) * 1000
+
+        _LOGGER.info(
+            "Initialized Avi-on Mesh service: "
+            + ", ".join(f"{phase} {ms:.1f} ms" for phase, ms in self.setup_timings.items())
+        )
 
-        # Capability overrides
-        cap_dimming = [
-            int(s) for s in self.config_entry.data.get("cap_dimming", "").split(",") if s.strip()
-        ]
-        cap_color_temp = [
-            int(s) for s in self.config_entry.data.get("cap_color_temp", "").split(",") if s.strip()
-        ]
-        if cap_dimming or cap_color_temp:
-            settings.setdefault("capabilities_overrides", {})["dimming"] = cap_dimming
-            settings.setdefault("capabilities_overrides", {})["color_temp"] = cap_color_temp
+    async def _async_timed(self, phase: str, awaitable: Awaitable[_T]) -> _T:
+        """Await a setup phase, recording how long it took."""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.setup_timings[phase] = (time.perf_counter() - started) * 1000
+
+    async def _async_load_locations(self) -> List[dict]:
+        """Return the cached locations, or fetch them when there are none.
+
+        With a cached location, it is refreshed from the Avi-on API in the
+        background.
+        """
+        cached = await self._store.async_load()
+        if cached and cached.get("locations"):
+            _LOGGER.info("Using cached location, refreshing from Avi-on API in background")
+            # Before locations were keyed, a location's id was its position
+            self._location_ids = cached.get("location_ids") or {
+                location_key(location): location_id
+                for location_id, location in enumerate(cached["locations"])
+            }
+            self.config_entry.async_create_background_task(
+                self.hass, self._async_refresh_locations(), "avion_mesh location refresh"
+            )
+            return cached["locations"]
+
+        locations = await self._async_fetch_locations()
+        self._match_locations(locations)
+        await self._store.async_save(self._locations_to_save(locations))
+        return locations
+
+    def _locations_to_save(self, locations: List[dict]) -> dict:
+        """Return the locations and the ids given to them for storage."""
+        return {"locations": locations, "location_ids": self._location_ids}
+
+    def _match_locations(self, locations: List[dict]) -> Dict[int, dict]:
+        """Return the locations by the id each keeps, giving new locations one.
+
+        A location is recognized by its key. One whose passphrase changed is
+        recognized by sharing devices with a running session; any other
+        location is new and gets an id no location had before.
+        """
+        matched: Dict[int, dict] = {}
+        unmatched: List[dict] = []
+        for location in locations:
+            location_id = self._location_ids.get(location_key(location))
+            if location_id is None or location_id in matched:
+                unmatched.append(location)
+            else:
+                matched[location_id] = location
+
+        for location in unmatched:
+            pids = _location_pids(location)
+            location_id = next(
+                (
+                    location_id
+                    for location_id, session in self._sessions.items()
+                    if location_id not in matched and pids & _location_pids(session.location)
+                ),
+                None,
+            )
+            if location_id is None:
+                location_id = max(self._location_ids.values(), default=-1) + 1
+            else:
+                # The old passphrase is gone for good
+                self._location_ids = {
+                    key: known_id
+                    for key, known_id in self._location_ids.items()
+                    if known_id != location_id
+                }
+            self._location_ids[location_key(location)] = location_id
+            matched[location_id] = location
+        return matched
+
+    async def _async_load_saved_state(self) -> Tuple[Dict[str, dict], Dict[str, Any]]:
+        """Load the light states, preferred nodes and scenes of the previous run.
+
+        Returns the states and nodes saved by location position, before
+        locations were keyed, for _migrate_saved_state.
+        """
+        states, nodes, scenes = await asyncio.gather(
+            self._states_store.async_load(),
+            self._nodes_store.async_load(),
+            self._scenes_store.async_load(),
+        )
+        self._saved_states = states.get("states", {}) if states else {}
+        self._saved_nodes = nodes.get("location_nodes", {}) if nodes else {}
+        self._scenes = scenes.get("scenes", {}) if scenes else {}
+        return (
+            states.get("locations", {}) if states else {},
+            nodes.get("nodes", {}) if nodes else {},
+        )
 
-        # Apply mesh overrides from settings
-        apply_overrides_from_settings(settings)
+    def _migrate_saved_state(
+        self, legacy_states: Dict[str, dict], legacy_nodes: Dict[str, Any]
+    ) -> None:
+        """Key states and nodes saved by location position by location key instead.
+
+        The positions are the ids the cached locations were given.
+        """
+        for key, location_id in self._location_ids.items():
+            if str(location_id) in legacy_states:
+                self._saved_states.setdefault(key, legacy_states[str(location_id)])
+            if str(location_id) in legacy_nodes:
+                self._saved_nodes.setdefault(key, legacy_nodes[str(location_id)])
+
+    def _create_session(self, location_id: int, location: dict) -> MeshSession:
+        """Create the mesh session of a location with its saved light states."""
+        session = MeshSession(
+            self.hass,
+            location_id,
+            location,
+            self._options,
+            self._queue_limits,
+            self._mesh_links,
+        )
+        session.restore_states(
+            {
+                int(avid): state
+                for avid, state in self._saved_states.get(location_key(location), {}).items()
+            }
+        )
+        session.on_states_changed = self._async_schedule_states_save
+        session.recorder = self._recorder
+        session.liveness = self._liveness
+        self._liveness.set_index(session.index)
+        nodes = self._saved_nodes.get(location_key(location)) or []
+        # Before links, a single node was saved per location
+        session.set_preferred_nodes([nodes] if isinstance(nodes, str) else nodes)
+        for link in session.links:
+            link.on_node_selected = self._async_schedule_nodes_save
+        self._sessions[location_id] = session
+        return session
+
+    @callback
+    def _async_schedule_states_save(self) -> None:
+        """Save the reported light states STATES_SAVE_DELAY after they first changed.
+
+        A save already pending is left as it is: scheduling it again would
+        push it back, and steady traffic would keep it from ever being written.
+        """
+        if self._states_save_pending:
+            return
+        self._states_save_pending = True
+        self._states_store.async_delay_save(self._states_to_save, STATES_SAVE_DELAY)
+
+    def _states_to_save(self) -> dict:
+        """Return the reported light states of every location for storage."""
+        # Changes from here on schedule the next save
+        self._states_save_pending = False
+        self._saved_states = {
+            location_key(session.location): {
+                str(avid): state for avid, state in session.states.items()
+            }
+            for session in self._sessions.values()
+        }
+        return {"states": self._saved_states}
+
+    @callback
+    def _async_schedule_nodes_save(self, node: str) -> None:
+        """Save the preferred mesh nodes after one gave a working link."""
+        self._nodes_store.async_delay_save(self._nodes_to_save)
+
+    def _nodes_to_save(self) -> dict:
+        """Return the preferred mesh nodes of every location for storage."""
+        self._saved_nodes.update(
+            {
+                location_key(session.location): session.preferred_nodes
+                for session in self._sessions.values()
+                if any(session.preferred_nodes)
+            }
+        )
+        return {"location_nodes": self._saved_nodes}
 
-        # Get device information from Avi-on API
+    async def _async_fetch_locations(self) -> List[dict]:
+        """Fetch the account's locations from the Avi-on API."""
         email = self.config_entry.data.get("username", "")
         password = self.config_entry.data.get("password", "")
 
         _LOGGER.info(f"Fetching devices for {email}")
-        locations = await http_list_devices(email, password)
+        avionhttp = await async_import_library(self.hass, CLOUD_LIBRARY)
+        locations = await avionhttp.http_list_devices(email, password)
 
         if not locations:
             raise ValueError("No locations found for this account")
 
-        if len(locations) > 1:
-            _LOGGER.warning(f"Multiple locations found ({len(locations)}), using first")
+        return locations
 
-        self._location = locations[0]
-        self._passphrase = self._location["passphrase"]
-        self._target_devices = [d["mac_address"].upper() for d in self._location["devices"]]
+    async def _async_refresh_locations(self) -> None:
+        """Refresh the cached location from the Avi-on API and apply the diff."""
+        try:
+            locations = await self._async_fetch_locations()
+        except Exception as e:
+            _LOGGER.warning(f"Failed to refresh devices from Avi-on API, using cache: {e}")
+            return
+
+        # Fetched while the cached locations were being set up; match against them
+        await self._sessions_created.wait()
+        matched = self._match_locations(locations)
+        await self._store.async_save(self._locations_to_save(locations))
+
+        diff: Dict[str, list] = {
+            "added_devices": [],
+            "removed_devices": [],
+            "added_groups": [],
+            "removed_groups": [],
+            "renamed": [],
+        }
+        for location_id in sorted(matched.keys() | self._sessions.keys()):
+            session = self._sessions.get(location_id)
+            old_location = session.location if session else {}
+            new_location = matched.get(location_id, {})
+            for key, changes in diff_locations(old_location, new_location).items():
+                diff[key].extend(changes)
+
+            if session is None:
+                _LOGGER.info(f"New location {location_id} found, starting mesh handler")
+                session = self._create_session(location_id, new_location)
+                session.start()
+            elif not new_location:
+                _LOGGER.info(f"Location {location_id} removed, stopping mesh handler")
+                await self._sessions.pop(location_id).async_stop()
+                self._liveness.remove_location(location_id)
+            else:
+                old_passphrase = session.passphrase
+                session.set_location(new_location)
+                if session.passphrase != old_passphrase:
+                    _LOGGER.info(
+                        f"Mesh passphrase changed for location {location_id}, "
+                        "restarting mesh handler"
+                    )
+                    await session.async_restart_mesh_handler()
+
+        if not any(diff.values()):
+            _LOGGER.debug("Cached locations are up to date")
+            return
+
+        _LOGGER.info(
+            "Locations changed: %d devices added, %d removed; %d groups added, %d removed, %d renamed",
+            len(diff["added_devices"]),
+            len(diff["removed_devices"]),
+            len(diff["added_groups"]),
+            len(diff["removed_groups"]),
+            len(diff["renamed"]),
+        )
 
-        _LOGGER.info(f"Resolved {len(self._target_devices)} devices")
+        async_dispatcher_send(
+            self.hass,
+            SIGNAL_LOCATION_UPDATED.format(entry_id=self.config_entry.entry_id),
+            diff,
+        )
 
-        # Get Home Assistant scanner and start mesh handler and status listener
-        scanner = ha_bluetooth.async_get_scanner(self.hass)
+    @callback
+    def async_apply_options(self) -> None:
+        """Apply changed options to the running sessions.
+
+        Device, group and capability options rebuild the device indexes and
+        entities are added, removed and updated from them; the rate limit is
+        changed in place, traffic recording started or stopped and the
+        silence before devices go offline restarted. The mesh
+        links and queues keep running.
+        """
+        config = entry_config(self.config_entry)
+
+        rate_limit = float(config.get(CONF_COMMAND_RATE_LIMIT, DEFAULT_COMMAND_RATE_LIMIT))
+        if rate_limit != self._queue_limits.rate_limit:
+            _LOGGER.info(f"Command rate limit changed to {rate_limit} packets per second")
+            # Sessions of locations found later start with the new limit too
+            self._queue_limits.rate_limit = rate_limit
+            for session in self._sessions.values():
+                session.rate_limiter.set_rate(rate_limit)
+
+        self._set_recording(bool(config.get(CONF_TRAFFIC_RECORDING)))
+
+        offline_after = float(config.get(CONF_OFFLINE_AFTER, DEFAULT_OFFLINE_AFTER))
+        if offline_after != self._liveness.timeout:
+            _LOGGER.info(f"Devices now go offline after {offline_after} seconds of silence")
+            self._liveness.async_set_timeout(offline_after)
+
+        options = MeshOptions.from_config(config)
+        if options == self._options:
+            return
+        _LOGGER.info("Device options changed, updating entities without reconnecting")
+        self._options = options
+        for session in self._sessions.values():
+            session.set_options(options)
+
+        # Nothing changed in the locations themselves
+        async_dispatcher_send(
+            self.hass,
+            SIGNAL_LOCATION_UPDATED.format(entry_id=self.config_entry.entry_id),
+            diff_locations({}, {}),
+        )
 
-        self._mesh_handler_task = asyncio.create_task(
-            mesh_handler(
-                self._passphrase,
-                self._target_devices,
-                self.command_queue,
-                self.status_queue,
-                scanner,
+    def _set_recording(self, enabled: bool) -> None:
+        """Start or stop recording the mesh traffic of every location."""
+        if enabled == (self._recorder is not None):
+            return
+        if enabled:
+            self._recorder = TrafficRecorder(
+                self.hass,
+                self.hass.config.path(DOMAIN, f"traffic-{self.config_entry.entry_id}.jsonl"),
             )
-        )
-        self._status_listener_task = asyncio.create_task(self._listen_for_status_updates())
+            _LOGGER.info(f"Recording mesh traffic to {self._recorder.path}")
+        else:
+            _LOGGER.info(f"Stopped recording mesh traffic to {self._recorder.path}")
+            self.config_entry.async_create_background_task(
+                self.hass, self._recorder.async_stop(), "avion_mesh traffic recorder stop"
+            )
+            self._recorder = None
+        for session in self._sessions.values():
+            session.recorder = self._recorder
+
+    def get_recording(self) -> Optional[dict]:
+        """Get the traffic recording counters, if recording."""
+        return self._recorder.as_dict() if self._recorder is not None else None
+
+    @callback
+    def _probe_location(self, location_id: int) -> None:
+        """Read the state of a location whose devices went silent."""
+        if (session := self._sessions.get(location_id)) is not None:
+            session.request_resync()
+
+    def is_available(self, avid: int, location_id: int = 0) -> bool:
+        """Return True unless the device, or every device of the group, went offline."""
+        return self._liveness.is_available(location_id, avid)
+
+    @callback
+    def async_add_availability_listener(
+        self, avid: int, update_callback: Callable[[], None], location_id: int = 0
+    ) -> CALLBACK_TYPE:
+        """Register a callback for availability changes of avid in a location."""
+        return self._liveness.async_add_listener(location_id, avid, update_callback)
+
+    def get_availability_transitions(self) -> List[dict]:
+        """Get the latest devices that went offline or reported again, oldest first."""
+        return [
+            {"at": at, "location_id": location_id, "avid": avid, "available": available}
+            for at, location_id, avid, available in self._liveness.transitions
+        ]
 
-    async def _listen_for_status_updates(self) -> None:
-        """Listen for status updates from mesh and dispatch them."""
+    def _cancel_ramps(self, location_id: int, commands: List[LightCommand]) -> None:
+        """Stop the transitions of the values commands set, on their targets and members."""
+        if (session := self._sessions.get(location_id)) is None:
+            return
+        keys = set()
+        for command in commands:
+            keys.add(command.key)
+            keys.update(
+                (avid, command.op) for avid in session.index.fanout.get(command.avid, ())
+            )
+        self._ramps.cancel(location_id, keys)
+
+    async def _async_send_ramp_step(
+        self,
+        location_id: int,
+        priority: int,
+        steps: List[LightCommand],
+        finals: List[LightCommand],
+    ) -> None:
+        """Send a step of the transitions of a location."""
+        if (session := self._sessions.get(location_id)) is not None:
+            await session.async_send_ramp_step(steps, finals, priority)
+
+    async def async_transition(
+        self,
+        commands: Dict[int, List[LightCommand]],
+        transition: float,
+        context: Optional[Context] = None,
+    ) -> None:
+        """Ramp the targets of commands per location to their values over transition seconds.
+
+        A ramp starts from the value the mesh last reported. Targets without
+        one are set at once, except for brightness, which ramps up from off,
+        and so are targets that went offline.
+        """
+        priority = _priority(context)
+        immediate: Dict[int, List[LightCommand]] = {}
+        for location_id, location_commands in commands.items():
+            if (session := self._sessions.get(location_id)) is None:
+                continue
+            self._cancel_ramps(location_id, location_commands)
+            targets = []
+            for command in location_commands:
+                key = STATUS_KEYS[command.op]
+                start = session.states.get(command.avid, {}).get(
+                    key, 0 if key == "brightness" else None
+                )
+                # The steps of a ramp would be lost on a light that went offline
+                if start is None or not self._liveness.is_available(location_id, command.avid):
+                    immediate.setdefault(location_id, []).append(command)
+                else:
+                    targets.append((command, start))
+            self._ramps.start(location_id, targets, transition, priority)
+        if immediate:
+            await self.async_send_many(immediate, context)
+
+    def get_ramp_stats(self) -> Dict[str, int]:
+        """Get the transition counters."""
+        return self._ramps.stats()
+
+    async def send_mesh_command(
+        self, command: LightCommand, location_id: int = 0, context: Optional[Context] = None
+    ) -> None:
+        """Send a command to the mesh of a location, stopping the transition of its target."""
+        self._cancel_ramps(location_id, [command])
+        try:
+            await self._sessions[location_id].async_send_command(command, _priority(context))
+        except asyncio.QueueFull as e:
+            raise HomeAssistantError("Avi-on mesh command queue is full") from e
+
+    async def async_send_many(
+        self, commands: Dict[int, List[LightCommand]], context: Optional[Context] = None
+    ) -> None:
+        """Send a batch of commands per location and apply them to entity state.
+
+        Each location plans its batch in a single window. Once every command
+        is queued, the targeted entities are updated optimistically in one
+        pass, as a single entity does after its own command.
+        """
+        priority = _priority(context)
+        for location_id, location_commands in commands.items():
+            self._cancel_ramps(location_id, location_commands)
+        try:
+            await asyncio.gather(
+                *(
+                    self._sessions[location_id].async_send_commands(location_commands, priority)
+                    for location_id, location_commands in commands.items()
+                )
+            )
+        except asyncio.QueueFull as e:
+            raise HomeAssistantError("Avi-on mesh command queue is full") from e
+        for location_id, location_commands in commands.items():
+            statuses = [
+                {"avid": command.avid, **command.expected}
+                for command in location_commands
+            ]
+            self._sessions[location_id].router.async_apply(statuses)
+
+    async def async_send_planned(
+        self,
+        commands: Dict[int, List[LightCommand]],
+        statuses: Dict[int, List[dict]],
+        context: Optional[Context] = None,
+    ) -> None:
+        """Send commands planned ahead per location and apply the states they set.
+
+        Statuses are the per-entity states the commands result in; the mesh
+        echoes of the planned group commands then confirm them.
+        """
+        priority = _priority(context)
+        for location_id, location_commands in commands.items():
+            self._cancel_ramps(location_id, location_commands)
         try:
-            while True:
-                status: MeshStatus = await self.status_queue.get()
-                _LOGGER.debug(f"Status update from mesh: {status.data}")
+            await asyncio.gather(
+                *(
+                    self._sessions[location_id].async_send_planned(location_commands, priority)
+                    for location_id, location_commands in commands.items()
+                    if location_id in self._sessions
+                )
+            )
+        except asyncio.QueueFull as e:
+            raise HomeAssistantError("Avi-on mesh command queue is full") from e
+        for location_id, location_statuses in statuses.items():
+            if (session := self._sessions.get(location_id)) is not None:
+                session.router.async_apply(location_statuses)
+
+    def plan_commands(
+        self, location_id: int, commands: List[LightCommand]
+    ) -> List[LightCommand]:
+        """Return the fewest commands with the same effect in a location."""
+        return self._sessions[location_id].planner.collapse(commands)
+
+    def get_scenes(self) -> Dict[str, dict]:
+        """Get the stored scenes, keyed by scene id."""
+        return self._scenes
+
+    async def async_set_scene(self, scene_id: str, scene: dict) -> None:
+        """Store a scene, replacing any scene with the same id."""
+        self._scenes[scene_id] = scene
+        await self._async_save_scenes()
+
+    async def async_delete_scene(self, scene_id: str) -> bool:
+        """Delete a stored scene, returning False if there was none."""
+        if self._scenes.pop(scene_id, None) is None:
+            return False
+        await self._async_save_scenes()
+        return True
+
+    async def _async_save_scenes(self) -> None:
+        """Save the scenes and let the scene platform catch up."""
+        await self._scenes_store.async_save({"scenes": self._scenes})
+        async_dispatcher_send(
+            self.hass, SIGNAL_SCENES_UPDATED.format(entry_id=self.config_entry.entry_id)
+        )
+
+    def get_command_stats(self) -> Dict[int, Dict[str, int]]:
+        """Get command queue counters, high-water marks and drops per location."""
+        return {
+            location_id: session.command_stats()
+            for location_id, session in self._sessions.items()
+        }
+
+    def get_status_stats(self) -> Dict[int, Dict[str, int]]:
+        """Get status counters, queue high-water marks and suppressed writes per location."""
+        return {
+            location_id: session.status_stats()
+            for location_id, session in self._sessions.items()
+        }
 
-                # Dispatch to listeners (light entities, etc.)
-                async_dispatcher_send(self.hass, SIGNAL_MESH_STATUS_UPDATE, status.data)
+    def get_metrics(self) -> Dict[int, dict]:
+        """Get queue, latency, throughput, hydration, link and liveness metrics per location."""
+        return {
+            location_id: {
+                "devices": len(session.location.get("devices", [])),
+                "groups": len(session.location.get("groups", [])),
+                "commands": session.command_stats(),
+                "statuses": session.status_stats(),
+                "hydration": session.hydration.progress() if session.hydration else None,
+                "link": session.link_stats(),
+                "links": [link.as_dict() for link in session.links],
+                "payload_cache": payload_cache_stats(),
+                "liveness": {
+                    **self._liveness.stats(location_id),
+                    "offline_devices": self._liveness.offline_devices(location_id),
+                },
+                **session.metrics.as_dict(),
+            }
+            for location_id, session in self._sessions.items()
+        }
 
-                self.status_queue.task_done()
-        except asyncio.CancelledError:
-            _LOGGER.info("Status listener cancelled")
-            raise
+    @callback
+    def async_add_status_listener(
+        self, avid: int, update_callback: Callable[[dict], bool], location_id: int = 0
+    ) -> CALLBACK_TYPE:
+        """Register a callback for statuses affecting avid in a location."""
+        return self._sessions[location_id].router.async_add_listener(avid, update_callback)
 
-    async def send_mesh_command(self, command: dict) -> None:
-        """Send a command to the mesh."""
-        _LOGGER.debug(f"Sending mesh command: {command}")
-        await self.command_queue.put(MeshCommand(data=command))
+    def get_last_state(self, avid: int, location_id: int = 0) -> Optional[dict]:
+        """Get the last state the mesh reported for avid, possibly before a restart."""
+        session = self._sessions.get(location_id)
+        return session.states.get(avid) if session else None
 
     def get_location(self) -> Optional[dict]:
-        """Get the location data."""
-        return self._location
+        """Get the data of the first location."""
+        session = self._sessions.get(0)
+        return session.location if session else None
+
+    def get_device_indexes(self) -> Dict[int, DeviceIndex]:
+        """Get the precompiled device index of every location."""
+        return {location_id: session.index for location_id, session in self._sessions.items()}
+
+    def get_locations(self) -> Dict[int, dict]:
+        """Get the data of every location, keyed by location id."""
+        return {location_id: session.location for location_id, session in self._sessions.items()}
 
     async def async_shutdown(self) -> None:
         """Shutdown the service."""
         _LOGGER.info("Shutting down Avi-on Mesh service")
+        await self._ramps.async_stop()
+        self._liveness.async_stop()
+
+        for session in self._sessions.values():
+            await session.async_stop()
 
-        if self._mesh_handler_task and not self._mesh_handler_task.done():
-            self._mesh_handler_task.cancel()
-            try:
-                await self._mesh_handler_task
-            except asyncio.CancelledError:
-                pass
-
-        if self._status_listener_task and not self._status_listener_task.done():
-            self._status_listener_task.cancel()
-            try:
-                await self._status_listener_task
-            except asyncio.CancelledError:
-                pass
+        if self._recorder is not None:
+            await self._recorder.async_stop()
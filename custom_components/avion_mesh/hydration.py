@@ -0,0 +1,105 @@
+"""Startup sweep reading the state of every device in an Avi-on location."""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Iterable, Optional, Set
+
+from .const import AVID_ALL
+from .device_index import DeviceIndex
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds to collect replies to one read before reading again
+HYDRATION_ROUND_INTERVAL = 5.0
+# Reads to send before giving up on devices that never replied
+HYDRATION_MAX_ROUNDS = 5
+
+
+def visible_devices(index: DeviceIndex) -> Set[int]:
+    """Return the avids of the devices whose state shows up in an entity.
+
+    Group and 'all' entities derive their state from their member devices.
+    """
+    avids: Set[int] = set()
+    for entity in index.entities:
+        if entity.avid == AVID_ALL:
+            avids.update(index.devices)
+        elif entity.is_group:
+            avids.update(index.group_members.get(entity.avid, ()))
+        else:
+            avids.add(entity.avid)
+    return avids
+
+
+class HydrationSweep:
+    """Read device state until every device reported once.
+
+    The mesh can only read all devices at once and every device replies, so
+    the sweep paces itself to one outstanding read at a time: it sends a
+    read, collects replies for a round interval and only reads again while
+    devices are missing. Devices backing visible entities are the ones the
+    sweep waits for; it is complete once all of them reported.
+    """
+
+    def __init__(self, devices: Iterable[int], visible: Iterable[int]) -> None:
+        """Initialize the sweep."""
+        self.pending: Set[int] = set(devices)
+        self.pending_visible: Set[int] = set(visible) & self.pending
+        self.total = len(self.pending)
+        self.rounds = 0
+        self.started_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self._complete = asyncio.Event()
+        if not self.pending_visible:
+            self._complete.set()
+
+    @property
+    def complete(self) -> bool:
+        """Return True once every visible device reported."""
+        return self._complete.is_set()
+
+    def record(self, avids: Iterable[int]) -> None:
+        """Record devices that reported their state."""
+        avids = set(avids)
+        self.pending.difference_update(avids)
+        self.pending_visible.difference_update(avids)
+        if not self.pending_visible and not self._complete.is_set():
+            self._complete.set()
+            if self.started_at is not None:
+                self.duration = time.monotonic() - self.started_at
+
+    async def async_run(self, read_all: Callable[[], Awaitable[None]]) -> None:
+        """Run the sweep; read_all returns once the mesh sent the read."""
+        self.started_at = time.monotonic()
+        while not self.complete and self.rounds < HYDRATION_MAX_ROUNDS:
+            self.rounds += 1
+            await read_all()
+            try:
+                await asyncio.wait_for(self._complete.wait(), HYDRATION_ROUND_INTERVAL)
+            except asyncio.TimeoutError:
+                _LOGGER.debug(
+                    f"Hydration round {self.rounds}: {len(self.pending_visible)} visible "
+                    "devices still unread"
+                )
+
+        if self.complete:
+            _LOGGER.info(
+                f"Hydrated {self.total - len(self.pending)}/{self.total} devices in "
+                f"{self.duration or 0:.1f}s ({self.rounds} reads)"
+            )
+        else:
+            _LOGGER.warning(
+                f"{len(self.pending_visible)} devices did not report their state after "
+                f"{self.rounds} reads"
+            )
+
+    def progress(self) -> dict:
+        """Return the progress of the sweep."""
+        return {
+            "devices": self.total,
+            "hydrated": self.total - len(self.pending),
+            "visible_pending": len(self.pending_visible),
+            "rounds": self.rounds,
+            "complete": self.complete,
+            "duration_s": self.duration,
+        }
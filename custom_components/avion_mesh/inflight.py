@@ -0,0 +1,162 @@
+"""Tracking of in-flight commands to reconcile optimistic state with mesh echoes."""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Mapping, Optional
+
+from .commands import LightCommand
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds to wait, once a command was sent, for the mesh to confirm it
+# before re-syncing
+CONFIRM_TIMEOUT = 5.0
+
+
+@dataclass
+class InFlightCommand:
+    """The latest unconfirmed command values for an avid."""
+
+    seq: int
+    expected: Dict[str, int]
+    # Monotonic time the latest command was sent and its confirmation timer,
+    # while it is sent
+    sent_at: Optional[float] = None
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class InFlightCommands:
+    """Unconfirmed commands per avid.
+
+    Entities write their state optimistically when a command is sent. A status
+    matching the in-flight values is the mesh's echo and is absorbed without
+    another state write; a status contradicting them predates the latest
+    command and is ignored. Commands not confirmed within CONFIRM_TIMEOUT of
+    being sent, or dropped unsent, are reported through on_timeout so the
+    state can be re-synced.
+
+    The avionmesh library acknowledges every command it sends to itself,
+    with the status the command sets, whether or not any device heard it.
+    Such self-acks are withheld like echoes but do not confirm anything: only
+    a device reporting the values does.
+    """
+
+    def __init__(self, on_timeout: Callable[[int], None]) -> None:
+        """Initialize the tracker."""
+        self._on_timeout = on_timeout
+        self._inflight: Dict[int, InFlightCommand] = {}
+        self._seq = 0
+        self.tracked = 0
+        self.self_acks = 0
+        self.echoes_absorbed = 0
+        self.stale_ignored = 0
+        self.timeouts = 0
+        self.dropped = 0
+
+    def track(self, command: LightCommand) -> Dict[str, int]:
+        """Record a command queued on behalf of the entity for its avid.
+
+        The wait for its confirmation starts once it is sent. Returns the
+        values the entity now shows optimistically.
+        """
+        if not (expected := command.expected):
+            return {}
+
+        avid = command.avid
+        expected_values = dict(expected)
+        if (previous := self._inflight.get(avid)) is not None:
+            if previous.timer is not None:
+                previous.timer.cancel()
+            # Keep unconfirmed values of the other packet type
+            expected_values = {**previous.expected, **expected}
+
+        self._seq += 1
+        self._inflight[avid] = InFlightCommand(self._seq, expected_values)
+        self.tracked += 1
+        return expected
+
+    def sent(self, avid: int, values: Mapping[str, int]) -> None:
+        """Start waiting for the confirmation of avid's command setting values, now sent."""
+        entry = self._inflight.get(avid)
+        if entry is None or entry.expected.keys().isdisjoint(values):
+            return
+        if entry.timer is not None:
+            entry.timer.cancel()
+        entry.sent_at = time.monotonic()
+        entry.timer = asyncio.get_running_loop().call_later(
+            CONFIRM_TIMEOUT, self._expire, avid, entry.seq
+        )
+
+    def drop(self, avid: int) -> None:
+        """Give up on avid's command, which was dropped before it was sent."""
+        if (entry := self._inflight.pop(avid, None)) is None:
+            return
+        if entry.timer is not None:
+            entry.timer.cancel()
+        self.dropped += 1
+        self._on_timeout(avid)
+
+    def reconcile(self, avid: int, status: dict, self_ack: bool = False) -> Optional[dict]:
+        """Return the part of status to deliver for avid, or None to drop it.
+
+        A self-ack matching the in-flight values is withheld without
+        confirming them.
+        """
+        entry = self._inflight.get(avid)
+        if entry is None:
+            return status
+
+        deliver = {}
+        for key, value in status.items():
+            if key not in entry.expected:
+                deliver[key] = value
+            elif self_ack and entry.expected[key] == value:
+                # The library's acknowledgement, not the device's
+                self.self_acks += 1
+            elif entry.expected[key] == value:
+                # The echo of our command: the optimistic state already shows it
+                del entry.expected[key]
+                self.echoes_absorbed += 1
+            else:
+                # Reported before the mesh applied the latest command
+                self.stale_ignored += 1
+
+        if not entry.expected:
+            if entry.timer is not None:
+                entry.timer.cancel()
+            del self._inflight[avid]
+
+        # Nothing left but the avid
+        if deliver.keys() <= {"avid"}:
+            return None
+        return deliver
+
+    def _expire(self, avid: int, seq: int) -> None:
+        """Give up on an unconfirmed command."""
+        entry = self._inflight.get(avid)
+        if entry is None or entry.seq != seq:
+            return
+        del self._inflight[avid]
+        self.timeouts += 1
+        _LOGGER.debug(f"Command #{seq} for {avid} not confirmed, re-syncing: {entry.expected}")
+        self._on_timeout(avid)
+
+    def clear(self) -> None:
+        """Forget all in-flight commands."""
+        for entry in self._inflight.values():
+            if entry.timer is not None:
+                entry.timer.cancel()
+        self._inflight.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the tracker counters."""
+        return {
+            "in_flight": len(self._inflight),
+            "tracked": self.tracked,
+            "self_acks": self.self_acks,
+            "echoes_absorbed": self.echoes_absorbed,
+            "stale_ignored": self.stale_ignored,
+            "confirm_timeouts": self.timeouts,
+            "dropped_unsent": self.dropped,
+        }
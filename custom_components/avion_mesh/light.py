@@ -1,24 +1,26 @@
 """Light platform for Avi-on Mesh integration."""
-import json
 import logging
-from typing import Any, List, Optional
+from typing import Any, Dict, Optional
 
 from homeassistant.components.light import (
     ATTR_BRIGHTNESS,
     ATTR_COLOR_TEMP_KELVIN,
+    ATTR_TRANSITION,
     ColorMode,
     LightEntity,
+    LightEntityFeature,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import STATE_OFF, STATE_ON
 from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
-from avionmqtt.Mesh import CAPABILITIES, PRODUCT_NAMES
-
-from . import DOMAIN
-from .ha_service import SIGNAL_MESH_STATUS_UPDATE, AvionMeshService
+from .commands import LightCommand, color_temp, dimming
+from .const import DOMAIN, SIGNAL_LOCATION_UPDATED
+from .device_index import IndexedDevice
+from .ha_service import AvionMeshService
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -30,113 +32,107 @@ async def async_setup_entry(
 ) -> None:
     """Set up light entities for Avi-on Mesh."""
     service: AvionMeshService = hass.data[DOMAIN][config_entry.entry_id]
-    location = service.get_location()
+    locations = service.get_locations()
 
-    if not location:
+    if not locations:
         _LOGGER.error("Location data not available")
         return
 
-    devices_cfg = {
-        "import": bool(config_entry.data.get("import_devices", True)),
-        "include": [
-            s.strip() for s in config_entry.data.get("devices_include", "").split(",") if s.strip()
-        ],
-        "exclude": [
-            s.strip() for s in config_entry.data.get("devices_exclude", "").split(",") if s.strip()
-        ],
-    }
-    devices_cfg["exclude_in_group"] = bool(config_entry.data.get("exclude_in_group", True))
-
-    groups_cfg = {
-        "import": bool(config_entry.data.get("import_groups", True)),
-        "include": [
-            s.strip() for s in config_entry.data.get("groups_include", "").split(",") if s.strip()
-        ],
-        "exclude": [
-            s.strip() for s in config_entry.data.get("groups_exclude", "").split(",") if s.strip()
-        ],
-    }
+    def _indexed_entities() -> Dict[str, IndexedDevice]:
+        """Return the devices/groups of every location to expose, keyed by unique id."""
+        return {
+            device.pid: device
+            for index in service.get_device_indexes().values()
+            for device in index.entities
+        }
 
-    all_cfg = {}
-    if bool(config_entry.data.get("all_import", False)):
-        all_cfg["name"] = config_entry.data.get("all_name", "All Avi-on Devices")
-
-    dimming_overrides = [
-        s.strip() for s in config_entry.data.get("cap_dimming", "").split(",") if s.strip()
-    ]
-    for product_id in dimming_overrides:
-        CAPABILITIES["dimming"].add(product_id)
-    color_temp_overrides = [
-        s.strip() for s in config_entry.data.get("cap_color_temp", "").split(",") if s.strip()
-    ]
-    for product_id in color_temp_overrides:
-        CAPABILITIES["color_temp"].add(product_id)
-
-    entities: List[LightEntity] = []
-
-    def _should_include(entity: dict, cfg: dict) -> bool:
-        include = cfg.get("include")
-        exclude = cfg.get("exclude")
-        pid = entity.get("pid")
-        if include:
-            return pid in include
-        return pid not in exclude
-
-    # Handle groups
-    if groups_cfg.get("import"):
-        for group in location.get("groups", []):
-            if _should_include(group, groups_cfg):
-                entities.append(AvionMeshLight(service, group))
-
-    # Handle devices (respect exclude_in_group behavior)
-    if devices_cfg.get("exclude_in_group"):
-        exclude = set(devices_cfg.get("exclude", []))
-        for group in location.get("groups", []):
-            for d in group.get("devices", []):
-                exclude.add(d)
-        devices_cfg["exclude"] = list(exclude)
-
-    if devices_cfg.get("import"):
-        for device in location.get("devices", []):
-            if _should_include(device, devices_cfg):
-                entities.append(AvionMeshLight(service, device))
-
-    # Optional 'all' entity
-    if all_cfg:
-        all_name = all_cfg.get("name", "All Avi-on Devices")
-        entities.append(
-            AvionMeshLight(
-                service, {"pid": "avion_all", "product_id": 0, "avid": 0, "name": all_name}
-            )
-        )
+    entities: Dict[str, AvionMeshLight] = {
+        unique_id: AvionMeshLight(service, device)
+        for unique_id, device in _indexed_entities().items()
+    }
 
     if entities:
-        async_add_entities(entities)
+        async_add_entities(list(entities.values()))
         _LOGGER.info(f"Added {len(entities)} light entities")
 
+    async def _async_location_updated(diff: dict) -> None:
+        """Add, remove and rename entities after the location was refreshed."""
+        indexed = _indexed_entities()
+
+        added = [
+            AvionMeshLight(service, device)
+            for unique_id, device in indexed.items()
+            if unique_id not in entities
+        ]
+        for entity in added:
+            entities[entity.unique_id] = entity
+        if added:
+            async_add_entities(added)
+            _LOGGER.info(f"Added {len(added)} light entities")
+
+        entity_registry = er.async_get(hass)
+        for unique_id in [u for u in entities if u not in indexed]:
+            entity = entities.pop(unique_id)
+            _LOGGER.info(f"Removing light entity {entity.name}")
+            if entity.registry_entry:
+                entity_registry.async_remove(entity.entity_id)
+            else:
+                await entity.async_remove(force_remove=True)
+
+        # Names changed in the Avi-on app, and device options, e.g. capabilities
+        # or the 'all' name; each entity writes its state once
+        for unique_id, entity in entities.items():
+            entity.async_set_device(indexed[unique_id])
+
+    config_entry.async_on_unload(
+        async_dispatcher_connect(
+            hass,
+            SIGNAL_LOCATION_UPDATED.format(entry_id=config_entry.entry_id),
+            _async_location_updated,
+        )
+    )
+
 
 class AvionMeshLight(LightEntity):
     """Representation of an Avi-on light."""
 
-    def __init__(self, service: AvionMeshService, device: dict):
+    def __init__(self, service: AvionMeshService, device: IndexedDevice):
         """Initialize the light."""
         self.service = service
         self._device = device
-        self._attr_unique_id = device.get("pid", device.get("avid"))
-        self._attr_name = device.get("name", f"Unknown ({device.get('avid')})")
+        self._location_id = device.location_id
+        self._attr_unique_id = device.pid
+        self._attr_name = device.name
+        self._avid = device.avid
+        self._set_capabilities(device)
 
-        product_id = device.get("product_id", 0)
-        self._product_id = product_id
-        self._avid = device.get("avid")
+        # Device info
+        self._attr_device_info = {
+            "identifiers": {(DOMAIN, device.pid)},
+            "name": self._attr_name,
+            "manufacturer": "Avi-on",
+            "model": device.model,
+            "serial_number": device.pid,
+        }
+
+        # State (color_temp stored in kelvin)
+        self._brightness: int = 0
+        self._color_temp_kelvin: Optional[int] = None
+        self._is_on: bool = False
+
+    def _set_capabilities(self, device: IndexedDevice) -> None:
+        """Adopt the capabilities of the device and the color modes they support."""
+        self._dimming = device.dimming
+        self._color_temp = device.color_temp
 
         # Determine supported color modes and features
         supported_modes: set[ColorMode] = set()
 
-        if product_id in CAPABILITIES["color_temp"]:
+        if device.color_temp:
             supported_modes.add(ColorMode.COLOR_TEMP)
             self._attr_min_color_temp_kelvin = 2700
             self._attr_max_color_temp_kelvin = 5000
-        elif product_id in CAPABILITIES["dimming"]:
+        elif device.dimming:
             supported_modes.add(ColorMode.BRIGHTNESS)
 
         # If no special modes, expose plain on/off
@@ -144,63 +140,101 @@ class AvionMeshLight(LightEntity):
             supported_modes = {ColorMode.ONOFF}
 
         self._attr_supported_color_modes = supported_modes
-
-        # Set a sensible default color mode
-
-        # Device info
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, device.get("pid", device.get("avid")))},
-            "name": self._attr_name,
-            "manufacturer": "Avi-on",
-            "model": PRODUCT_NAMES.get(product_id, f"Unknown ({product_id})"),
-            "serial_number": device.get("pid"),
-        }
-
-        # State (color_temp stored in kelvin)
-        self._brightness: int = 0
-        self._color_temp_kelvin: Optional[int] = None
-        self._is_on: bool = False
+        # Brightness and color temperature can be ramped; plain on/off cannot
+        self._attr_supported_features = (
+            LightEntityFeature.TRANSITION
+            if device.dimming or device.color_temp
+            else LightEntityFeature(0)
+        )
 
     async def async_added_to_hass(self) -> None:
-        """Register update listener."""
+        """Restore the last reported state and register update listener."""
+        # Shown until the mesh reports again, without reading it first
+        if (state := self.service.get_last_state(self._avid, self._location_id)) is not None:
+            self._apply_status(state)
+
         self.async_on_remove(
-            async_dispatcher_connect(
-                self.hass,
-                SIGNAL_MESH_STATUS_UPDATE,
-                self._handle_mesh_update,
+            self.service.async_add_status_listener(
+                self._avid, self._handle_mesh_update, self._location_id
+            )
+        )
+        self.async_on_remove(
+            self.service.async_add_availability_listener(
+                self._avid, self.async_write_ha_state, self._location_id
             )
         )
 
     @callback
-    def _handle_mesh_update(self, status: dict) -> None:
-        """Handle status update from mesh."""
-        avid = status.get("avid")
+    def _handle_mesh_update(self, status: dict) -> bool:
+        """Handle status update from mesh, returning whether the state was written."""
+        _LOGGER.debug(f"Received status for {self._attr_name}: {status}")
 
-        if avid != self._avid:
-            return
+        if not self._apply_status(status):
+            return False
 
-        _LOGGER.debug(f"Received status for {self._attr_name}: {status}")
+        self.async_write_ha_state()
+        return True
+
+    def _apply_status(self, status: dict) -> bool:
+        """Apply a mesh status to the state, returning whether it changed."""
+        previous = (self._is_on, self._brightness, self._color_temp_kelvin, self._attr_color_mode)
+
+        # A merged status lists its values in the order they were reported
+        for key, value in status.items():
+            if key == "brightness":
+                self._brightness = value
+                self._is_on = value > 0
+                if value > 0:
+                    self._attr_color_mode = (
+                        ColorMode.BRIGHTNESS
+                        if self._dimming
+                        else ColorMode.ONOFF
+                    )
+                else:
+                    self._attr_color_mode = ColorMode.ONOFF
+
+            elif key == "color_temp":
+                self._color_temp_kelvin = value
+                self._attr_color_mode = ColorMode.COLOR_TEMP
+                self._is_on = True
+
+        return previous != (
+            self._is_on, self._brightness, self._color_temp_kelvin, self._attr_color_mode
+        )
 
-        if "brightness" in status:
-            brightness = status["brightness"]
-            self._brightness = brightness
-            self._is_on = brightness > 0
-            if brightness > 0:
-                self._attr_color_mode = (
-                    ColorMode.BRIGHTNESS
-                    if self._product_id in CAPABILITIES["dimming"]
-                    else ColorMode.ONOFF
-                )
-            else:
-                self._attr_color_mode = ColorMode.ONOFF
+    @callback
+    def async_set_device(self, device: IndexedDevice) -> None:
+        """Apply changed options to the entity in place, e.g. capability overrides."""
+        if device == self._device:
+            return
+        previous, self._device = self._device, device
+        self._set_capabilities(device)
+        if self._attr_color_mode not in (None, ColorMode.ONOFF, *self._attr_supported_color_modes):
+            # The mode last reported is no longer supported
+            self._attr_color_mode = next(iter(self._attr_supported_color_modes))
+        if device.name != previous.name:
+            self.async_rename(device.name)
+        elif self.hass is not None:
+            self.async_write_ha_state()
 
-        elif "color_temp" in status:
-            self._color_temp_kelvin = status["color_temp"]
-            self._attr_color_mode = ColorMode.COLOR_TEMP
-            self._is_on = True
+    @callback
+    def async_rename(self, name: str) -> None:
+        """Apply a name change made in the Avi-on app."""
+        self._attr_name = name
+        self._attr_device_info["name"] = name
+
+        device_registry = dr.async_get(self.hass)
+        device = device_registry.async_get_device(identifiers=self._attr_device_info["identifiers"])
+        if device is not None:
+            device_registry.async_update_device(device.id, name=name)
 
         self.async_write_ha_state()
 
+    @property
+    def available(self) -> bool:
+        """Return False once the device, or every device of the group, went silent."""
+        return self.service.is_available(self._avid, self._location_id)
+
     @property
     def is_on(self) -> bool:
         """Return True if the light is on."""
@@ -209,12 +243,12 @@ class AvionMeshLight(LightEntity):
     @property
     def brightness(self) -> Optional[int]:
         """Return the brightness of the light."""
-        return self._brightness if self._product_id in CAPABILITIES["dimming"] else None
+        return self._brightness if self._dimming else None
 
     @property
     def color_temp_kelvin(self) -> Optional[int]:
         """Return the color temperature in kelvin."""
-        return self._color_temp_kelvin if self._product_id in CAPABILITIES["color_temp"] else None
+        return self._color_temp_kelvin if self._color_temp else None
 
     async def async_turn_on(self, **kwargs: Any) -> None:
         """Turn on the light."""
@@ -223,22 +257,18 @@ class AvionMeshLight(LightEntity):
         brightness = kwargs.get(ATTR_BRIGHTNESS, 255)
         color_temp_kelvin = kwargs.get(ATTR_COLOR_TEMP_KELVIN)
 
-        payload = {}
-
-        if color_temp_kelvin is not None and self._product_id in CAPABILITIES["color_temp"]:
-            payload["color_temp"] = color_temp_kelvin
-        elif brightness is not None and self._product_id in CAPABILITIES["dimming"]:
-            payload["brightness"] = brightness
+        if color_temp_kelvin is not None and self._color_temp:
+            command = color_temp(self._avid, color_temp_kelvin)
+        elif brightness is not None and self._dimming:
+            command = dimming(self._avid, brightness)
         else:
-            payload["state"] = STATE_ON
+            # Switching on is a write of full brightness
+            command = dimming(self._avid, 255)
 
-        command = {
-            "avid": self._avid,
-            "command": "update",
-            "json": json.dumps(payload),
-        }
+        if await self._async_transition(command, kwargs):
+            return
 
-        await self.service.send_mesh_command(command)
+        await self.service.send_mesh_command(command, self._location_id, self._context)
 
         # Update local state
         if color_temp_kelvin is not None:
@@ -254,18 +284,30 @@ class AvionMeshLight(LightEntity):
 
         self.async_write_ha_state()
 
+    async def _async_transition(self, command: LightCommand, kwargs: Dict[str, Any]) -> bool:
+        """Ramp to the value of command if a transition was asked for.
+
+        The state then follows the mesh through the transition. Returns
+        whether the command was handed to the ramp engine.
+        """
+        transition = kwargs.get(ATTR_TRANSITION)
+        if not transition or not self.supported_features & LightEntityFeature.TRANSITION:
+            return False
+        await self.service.async_transition(
+            {self._location_id: [command]}, transition, self._context
+        )
+        return True
+
     async def async_turn_off(self, **kwargs: Any) -> None:
         """Turn off the light."""
         _LOGGER.debug(f"Turning off {self._attr_name}")
 
-        payload = {"state": STATE_OFF}
-        command = {
-            "avid": self._avid,
-            "command": "update",
-            "json": json.dumps(payload),
-        }
+        if await self._async_transition(dimming(self._avid, 0), kwargs):
+            return
 
-        await self.service.send_mesh_command(command)
+        await self.service.send_mesh_command(
+            dimming(self._avid, 0), self._location_id, self._context
+        )
 
         # Update local state
         self._is_on = False
@@ -0,0 +1,304 @@
+"""Availability of Avi-on devices, from how long ago they last reported."""
+import logging
+import math
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.util import dt as dt_util
+
+from .const import AVID_ALL
+from .device_index import DeviceIndex
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds per slot of the timer wheel; silence is checked once per slot
+LIVENESS_RESOLUTION = 10.0
+# Seconds a device has to answer the read sent once its silence ran out
+PROBE_GRACE = 30.0
+# Availability transitions kept for diagnostics
+TRANSITIONS_KEPT = 100
+
+# (location id, device avid)
+_Key = Tuple[int, int]
+
+
+class LivenessTracker:
+    """Liveness of the devices of every location, expired through one timer wheel.
+
+    Each device sits in the slot of the wheel its silence runs out in and is
+    moved when it reports again, so a status costs a set move and a tick only
+    visits the slots that came due. A device whose silence ran out is probed
+    with a read of its location; if it stays silent for PROBE_GRACE more, it
+    is offline until it reports again. A group, or the 'all' avid, is
+    available while any of its devices is.
+
+    Echoes of the commands the integration sent do not count as reports:
+    the mesh library acknowledges every command for its target itself,
+    whether or not the device heard it.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        timeout: float,
+        probe: Callable[[int], None],
+        resolution: float = LIVENESS_RESOLUTION,
+    ) -> None:
+        """Initialize the tracker; a timeout of 0 keeps every device available."""
+        self.hass = hass
+        self.timeout = timeout
+        self.resolution = resolution
+        self._probe = probe
+        self._indexes: Dict[int, DeviceIndex] = {}
+        # slot -> devices whose silence runs out in it, and the reverse
+        self._slots: Dict[int, Set[_Key]] = {}
+        self._slot_of: Dict[_Key, int] = {}
+        # First slot not yet expired
+        self._next_slot = self._slot(time.monotonic())
+        self._probed: Set[_Key] = set()
+        self._offline: Set[_Key] = set()
+        self._offline_count: Dict[int, int] = {}
+        self._listeners: Dict[_Key, List[Callable[[], None]]] = {}
+        self._cancel_tick: Optional[CALLBACK_TYPE] = None
+        # location id -> counter -> value
+        self._counters: Dict[int, Dict[str, int]] = {}
+        # (time, location id, avid, available), oldest first
+        self.transitions: Deque[Tuple[str, int, int, bool]] = deque(maxlen=TRANSITIONS_KEPT)
+
+    @property
+    def enabled(self) -> bool:
+        """Return True if devices can go offline."""
+        return self.timeout > 0
+
+    def _slot(self, at: float) -> int:
+        """Return the slot of the wheel a monotonic time falls in."""
+        return math.ceil(at / self.resolution)
+
+    def _schedule(self, key: _Key, at: float) -> None:
+        """Move a device to the slot of a monotonic time."""
+        slot = max(self._slot(at), self._next_slot)
+        if (previous := self._slot_of.get(key)) == slot:
+            return
+        if previous is not None:
+            self._slots[previous].discard(key)
+        self._slots.setdefault(slot, set()).add(key)
+        self._slot_of[key] = slot
+
+    def _unschedule(self, key: _Key) -> None:
+        """Take a device off the wheel."""
+        if (slot := self._slot_of.pop(key, None)) is not None:
+            self._slots[slot].discard(key)
+
+    def _count(self, location_id: int, counter: str, amount: int = 1) -> None:
+        """Add to a counter of a location."""
+        counters = self._counters.setdefault(
+            location_id, {"went_offline": 0, "came_online": 0, "probes": 0}
+        )
+        counters[counter] += amount
+
+    @callback
+    def async_start(self) -> None:
+        """Start the wheel, if devices can go offline."""
+        if self.enabled and self._cancel_tick is None:
+            self._next_slot = self._slot(time.monotonic())
+            self._cancel_tick = async_track_time_interval(
+                self.hass, self._async_tick, timedelta(seconds=self.resolution)
+            )
+
+    @callback
+    def async_stop(self) -> None:
+        """Stop the wheel."""
+        if self._cancel_tick is not None:
+            self._cancel_tick()
+            self._cancel_tick = None
+
+    @callback
+    def async_set_timeout(self, timeout: float) -> None:
+        """Adopt a new silence before devices go offline.
+
+        Every device starts its silence over; with a timeout of 0, the wheel
+        stops and offline devices become available again.
+        """
+        self.timeout = timeout
+        self.async_stop()
+        self._slots.clear()
+        self._slot_of.clear()
+        self._probed.clear()
+        if not self.enabled:
+            self._set_online(list(self._offline))
+            return
+        self.async_start()
+        now = time.monotonic()
+        for location_id, index in self._indexes.items():
+            for avid in index.devices:
+                if (location_id, avid) not in self._offline:
+                    self._schedule((location_id, avid), now + timeout)
+
+    def set_index(self, index: DeviceIndex) -> None:
+        """Watch the devices of a location's index; new devices start out available."""
+        location_id = index.location_id
+        self._indexes[location_id] = index
+        now = time.monotonic()
+        watched = [key for key in self._slot_of if key[0] == location_id]
+        watched.extend(key for key in self._offline if key[0] == location_id)
+        for key in watched:
+            if key[1] not in index.devices:
+                self._forget(key)
+        if not self.enabled:
+            return
+        for avid in index.devices:
+            key = (location_id, avid)
+            if key not in self._slot_of and key not in self._offline:
+                self._schedule(key, now + self.timeout)
+
+    def remove_location(self, location_id: int) -> None:
+        """Stop watching the devices of a location."""
+        self._indexes.pop(location_id, None)
+        for key in [key for key in self._slot_of if key[0] == location_id]:
+            self._forget(key)
+        for key in [key for key in self._offline if key[0] == location_id]:
+            self._forget(key)
+        self._counters.pop(location_id, None)
+
+    def _forget(self, key: _Key) -> None:
+        """Stop watching a device."""
+        self._unschedule(key)
+        self._probed.discard(key)
+        if key in self._offline:
+            self._offline.discard(key)
+            self._offline_count[key[0]] -= 1
+
+    @callback
+    def async_seen(self, location_id: int, avids: Iterable[int]) -> None:
+        """Record that devices of a location reported on their own, bringing offline ones back."""
+        if not self.enabled or (index := self._indexes.get(location_id)) is None:
+            return
+        deadline = time.monotonic() + self.timeout
+        back: List[_Key] = []
+        for avid in avids:
+            if avid not in index.devices:
+                # A group echo does not tell which members heard it
+                continue
+            key = (location_id, avid)
+            self._schedule(key, deadline)
+            self._probed.discard(key)
+            if key in self._offline:
+                back.append(key)
+        if back:
+            self._set_online(back)
+
+    @callback
+    def _async_tick(self, _now: object = None) -> None:
+        """Probe the devices whose silence ran out and take the probed ones offline."""
+        now = time.monotonic()
+        current = math.floor(now / self.resolution)
+        silent: List[_Key] = []
+        probe: Set[int] = set()
+        for slot in range(self._next_slot, current + 1):
+            for key in self._slots.pop(slot, ()):
+                del self._slot_of[key]
+                if key in self._probed:
+                    self._probed.discard(key)
+                    silent.append(key)
+                else:
+                    self._probed.add(key)
+                    self._schedule(key, now + PROBE_GRACE)
+                    probe.add(key[0])
+        self._next_slot = max(self._next_slot, current + 1)
+
+        for location_id in probe:
+            self._count(location_id, "probes")
+            self._probe(location_id)
+        if silent:
+            self._set_offline(silent)
+
+    def _set_offline(self, keys: List[_Key]) -> None:
+        """Take devices offline and tell the listeners affected."""
+        for key in keys:
+            self._offline.add(key)
+            self._offline_count[key[0]] = self._offline_count.get(key[0], 0) + 1
+        self._transition(keys, False)
+
+    def _set_online(self, keys: List[_Key]) -> None:
+        """Bring devices back and tell the listeners affected."""
+        for key in keys:
+            self._offline.discard(key)
+            self._offline_count[key[0]] -= 1
+        self._transition(keys, True)
+
+    def _transition(self, keys: List[_Key], available: bool) -> None:
+        """Record availability transitions and call the listeners of every avid affected."""
+        at = dt_util.utcnow().isoformat()
+        affected: Dict[_Key, None] = {}
+        by_location: Dict[int, int] = {}
+        for location_id, avid in keys:
+            self.transitions.append((at, location_id, avid, available))
+            by_location[location_id] = by_location.get(location_id, 0) + 1
+            affected[(location_id, avid)] = None
+            if (index := self._indexes.get(location_id)) is not None:
+                for group in index.device_groups.get(avid, ()):
+                    affected[(location_id, group)] = None
+            affected[(location_id, AVID_ALL)] = None
+
+        for location_id, count in by_location.items():
+            self._count(location_id, "came_online" if available else "went_offline", count)
+            _LOGGER.info(
+                f"{count} devices in location {location_id} "
+                + ("reported again" if available else "went offline")
+            )
+        for key in affected:
+            for update_callback in list(self._listeners.get(key, ())):
+                update_callback()
+
+    def is_available(self, location_id: int, avid: int) -> bool:
+        """Return True if a device, or any device of a group or 'all', is available."""
+        if not self._offline_count.get(location_id):
+            return True
+        if (index := self._indexes.get(location_id)) is None:
+            return True
+        if avid in index.devices:
+            return (location_id, avid) not in self._offline
+        if avid == AVID_ALL:
+            return self._offline_count[location_id] < len(index.devices)
+        members = index.group_members.get(avid)
+        if not members:
+            return True
+        return any((location_id, member) not in self._offline for member in members)
+
+    @callback
+    def async_add_listener(
+        self, location_id: int, avid: int, update_callback: Callable[[], None]
+    ) -> CALLBACK_TYPE:
+        """Listen for availability changes of avid, returning a removal callback."""
+        key = (location_id, avid)
+        listeners = self._listeners.setdefault(key, [])
+        listeners.append(update_callback)
+
+        @callback
+        def remove_listener() -> None:
+            listeners.remove(update_callback)
+            if not listeners and self._listeners.get(key) is listeners:
+                del self._listeners[key]
+
+        return remove_listener
+
+    def stats(self, location_id: int) -> Dict[str, int]:
+        """Return the availability counters of a location."""
+        index = self._indexes.get(location_id)
+        offline = self._offline_count.get(location_id, 0)
+        return {
+            "online": (len(index.devices) if index else 0) - offline,
+            "offline": offline,
+            "probing": sum(1 for key in self._probed if key[0] == location_id),
+            **self._counters.get(
+                location_id, {"went_offline": 0, "came_online": 0, "probes": 0}
+            ),
+        }
+
+    def offline_devices(self, location_id: int) -> List[int]:
+        """Return the avids of the offline devices of a location."""
+        return sorted(avid for key_location, avid in self._offline if key_location == location_id)
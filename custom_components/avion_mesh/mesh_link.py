@@ -0,0 +1,278 @@
+"""A supervised connection to an Avi-on mesh through one of its nodes."""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from homeassistant.components import bluetooth as ha_bluetooth
+from homeassistant.core import HomeAssistant
+
+from .metrics import MeshMetrics
+from .queues import BoundedStatusQueue, HandoffQueue, LinkStatusQueue, StatusDeduplicator
+from .supervisor import (
+    LINK_CHECK_INTERVAL,
+    LINK_TIMEOUT,
+    PREFERRED_NODE_TIMEOUT,
+    Backoff,
+    LinkMonitor,
+    best_node,
+    node_rssi,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MeshLink:
+    """One mesh handler connected through a node of a location, kept running.
+
+    The handler is restarted with backoff whenever it stops. The avionmesh
+    handler never stops on its own: it catches its errors and reconnects
+    forever, so one that leaves a command waiting for LINK_TIMEOUT is
+    considered stuck and restarted the same way. When (re)connecting, the
+    link first tries only its preferred node: the node that gave a working
+    link before, else the one heard with the strongest signal. A command
+    left waiting while the link is down is handed back through requeue so
+    that newer commands for its target can replace it.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        location_id: int,
+        link_id: int,
+        status_queue: BoundedStatusQueue,
+        metrics: MeshMetrics,
+        on_take: Callable[["MeshLink", object], None],
+        on_change: Callable[[], None],
+        requeue: Callable[[object], Awaitable[None]],
+        deduplicator: Optional[StatusDeduplicator] = None,
+    ) -> None:
+        """Initialize the link."""
+        self.hass = hass
+        self.location_id = location_id
+        self.link_id = link_id
+        self.metrics = metrics
+        self._on_take = on_take
+        self._on_change = on_change
+        self._requeue = requeue
+        # The mesh handler only ever holds one command ahead of the one it is
+        # sending; everything else waits in the session's coalescing queue
+        # where newer commands for the same target replace stale ones.
+        self.command_queue = HandoffQueue(1, self._on_command_taken, self._on_command_done)
+        self.status_queue = LinkStatusQueue(
+            link_id, status_queue, self._on_activity, deduplicator
+        )
+        self.monitor = LinkMonitor()
+        self.passphrase = ""
+        # Nodes this link may connect through, and the subset offered to the
+        # running mesh handler, which re-reads it on every reconnect
+        self.nodes: List[str] = []
+        self.target_devices: List[str] = []
+        # Node that gave a working link, tried first when (re)connecting
+        self.preferred_node: Optional[str] = None
+        self.rssi: Optional[int] = None
+        # Called with the node once a link through the preferred node came up
+        self.on_node_selected: Optional[Callable[[str], None]] = None
+        self.busy = False
+        self.sent = 0
+        self._preferred_until: Optional[float] = None
+        # Monotonic time the command waiting for the mesh handler was handed over
+        self._handoff_since: Optional[float] = None
+        self._restart_requested = False
+        # The mesh handler was cancelled for leaving a command waiting, and
+        # whether to reconnect through any node rather than the preferred one
+        self._stalled = False
+        self._retry_any_node = False
+        self._mesh_handler_task: Optional[asyncio.Task] = None
+        self._supervisor_task: Optional[asyncio.Task] = None
+
+    def set_nodes(self, passphrase: str, nodes: List[str]) -> None:
+        """Adopt the passphrase and the nodes this link connects through."""
+        self.passphrase = passphrase
+        self.nodes = nodes
+        self._use_all_nodes()
+
+    def start(self) -> None:
+        """Start the supervised mesh handler, unless it is running."""
+        if self._supervisor_task is not None and not self._supervisor_task.done():
+            return
+        self._supervisor_task = asyncio.create_task(self._supervise_mesh_handler())
+
+    async def async_restart(self) -> None:
+        """Restart the mesh handler, e.g. after the passphrase changed."""
+        self._restart_requested = True
+        await async_cancel(self._mesh_handler_task)
+
+    async def async_stop(self) -> None:
+        """Stop the mesh handler and its supervisor."""
+        await async_cancel(self._supervisor_task)
+        await async_cancel(self._mesh_handler_task)
+
+    def handoff(self, command: object) -> None:
+        """Hand a command to the mesh handler; the link must not be busy."""
+        self.busy = True
+        self._handoff_since = time.monotonic()
+        self.command_queue.put_nowait(command)
+
+    def _start_mesh_handler(self) -> None:
+        """Start the mesh handler for the current passphrase and nodes."""
+        # Imported in the executor during setup, before the first link starts
+        from avionmesh import mesh_handler
+
+        scanner = ha_bluetooth.async_get_scanner(self.hass)
+
+        if self.busy and self.command_queue.empty():
+            # Taken by a handler that was cancelled before it finished sending
+            self.command_queue.task_done()
+
+        self.metrics.mesh_handler_starts += 1
+        self.monitor.connecting()
+        self._mesh_handler_task = asyncio.create_task(
+            mesh_handler(
+                self.passphrase,
+                self.target_devices,
+                self.command_queue,
+                self.status_queue,
+                scanner,
+            )
+        )
+
+    async def _supervise_mesh_handler(self) -> None:
+        """Run the mesh handler, restarting it with backoff whenever it stops."""
+        backoff = Backoff()
+        try:
+            while True:
+                if self._retry_any_node:
+                    self._retry_any_node = False
+                    self._use_all_nodes()
+                else:
+                    self._prefer_node()
+                self._start_mesh_handler()
+                task = self._mesh_handler_task
+                while not task.done():
+                    await asyncio.wait({task}, timeout=LINK_CHECK_INTERVAL)
+                    await self._async_check_link()
+                    if self.monitor.up:
+                        backoff.reset()
+
+                if self._restart_requested:
+                    self._restart_requested = False
+                    continue
+
+                if self._stalled:
+                    self._stalled = False
+                    reason = f"no command taken for {LINK_TIMEOUT:.0f}s"
+                else:
+                    reason = repr(None if task.cancelled() else task.exception())
+                self._link_down()
+                delay = backoff.next_delay()
+                _LOGGER.warning(
+                    f"Mesh handler {self.link_id} for location {self.location_id} stopped "
+                    f"({reason}), restarting in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            await async_cancel(self._mesh_handler_task)
+            raise
+
+    async def _async_check_link(self) -> None:
+        """Detect a lost link or stuck handler and stop waiting for an unresponsive node."""
+        now = time.monotonic()
+        if self._preferred_until is not None and now >= self._preferred_until:
+            _LOGGER.info(
+                f"No link through {self.target_devices[0]} for location {self.location_id}, "
+                "trying other nodes"
+            )
+            self._use_all_nodes()
+
+        if self._handoff_since is None or now - self._handoff_since < LINK_TIMEOUT:
+            return
+        went_down = self._link_down(self._handoff_since)
+        if went_down:
+            _LOGGER.warning(
+                f"Mesh link {self.link_id} for location {self.location_id} lost, holding "
+                "its commands until a link is back"
+            )
+        # Hand the waiting command back, so that newer commands for its target
+        # replace it instead of it being sent once the link is back
+        if (command := self.command_queue.reclaim()) is not None:
+            await self._requeue(command)
+        self._handoff_since = None
+        # Restart the stuck handler through the supervisor's backoff: through
+        # the preferred node after losing a working link, else any node
+        self._stalled = True
+        self._retry_any_node = not went_down
+        await async_cancel(self._mesh_handler_task)
+
+    def _link_down(self, since: Optional[float] = None) -> bool:
+        """Record that the link went down, returning True if it was up."""
+        went_down = self.monitor.down(since)
+        self._on_change()
+        return went_down
+
+    def _prefer_node(self) -> None:
+        """Connect through the best known node only, for a while."""
+        remembered = self.preferred_node if self.preferred_node in self.nodes else None
+        node = best_node(self.hass, self.nodes, remembered)
+        if node is None or len(self.nodes) < 2:
+            self._use_all_nodes()
+            return
+        _LOGGER.debug(f"Connecting to location {self.location_id} through {node} first")
+        self.rssi = node_rssi(self.hass, node)
+        self.target_devices[:] = [node]
+        self._preferred_until = time.monotonic() + PREFERRED_NODE_TIMEOUT
+
+    def _use_all_nodes(self) -> None:
+        """Let the mesh handler connect through any node of this link."""
+        self.target_devices[:] = self.nodes
+        self._preferred_until = None
+
+    def _on_activity(self) -> None:
+        """Record traffic from the mesh, which means the link is up."""
+        if not self.monitor.activity():
+            return
+        _LOGGER.info(
+            f"Mesh link {self.link_id} for location {self.location_id} up after "
+            f"{self.monitor.last_reconnect_s:.1f}s"
+        )
+        if self._preferred_until is not None:
+            self.preferred_node = self.target_devices[0]
+            if self.on_node_selected is not None:
+                self.on_node_selected(self.preferred_node)
+        # Fall back on any node the next time the link drops
+        self._use_all_nodes()
+        self._on_change()
+
+    def _on_command_taken(self, command: object) -> None:
+        """Record a command the mesh handler took."""
+        self._handoff_since = None
+        self.sent += 1
+        self._on_activity()
+        self._on_take(self, command)
+
+    def _on_command_done(self) -> None:
+        """Record that the mesh handler is ready for another command."""
+        self.busy = False
+        # Acknowledged by now, if the library sent it
+        self.status_queue.expect_ack(None)
+        self._on_change()
+
+    def as_dict(self) -> dict:
+        """Return the link state as a serializable dict."""
+        return {
+            **self.monitor.as_dict(),
+            "nodes": len(self.nodes),
+            "preferred_node": self.preferred_node,
+            "rssi": self.rssi,
+            "sent": self.sent,
+        }
+
+
+async def async_cancel(task: Optional[asyncio.Task]) -> None:
+    """Cancel a task and wait for it to finish."""
+    if task and not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,714 @@
+"""Per-location mesh session for the Avi-on Mesh integration."""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, List, Mapping, Optional, Tuple, Union
+
+from homeassistant.components import bluetooth as ha_bluetooth
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+
+from .commands import OP_READ_ALL, READ_ALL, LightCommand
+from .device_index import DeviceIndex, MeshOptions
+from .group_state import GroupStateAggregator
+from .hydration import HydrationSweep, visible_devices
+from .inflight import InFlightCommands
+from .liveness import LivenessTracker
+from .mesh_link import MeshLink, async_cancel
+from .metrics import MeshMetrics
+from .planner import PLANNER_WINDOW, GroupCommandPlanner
+from .queues import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    BoundedStatusQueue,
+    CoalescingCommandQueue,
+    QueueLimits,
+    SelfAck,
+    StatusDeduplicator,
+    TokenBucket,
+)
+from .recorder import TrafficRecorder
+from .supervisor import LINK_RESCAN_INTERVAL, partition_nodes, summarize_links
+
+_LOGGER = logging.getLogger(__name__)
+
+# Statuses arriving within this many seconds of each other are merged per
+# avid and delivered together
+STATUS_BATCH_WINDOW = 0.05
+
+
+@dataclass(slots=True)
+class MeshCommand:
+    """Command to be sent to mesh."""
+
+    command: LightCommand
+    # Monotonic time the command was requested
+    enqueued_at: float = 0.0
+    priority: int = PRIORITY_BULK
+
+    @property
+    def data(self) -> dict:
+        """Return the command as the mesh handler sends it."""
+        return self.command.payload
+
+
+@dataclass
+class MeshStatus:
+    """Status update from mesh."""
+
+    data: dict
+
+
+class MeshStatusRouter:
+    """Route mesh statuses to the listeners of the avids they affect."""
+
+    def __init__(self, inflight: InFlightCommands) -> None:
+        """Initialize the router."""
+        self.inflight = inflight
+        self.groups = GroupStateAggregator()
+        self._listeners: Dict[int, List[Callable[[dict], bool]]] = {}
+        self._fanout: Mapping[int, Tuple[int, ...]] = {}
+        self.state_writes = 0
+        self.state_writes_suppressed = 0
+        self.aggregate_statuses = 0
+
+    def set_index(self, index: DeviceIndex) -> None:
+        """Adopt the fan-out table and group membership of a location's device index.
+
+        A status for a group avid also applies to each member device, and a
+        status for the 'all' avid applies to every group and device.
+        """
+        self._fanout = index.fanout
+        self.groups.set_index(index)
+
+    @callback
+    def async_add_listener(
+        self, avid: int, update_callback: Callable[[dict], bool]
+    ) -> CALLBACK_TYPE:
+        """Listen for statuses affecting avid, returning a removal callback.
+
+        The callback returns whether the status changed (and wrote) its state.
+        """
+        listeners = self._listeners.setdefault(avid, [])
+        listeners.append(update_callback)
+
+        @callback
+        def remove_listener() -> None:
+            listeners.remove(update_callback)
+            if not listeners and self._listeners.get(avid) is listeners:
+                del self._listeners[avid]
+
+        return remove_listener
+
+    @callback
+    def async_track(self, commands: List[LightCommand]) -> None:
+        """Expect the echoes of commands whose senders update their state optimistically."""
+        for command in commands:
+            expected = self.inflight.track(command)
+            if "brightness" in expected:
+                self.groups.update(command.avid, expected["brightness"])
+        self.async_route_groups()
+
+    @callback
+    def async_route(self, status: dict, self_ack: bool = False) -> bool:
+        """Deliver a status to the listeners of every avid it affects.
+
+        Echoes of in-flight commands, the library's self-acks of them and
+        statuses they supersede are withheld from the targets that sent them;
+        only echoes confirm the commands. Member brightness feeds the group
+        aggregates, delivered by async_route_groups. Returns whether the
+        status told anything beyond the echoes of tracked commands for its
+        own avid; a self-ack never does, the library sends it whether or not
+        the device heard the command.
+        """
+        avid = status.get("avid")
+        unsolicited = False
+        for target in self._fanout.get(avid, (avid,)):
+            # Absorbed echoes were counted when the command was tracked
+            delivered = self._deliver(target, status, self_ack)
+            if delivered is None:
+                continue
+            if target == avid and not self_ack:
+                unsolicited = True
+            if "brightness" in delivered:
+                self.groups.update(target, delivered["brightness"])
+        return unsolicited
+
+    @callback
+    def async_route_groups(self) -> List[dict]:
+        """Deliver derived statuses to the groups whose members changed.
+
+        These go to the group's own listeners only; fanning them out would
+        overwrite the members they were derived from. Returns the statuses.
+        """
+        statuses = [self.groups.status(group) for group in self.groups.take_dirty()]
+        for status in statuses:
+            self.aggregate_statuses += 1
+            self._deliver(status["avid"], status)
+        return statuses
+
+    @callback
+    def async_apply(self, statuses: List[dict]) -> None:
+        """Deliver statuses a sender applied optimistically to their targets only.
+
+        These bypass reconciliation: they are the values the tracked commands
+        expect, which the mesh echo then confirms without another write.
+        """
+        for status in statuses:
+            for update_callback in self._listeners.get(status["avid"], ()):
+                if update_callback(status):
+                    self.state_writes += 1
+                else:
+                    self.state_writes_suppressed += 1
+
+    def _deliver(self, target: int, status: dict, self_ack: bool = False) -> Optional[dict]:
+        """Reconcile a status for target and call its listeners with the result."""
+        if (delivered := self.inflight.reconcile(target, status, self_ack)) is None:
+            return None
+        for update_callback in self._listeners.get(target, ()):
+            if update_callback(delivered):
+                self.state_writes += 1
+            else:
+                self.state_writes_suppressed += 1
+        return delivered
+
+
+class MeshSession:
+    """Mesh connection, queues and status routing for one Avi-on location."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        location_id: int,
+        location: dict,
+        options: MeshOptions,
+        limits: QueueLimits,
+        links: int = 1,
+    ):
+        """Initialize the session."""
+        self.hass = hass
+        self.location_id = location_id
+        self.options = options
+        self.status_queue: BoundedStatusQueue = BoundedStatusQueue(
+            limits.status_queue_size, limits.overflow_policy, limits.block_timeout
+        )
+        self.pending_commands = CoalescingCommandQueue(
+            limits.command_queue_size, limits.overflow_policy, limits.block_timeout
+        )
+        self.pending_commands.on_drop = self._on_command_dropped
+        self.rate_limiter = TokenBucket(limits.rate_limit)
+        self.router = MeshStatusRouter(InFlightCommands(self._on_command_unconfirmed))
+        self.metrics = MeshMetrics()
+        self.planner = GroupCommandPlanner()
+        self._planned_commands: List[Tuple[LightCommand, int]] = []
+        self._plan_flush_task: Optional[asyncio.Task] = None
+        self.location: dict = {}
+        self.index: DeviceIndex = DeviceIndex.build(location_id, {}, options)
+        self.passphrase: str = ""
+        self.target_devices: List[str] = []
+        # One connection per Bluetooth adapter or proxy, up to the configured
+        # number; several links hear the same statuses, so drop repeats
+        self.configured_links = links
+        self.deduplicator = StatusDeduplicator() if links > 1 else None
+        self.links: List[MeshLink] = [
+            self._create_link(link_id) for link_id in range(self._available_links())
+        ]
+        if len(self.links) < links:
+            _LOGGER.info(
+                f"Location {location_id} uses {len(self.links)} of {links} mesh links, one "
+                "per Bluetooth adapter; more are added as adapters or proxies register"
+            )
+        self._cancel_link_rescan: Optional[CALLBACK_TYPE] = None
+        # Preferred nodes of a previous run, kept for links not added yet
+        self._saved_preferred_nodes: List[Optional[str]] = []
+        self._links_changed = asyncio.Event()
+        self._status_listener_task: Optional[asyncio.Task] = None
+        self._command_pump_task: Optional[asyncio.Task] = None
+        self._resync_task: Optional[asyncio.Task] = None
+        self._hydration_task: Optional[asyncio.Task] = None
+        self.hydration: Optional[HydrationSweep] = None
+        self._read_taken = asyncio.Event()
+        self.resyncs = 0
+        self.statuses_received = 0
+        self.statuses_merged = 0
+        # avid -> last state the mesh reported for it, as a merged status
+        self.states: Dict[int, dict] = {}
+        # Called after a batch of statuses changed the reported states
+        self.on_states_changed: Optional[Callable[[], None]] = None
+        # Capture of the traffic, while recording is enabled
+        self.recorder: Optional[TrafficRecorder] = None
+        # Availability of the devices, once the service attached its tracker
+        self.liveness: Optional[LivenessTracker] = None
+        self.deprioritized = 0
+        self.set_location(location)
+
+    def _create_link(self, link_id: int) -> MeshLink:
+        """Create a mesh link of this session."""
+        return MeshLink(
+            self.hass,
+            self.location_id,
+            link_id,
+            self.status_queue,
+            self.metrics,
+            self._on_command_taken,
+            self._on_links_changed,
+            self._async_requeue,
+            self.deduplicator,
+        )
+
+    def _available_links(self) -> int:
+        """Return how many links the configured number and the adapters allow."""
+        return max(
+            1,
+            min(
+                self.configured_links,
+                ha_bluetooth.async_scanner_count(self.hass, connectable=True),
+            ),
+        )
+
+    @callback
+    def _async_add_links(self, _now: object = None) -> None:
+        """Add links for Bluetooth adapters or proxies registered since the start."""
+        if (count := self._available_links()) > len(self.links):
+            _LOGGER.info(
+                f"Location {self.location_id} now uses {count} of "
+                f"{self.configured_links} mesh links"
+            )
+            saved = self._saved_preferred_nodes
+            for link_id in range(len(self.links), count):
+                link = self._create_link(link_id)
+                link.on_node_selected = self.links[0].on_node_selected
+                link.preferred_node = saved[link_id] if link_id < len(saved) else None
+                self.links.append(link)
+            self._assign_nodes()
+        if len(self.links) >= self.configured_links and self._cancel_link_rescan is not None:
+            self._cancel_link_rescan()
+            self._cancel_link_rescan = None
+
+    def set_location(self, location: dict) -> None:
+        """Adopt new location data for this session."""
+        self.location = location
+        self.passphrase = location["passphrase"]
+        # Updated in place: the running mesh handlers re-read their lists on
+        # every reconnect.
+        self.target_devices[:] = [d["mac_address"].upper() for d in location["devices"]]
+        self._assign_nodes()
+        self._build_index()
+
+    def _assign_nodes(self) -> None:
+        """Split the location's nodes between the links, starting links that got some."""
+        partitions = partition_nodes(
+            self.hass, self.target_devices, min(len(self.links), len(self.target_devices)) or 1
+        )
+        for link in self.links:
+            nodes = partitions[link.link_id] if link.link_id < len(partitions) else []
+            link.set_nodes(self.passphrase, nodes)
+            # A location that gained nodes may have room for another link
+            if nodes and self._command_pump_task is not None:
+                link.start()
+
+    def set_options(self, options: MeshOptions) -> None:
+        """Adopt new device, group and capability options.
+
+        Only the device index is rebuilt; the mesh links and queues keep running.
+        """
+        self.options = options
+        self._build_index()
+
+    def _build_index(self) -> None:
+        """Index the location's devices and groups under the current options."""
+        self.index = DeviceIndex.build(self.location_id, self.location, self.options)
+        self.router.set_index(self.index)
+        self.planner.set_index(self.index)
+        if self.liveness is not None:
+            self.liveness.set_index(self.index)
+        self.states = {
+            avid: state for avid, state in self.states.items() if self._is_known(avid)
+        }
+
+    def _is_known(self, avid: int) -> bool:
+        """Return True if avid is a device, group or 'all' of this location."""
+        return avid in self.index.devices or avid in self.index.fanout
+
+    def restore_states(self, states: Dict[int, dict]) -> None:
+        """Adopt states reported before a restart, until the mesh reports again."""
+        self.states = {}
+        for avid, state in states.items():
+            if self._is_known(avid):
+                self.states[avid] = state
+                if "brightness" in state:
+                    self.router.groups.update(avid, state["brightness"])
+        # Group states were restored along with their members
+        self.router.groups.take_dirty()
+
+    def start(self) -> None:
+        """Start the mesh links, status listener and command pump."""
+        for link in self.links:
+            if link.nodes:
+                link.start()
+        self._status_listener_task = asyncio.create_task(self._listen_for_status_updates())
+        self._command_pump_task = asyncio.create_task(self._pump_commands())
+        self.hydration = HydrationSweep(self.index.devices, visible_devices(self.index))
+        self._hydration_task = asyncio.create_task(self.hydration.async_run(self._async_read_all))
+        if len(self.links) < self.configured_links:
+            self._cancel_link_rescan = async_track_time_interval(
+                self.hass, self._async_add_links, timedelta(seconds=LINK_RESCAN_INTERVAL)
+            )
+
+    async def async_restart_mesh_handler(self) -> None:
+        """Restart the mesh handlers, e.g. after the passphrase changed."""
+        for link in self.links:
+            await link.async_restart()
+
+    @property
+    def preferred_nodes(self) -> List[Optional[str]]:
+        """Return the preferred node of every link, and of links not added yet."""
+        nodes = [link.preferred_node for link in self.links]
+        return nodes + self._saved_preferred_nodes[len(nodes):]
+
+    def set_preferred_nodes(self, nodes: List[Optional[str]]) -> None:
+        """Adopt the preferred nodes of a previous run."""
+        self._saved_preferred_nodes = list(nodes)
+        for link, node in zip(self.links, nodes):
+            link.preferred_node = node
+
+    def link_stats(self) -> dict:
+        """Return the combined link state."""
+        return summarize_links([link.monitor for link in self.links])
+
+    async def _listen_for_status_updates(self) -> None:
+        """Listen for status updates from mesh and route them in batches."""
+        try:
+            while True:
+                status: Union[MeshStatus, SelfAck] = await self.status_queue.get()
+                # Let bursts (re-broadcasts, rapid dimming) accumulate so that
+                # each avid is only delivered once per batch
+                await asyncio.sleep(STATUS_BATCH_WINDOW)
+
+                batch: Dict[int, dict] = {}
+                # The library's acknowledgements of the commands it sent
+                acks: Dict[int, dict] = {}
+                count = 0
+                while True:
+                    if isinstance(status, SelfAck):
+                        _LOGGER.debug(f"Mesh {self.location_id} sent: {status.data}")
+                        _merge_status(acks, status.data)
+                    else:
+                        _LOGGER.debug(f"Status update from mesh {self.location_id}: {status.data}")
+                        if self.recorder is not None:
+                            self.recorder.record_status(self.location_id, status.data)
+                        _merge_status(batch, status.data)
+                    count += 1
+                    if self.status_queue.empty():
+                        break
+                    status = self.status_queue.get_nowait()
+
+                self.statuses_received += count
+                self.statuses_merged += count - len(batch) - len(acks)
+                self.metrics.record_statuses(count, batch)
+                if self.hydration is not None and self.hydration.pending:
+                    self.hydration.record(
+                        target for avid in batch for target in self.index.fanout.get(avid, (avid,))
+                    )
+
+                # Deliver only to the entities each status affects; only what
+                # was not an echo of our own commands shows a device is alive
+                for merged in acks.values():
+                    self.router.async_route(merged, self_ack=True)
+                reported = [
+                    merged["avid"] for merged in batch.values() if self.router.async_route(merged)
+                ]
+                if self.liveness is not None:
+                    self.liveness.async_seen(self.location_id, reported)
+                derived = self.router.async_route_groups()
+
+                changed = False
+                for merged in (*acks.values(), *batch.values()):
+                    avid = merged["avid"]
+                    for target in self.index.fanout.get(avid, (avid,)):
+                        changed |= _merge_status(self.states, {**merged, "avid": target})
+                for status in derived:
+                    changed |= _merge_status(self.states, status)
+                if changed and self.on_states_changed is not None:
+                    self.on_states_changed()
+
+                for _ in range(count):
+                    self.status_queue.task_done()
+        except asyncio.CancelledError:
+            _LOGGER.info(f"Status listener for location {self.location_id} cancelled")
+            raise
+
+    async def _pump_commands(self) -> None:
+        """Feed scheduled commands to the mesh links as they free up.
+
+        The next command is only picked once a link finished its previous one,
+        so a command arriving meanwhile can still be scheduled ahead of
+        everything pending. The rate limit is taken for the command picked,
+        and the link picked last: either wait may outlast the link first seen.
+        """
+        try:
+            while True:
+                await self._async_wait_for_link()
+                enqueued_at, command, priority = await self.pending_commands.get()
+                await self.rate_limiter.acquire()
+                link = await self._async_wait_for_link()
+                if self.recorder is not None:
+                    self.recorder.record_handoff(
+                        self.location_id, link.link_id, command, enqueued_at
+                    )
+                link.handoff(MeshCommand(command, enqueued_at, priority))
+        except asyncio.CancelledError:
+            _LOGGER.info(f"Command pump for location {self.location_id} cancelled")
+            raise
+
+    async def _async_wait_for_link(self) -> MeshLink:
+        """Wait until a link is free to send through and return it."""
+        while (link := self._pick_link()) is None:
+            self._links_changed.clear()
+            await self._links_changed.wait()
+        return link
+
+    def _pick_link(self) -> Optional[MeshLink]:
+        """Return the link to send the next command through, if one is free.
+
+        Free links that are up come first, the strongest signal and then the
+        least used first. While another link is up but busy, wait for it
+        rather than try a link not known to work; with no link up, probe one.
+        """
+        idle = [link for link in self.links if link.nodes and not link.busy]
+        up = [link for link in idle if link.monitor.up]
+        if up:
+            return max(up, key=lambda link: (link.rssi or -1000, -link.sent))
+        if not idle or any(link.monitor.up for link in self.links):
+            return None
+        untried = [link for link in idle if not link.monitor.failed]
+        return (untried or idle)[0]
+
+    def _on_links_changed(self) -> None:
+        """Wake the command pump after a link freed up, came up or went down."""
+        self._links_changed.set()
+
+    async def _async_requeue(self, command: MeshCommand) -> None:
+        """Return a command a lost link did not send."""
+        await self.pending_commands.requeue(command.command, command.enqueued_at, command.priority)
+
+    async def async_send_command(
+        self, command: LightCommand, priority: int = PRIORITY_BULK
+    ) -> None:
+        """Queue a command for this location's mesh.
+
+        Commands arriving within the planner window are planned together, so a
+        scene or multi-entity service call turns into as few group commands as
+        possible. Raises asyncio.QueueFull if the queue stays full under the
+        block policy.
+        """
+        await self.async_send_commands([command], priority)
+
+    async def async_send_commands(
+        self, commands: List[LightCommand], priority: int = PRIORITY_BULK
+    ) -> None:
+        """Queue several commands for this location's mesh in one planner window."""
+        _LOGGER.debug(f"Sending {len(commands)} mesh commands to location {self.location_id}")
+        if self.recorder is not None:
+            self.recorder.record_commands(self.location_id, commands, priority)
+        # The senders write their state optimistically; expect the mesh to echo it
+        self.router.async_track(commands)
+        self._planned_commands.extend(
+            (command, self._priority_for(command, priority)) for command in commands
+        )
+        if self._plan_flush_task is None:
+            self._plan_flush_task = asyncio.create_task(
+                self._async_flush_planned_commands(time.monotonic())
+            )
+        # Shielded so that one cancelled caller does not drop the whole batch
+        await asyncio.shield(self._plan_flush_task)
+
+    async def async_send_planned(
+        self, commands: List[LightCommand], priority: int = PRIORITY_BULK
+    ) -> None:
+        """Queue commands that were already planned, e.g. compiled for a scene."""
+        _LOGGER.debug(
+            f"Sending {len(commands)} planned mesh commands to location {self.location_id}"
+        )
+        if self.recorder is not None:
+            self.recorder.record_commands(self.location_id, commands, priority, planned=True)
+        self.router.async_track(commands)
+        enqueued_at = time.monotonic()
+        for command in commands:
+            await self.pending_commands.put(
+                command, enqueued_at, self._priority_for(command, priority)
+            )
+
+    def _priority_for(self, command: LightCommand, priority: int) -> int:
+        """Return the priority to send a command at.
+
+        Interactive commands for targets that went offline wait behind those
+        for lights that can show them: they are sent, but at bulk priority.
+        """
+        if (
+            priority != PRIORITY_INTERACTIVE
+            or self.liveness is None
+            or self.liveness.is_available(self.location_id, command.avid)
+        ):
+            return priority
+        self.deprioritized += 1
+        return PRIORITY_BULK
+
+    async def async_send_ramp_step(
+        self,
+        steps: List[LightCommand],
+        finals: List[LightCommand],
+        priority: int = PRIORITY_BULK,
+    ) -> None:
+        """Queue a step of light transitions, planned together.
+
+        Intermediate values are not tracked, so their echoes show the
+        transition as it happens; the library's self-acks of them show it
+        too, without counting as signs of life. Final values are tracked and
+        applied like any command, so late echoes of earlier steps cannot
+        undo them.
+        """
+        commands = steps + finals
+        if self.recorder is not None:
+            self.recorder.record_commands(self.location_id, commands, priority, planned=True)
+        self.router.async_track(finals)
+        enqueued_at = time.monotonic()
+        for command in self.planner.plan(commands):
+            await self.pending_commands.put(command, enqueued_at, priority)
+        self.router.async_apply([{"avid": command.avid, **command.expected} for command in finals])
+
+    async def _async_flush_planned_commands(self, enqueued_at: float) -> None:
+        """Plan the commands collected during the window and queue the result."""
+        await asyncio.sleep(PLANNER_WINDOW)
+        commands, self._planned_commands = self._planned_commands, []
+        self._plan_flush_task = None
+
+        # The latest command per target decides its priority; each class is
+        # planned on its own so bulk commands never delay interactive ones
+        latest: Dict[tuple, Tuple[LightCommand, int]] = {}
+        for command, priority in commands:
+            latest.pop(command.key, None)
+            latest[command.key] = (command, priority)
+        by_priority: Dict[int, List[LightCommand]] = {}
+        for command, priority in latest.values():
+            by_priority.setdefault(priority, []).append(command)
+
+        for priority in sorted(by_priority):
+            planned = self.planner.plan(by_priority[priority])
+            if len(planned) < len(by_priority[priority]):
+                _LOGGER.debug(
+                    f"Planned {len(by_priority[priority])} commands as {len(planned)} for "
+                    f"location {self.location_id}"
+                )
+            for command in planned:
+                await self.pending_commands.put(command, enqueued_at, priority)
+
+    async def _async_read_all(self) -> None:
+        """Read the state of every device, returning once the mesh sent the read."""
+        self._read_taken.clear()
+        await self.pending_commands.put(READ_ALL)
+        await self._read_taken.wait()
+
+    def _on_command_taken(self, link: MeshLink, command: MeshCommand) -> None:
+        """Record the latency of a command a mesh handler took and wait for its confirmation."""
+        self.metrics.record_dispatch(command.enqueued_at)
+        light_command = command.command
+        if light_command.op == OP_READ_ALL:
+            self._read_taken.set()
+            return
+        link.status_queue.expect_ack(light_command.ack)
+        expected = light_command.expected
+        for target in self.index.fanout.get(light_command.avid, (light_command.avid,)):
+            self.router.inflight.sent(target, expected)
+
+    def _on_command_dropped(self, command: LightCommand) -> None:
+        """Give up on the targets of a command the full queue dropped unsent."""
+        if command.op == OP_READ_ALL:
+            return
+        for target in self.index.fanout.get(command.avid, (command.avid,)):
+            self.router.inflight.drop(target)
+
+    def _on_command_unconfirmed(self, avid: int) -> None:
+        """Re-read the mesh state after a command went unconfirmed or was dropped.
+
+        Targets known to be offline are not expected to answer; their reads
+        are left to the liveness probes.
+        """
+        if self.liveness is not None and not self.liveness.is_available(self.location_id, avid):
+            return
+        self.request_resync()
+
+    def request_resync(self) -> None:
+        """Queue a read of every device's state, unless one is queued already."""
+        if self._resync_task is not None and not self._resync_task.done():
+            return
+        self.resyncs += 1
+        self._resync_task = asyncio.create_task(self._async_resync())
+
+    async def _async_resync(self) -> None:
+        """Queue a read of every device's state."""
+        try:
+            await self.pending_commands.put(READ_ALL)
+        except asyncio.QueueFull:
+            _LOGGER.warning(f"Command queue full, skipping re-sync of location {self.location_id}")
+
+    def command_stats(self) -> Dict[str, int]:
+        """Return counters for queued, collapsed, dropped and planned commands."""
+        return {
+            **self.pending_commands.stats(),
+            **self.planner.stats(),
+            "rate_limited": self.rate_limiter.throttled,
+            "offline_deprioritized": self.deprioritized,
+        }
+
+    def status_stats(self) -> Dict[str, int]:
+        """Return counters for received statuses and entity state writes."""
+        return {
+            **self.status_queue.stats(),
+            "received": self.statuses_received,
+            "merged": self.statuses_merged,
+            "state_writes": self.router.state_writes,
+            "state_writes_suppressed": self.router.state_writes_suppressed,
+            "aggregate_statuses": self.router.aggregate_statuses,
+            **self.router.inflight.stats(),
+            "resyncs": self.resyncs,
+            "duplicates": self.deduplicator.duplicates if self.deduplicator else 0,
+        }
+
+    async def async_stop(self) -> None:
+        """Stop all tasks of this session."""
+        self.router.inflight.clear()
+        if self._cancel_link_rescan is not None:
+            self._cancel_link_rescan()
+            self._cancel_link_rescan = None
+        for link in self.links:
+            await link.async_stop()
+        for task in (
+            self._hydration_task,
+            self._plan_flush_task,
+            self._resync_task,
+            self._status_listener_task,
+            self._command_pump_task,
+        ):
+            await async_cancel(task)
+
+
+def _merge_status(batch: Dict[int, dict], data: dict) -> bool:
+    """Merge a status into the batch, keeping values in reporting order.
+
+    The avid and each value are moved to the end when reported again, so that
+    routing order and the order of values within a status follow the mesh.
+    Returns whether any value was new or changed.
+    """
+    avid = data.get("avid")
+    merged = batch.pop(avid, None) or {"avid": avid}
+    changed = False
+    for key, value in data.items():
+        if key != "avid":
+            if merged.pop(key, None) != value:
+                changed = True
+            merged[key] = value
+    batch[avid] = merged
+    return changed
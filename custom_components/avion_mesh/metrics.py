@@ -0,0 +1,124 @@
+"""Runtime metrics for the Avi-on mesh sessions."""
+import bisect
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds (milliseconds) of the command latency histogram buckets
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Window (seconds) over which rates are computed
+RATE_WINDOW = 60
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram."""
+
+    def __init__(self, buckets_ms: Tuple[int, ...] = LATENCY_BUCKETS_MS) -> None:
+        """Initialize the histogram."""
+        self.buckets_ms = buckets_ms
+        # One extra bucket for everything above the last bound
+        self.counts: List[int] = [0] * (len(buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Record a latency sample."""
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Return the bucket bound (ms) below which fraction of samples fall."""
+        if not self.count:
+            return None
+        threshold = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets_ms, self.counts):
+            seen += count
+            if seen >= threshold:
+                return float(bound)
+        return self.max_ms
+
+    def as_dict(self) -> dict:
+        """Return the histogram as a serializable dict."""
+        buckets = {f"le_{bound}": count for bound, count in zip(self.buckets_ms, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else None,
+            "max_ms": self.max_ms,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "buckets": buckets,
+        }
+
+
+class RateMeter:
+    """Events per minute over a sliding window of one-second slots."""
+
+    def __init__(self, window: int = RATE_WINDOW) -> None:
+        """Initialize the meter."""
+        self.window = window
+        self.total = 0
+        self._slots: Deque[List[int]] = deque()
+
+    def mark(self, count: int = 1, now: Optional[float] = None) -> None:
+        """Record count events."""
+        second = int(time.monotonic() if now is None else now)
+        if self._slots and self._slots[-1][0] == second:
+            self._slots[-1][1] += count
+        else:
+            self._slots.append([second, count])
+        self.total += count
+        self._expire(second)
+
+    def _expire(self, second: int) -> None:
+        while self._slots and self._slots[0][0] <= second - self.window:
+            self._slots.popleft()
+
+    def per_minute(self, now: Optional[float] = None) -> float:
+        """Return the event rate per minute over the window."""
+        self._expire(int(time.monotonic() if now is None else now))
+        return sum(count for _, count in self._slots) * 60 / self.window
+
+
+class MeshMetrics:
+    """Latency, throughput and liveness metrics of one mesh session."""
+
+    def __init__(self) -> None:
+        """Initialize the metrics."""
+        self.command_latency = LatencyHistogram()
+        self.status_rate = RateMeter()
+        self.mesh_handler_starts = 0
+        # avid -> wall clock time of the last status reporting it
+        self.last_seen: Dict[int, float] = {}
+
+    def record_dispatch(self, enqueued_at: float) -> None:
+        """Record a command handed to the mesh, enqueued at monotonic time."""
+        self.command_latency.record(time.monotonic() - enqueued_at)
+
+    def record_statuses(self, count: int, avids: Iterable[int]) -> None:
+        """Record count statuses received, reporting the given avids."""
+        self.status_rate.mark(count)
+        now = time.time()
+        for avid in avids:
+            self.last_seen[avid] = now
+
+    @property
+    def mesh_handler_restarts(self) -> int:
+        """Return how often the mesh handler was restarted."""
+        return max(self.mesh_handler_starts - 1, 0)
+
+    def as_dict(self) -> dict:
+        """Return the metrics as a serializable dict."""
+        return {
+            "command_latency": self.command_latency.as_dict(),
+            "statuses_per_minute": self.status_rate.per_minute(),
+            "statuses_total": self.status_rate.total,
+            "mesh_handler_restarts": self.mesh_handler_restarts,
+            "last_seen": dict(self.last_seen),
+        }
@@ -0,0 +1,84 @@
+"""Group-aware command planning for the Avi-on mesh."""
+from typing import Dict, FrozenSet, List, Tuple
+
+from .commands import OP_READ_ALL, LightCommand
+from .const import AVID_ALL
+from .device_index import DeviceIndex
+
+# Commands arriving within this many seconds of each other are planned together
+PLANNER_WINDOW = 0.02
+
+
+class GroupCommandPlanner:
+    """Collapse device commands that cover whole mesh groups into group commands.
+
+    Device commands with identical payloads are grouped; whenever the targeted
+    devices include every member of a group, the members are addressed through
+    the group avid instead. The mesh reports the resulting group status, which
+    the status router fans back out to the member entities.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the planner."""
+        self._groups: Tuple[Tuple[int, FrozenSet[int]], ...] = ()
+        self._devices: FrozenSet[int] = frozenset()
+        self.commands_planned = 0
+        self.packets_planned = 0
+
+    def set_index(self, index: DeviceIndex) -> None:
+        """Adopt the group membership of a location's device index."""
+        self._groups = index.coverable_groups
+        self._devices = frozenset(index.devices)
+
+    def plan(self, commands: List[LightCommand]) -> List[LightCommand]:
+        """Return the smallest list of commands with the same effect as commands."""
+        planned = self.collapse(commands)
+        self.commands_planned += len(commands)
+        self.packets_planned += len(planned)
+        return planned
+
+    def collapse(self, commands: List[LightCommand]) -> List[LightCommand]:
+        """Plan commands without counting them, e.g. to compile them ahead of time."""
+        # Only the latest command per avid and packet type matters
+        latest: Dict[tuple, LightCommand] = {}
+        for command in commands:
+            latest.pop(command.key, None)
+            latest[command.key] = command
+
+        planned: List[LightCommand] = []
+        # Device writes in order of first appearance: (kind, value) -> target avids
+        runs: Dict[Tuple[str, int], List[int]] = {}
+        for command in latest.values():
+            if command.op != OP_READ_ALL and command.avid in self._devices:
+                runs.setdefault((command.op, command.value), []).append(command.avid)
+            else:
+                planned.append(command)
+
+        for (op, value), avids in runs.items():
+            planned.extend(LightCommand(avid, op, value) for avid in self.cover(avids))
+        return planned
+
+    def cover(self, avids: List[int]) -> List[int]:
+        """Return the fewest group/device avids addressing exactly the given devices."""
+        remaining = set(avids)
+        if len(remaining) > 1 and remaining >= self._devices:
+            return [AVID_ALL]
+
+        targets: List[int] = []
+        for group_avid, members in self._groups:
+            if len(remaining) < 2:
+                break
+            if members <= remaining:
+                targets.append(group_avid)
+                remaining -= members
+
+        # Keep the original order for devices not covered by a group
+        targets.extend(avid for avid in avids if avid in remaining)
+        return targets
+
+    def stats(self) -> Dict[str, int]:
+        """Return the planner counters."""
+        return {
+            "commands_planned": self.commands_planned,
+            "packets_planned": self.packets_planned,
+        }
@@ -0,0 +1,393 @@
+"""Bounded, coalescing queues for Avi-on mesh commands and statuses."""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from .commands import LightCommand
+
+_LOGGER = logging.getLogger(__name__)
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_BLOCK = "block"
+
+# Command priority classes, dispatched in this order
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = ("interactive", "bulk")
+
+# Seconds within which the same status from two mesh links is one report
+STATUS_DEDUP_WINDOW = 1.0
+DEDUP_MAX_ENTRIES = 4096
+
+
+@dataclass
+class QueueLimits:
+    """Bounds and overflow policy for the mesh queues."""
+
+    command_queue_size: int
+    status_queue_size: int
+    overflow_policy: str = OVERFLOW_DROP_OLDEST
+    block_timeout: float = 5.0
+    # Packets per second handed to the mesh, 0 for no limit
+    rate_limit: float = 0.0
+
+
+class CoalescingCommandQueue:
+    """Pending mesh commands where the newest command for a target wins.
+
+    Commands are dispatched by priority class, interactive before bulk, and
+    round-robin across avids within a class so that one target with many
+    pending commands cannot starve the others.
+
+    Commands for distinct targets are bounded by maxsize (0 for unbounded).
+    When full, the drop-oldest policy evicts the oldest pending command for
+    the same avid, or the oldest pending bulk command, or the oldest pending
+    command overall; the block policy makes the caller wait for room and
+    raises asyncio.QueueFull on timeout. Either way, on_drop is called with
+    the command that will not be sent.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        policy: str = OVERFLOW_DROP_OLDEST,
+        timeout: float = 5.0,
+    ) -> None:
+        """Initialize the queue."""
+        self.maxsize = maxsize
+        self.policy = policy
+        self.timeout = timeout
+        # key -> (priority, monotonic enqueue time, command), oldest first
+        self._pending: Dict[Tuple[Hashable, ...], Tuple[int, float, LightCommand]] = {}
+        # Per priority class: avid -> its pending keys, in round-robin order
+        self._classes: Tuple["OrderedDict[Hashable, OrderedDict]", ...] = tuple(
+            OrderedDict() for _ in PRIORITY_NAMES
+        )
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self.on_drop: Optional[Callable[[LightCommand], None]] = None
+        self.enqueued = 0
+        self.collapsed = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def __len__(self) -> int:
+        """Return the number of pending commands."""
+        return len(self._pending)
+
+    def full(self) -> bool:
+        """Return True if no command for a new target fits."""
+        return 0 < self.maxsize <= len(self._pending)
+
+    async def put(
+        self,
+        command: LightCommand,
+        enqueued_at: Optional[float] = None,
+        priority: int = PRIORITY_BULK,
+    ) -> None:
+        """Queue a command, replacing any pending command for the same target.
+
+        enqueued_at is the monotonic time the command was requested, if earlier
+        than now.
+        """
+        key = command.key
+        if enqueued_at is None:
+            enqueued_at = time.monotonic()
+
+        while key not in self._pending and self.full():
+            if self.policy != OVERFLOW_BLOCK:
+                self._drop_oldest(key)
+                break
+            self._not_full.clear()
+            try:
+                await asyncio.wait_for(self._not_full.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(command)
+                raise asyncio.QueueFull from None
+
+        if key in self._pending:
+            # Drop the stale command and re-append so that the dispatch order
+            # follows the order of the latest writes.
+            self._remove(key)
+            self.collapsed += 1
+        self._pending[key] = (priority, enqueued_at, command)
+        self._classes[priority].setdefault(key[0], OrderedDict())[key] = None
+        self.enqueued += 1
+        self.high_water = max(self.high_water, len(self._pending))
+        self._not_empty.set()
+
+    def _remove(self, key: Tuple[Hashable, ...]) -> Tuple[int, float, LightCommand]:
+        """Remove a pending command from the queue and its class."""
+        item = self._pending.pop(key)
+        avids = self._classes[item[0]]
+        keys = avids[key[0]]
+        del keys[key]
+        if not keys:
+            del avids[key[0]]
+        return item
+
+    def _drop_oldest(self, key: Tuple[Hashable, ...]) -> None:
+        """Evict the oldest command for the same avid, else the oldest (bulk) command."""
+        victim = next((k for k in self._pending if k[0] == key[0]), None)
+        if victim is None:
+            victim = next(
+                (k for k, item in self._pending.items() if item[0] == PRIORITY_BULK),
+                next(iter(self._pending)),
+            )
+        _, _, dropped = self._remove(victim)
+        self.dropped += 1
+        _LOGGER.debug(f"Command queue full, dropped {dropped}")
+        if self.on_drop is not None:
+            self.on_drop(dropped)
+
+    async def requeue(self, command: LightCommand, enqueued_at: float, priority: int) -> None:
+        """Return a command that was not sent, unless a newer one replaced it."""
+        if command.key in self._pending:
+            self.collapsed += 1
+            return
+        await self.put(command, enqueued_at, priority)
+
+    async def get(self) -> Tuple[float, LightCommand, int]:
+        """Wait for the next command to dispatch.
+
+        Returns its enqueue time, command and priority.
+        """
+        while not self._pending:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        # Highest priority class with pending commands, next avid in turn
+        avids = next(avids for avids in self._classes if avids)
+        avid, keys = next(iter(avids.items()))
+        avids.move_to_end(avid)
+        priority, enqueued_at, command = self._remove(next(iter(keys)))
+        self.dispatched += 1
+        self._not_full.set()
+        return enqueued_at, command, priority
+
+    def stats(self) -> Dict[str, int]:
+        """Return the queue counters."""
+        pending = {f"pending_{name}": 0 for name in PRIORITY_NAMES}
+        for priority, _, _ in self._pending.values():
+            pending[f"pending_{PRIORITY_NAMES[priority]}"] += 1
+        return {
+            "pending": len(self._pending),
+            **pending,
+            "enqueued": self.enqueued,
+            "collapsed": self.collapsed,
+            "dispatched": self.dispatched,
+            "dropped": self.dropped,
+            "high_water": self.high_water,
+        }
+
+
+class TokenBucket:
+    """Packet rate limiter; a rate of 0 disables the limit."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        """Initialize the bucket, full."""
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self.throttled = 0
+
+    def set_rate(self, rate: float) -> None:
+        """Change the rate, keeping the tokens collected so far within the new burst."""
+        self.rate = rate
+        self.burst = max(rate, 1.0)
+        self._tokens = min(self._tokens, self.burst)
+
+    async def acquire(self) -> None:
+        """Wait until a packet may be sent."""
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            self.throttled += 1
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class HandoffQueue(asyncio.Queue):
+    """Queue the mesh handler takes commands from, reporting takes and completions."""
+
+    def __init__(
+        self,
+        maxsize: int,
+        on_take: Callable[[Any], None],
+        on_done: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """Initialize the queue."""
+        super().__init__(maxsize)
+        self._on_take = on_take
+        self._on_done = on_done
+
+    def get_nowait(self) -> Any:
+        """Take a command and report it."""
+        item = super().get_nowait()
+        self._on_take(item)
+        return item
+
+    def task_done(self) -> None:
+        """Mark a command as sent and report it."""
+        super().task_done()
+        if self._on_done is not None:
+            self._on_done()
+
+    def reclaim(self) -> Optional[Any]:
+        """Take back the waiting command, if any, without reporting it."""
+        if self.empty():
+            return None
+        item = super().get_nowait()
+        self.task_done()
+        return item
+
+
+class BoundedStatusQueue(asyncio.Queue):
+    """Status queue that applies an overflow policy instead of growing.
+
+    With the drop-oldest policy a put on a full queue evicts the oldest queued
+    status for the same avid, or the oldest status overall. With the block
+    policy the producer waits up to the timeout and the new status is dropped
+    if there is still no room.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        policy: str = OVERFLOW_DROP_OLDEST,
+        timeout: float = 5.0,
+    ) -> None:
+        """Initialize the queue."""
+        super().__init__(maxsize)
+        self.policy = policy
+        self.timeout = timeout
+        self.dropped = 0
+        self.high_water = 0
+
+    def put_nowait(self, item: Any) -> None:
+        """Put a status, evicting an older one if the queue is full."""
+        if self.full():
+            self._drop_oldest(item)
+        super().put_nowait(item)
+        self.high_water = max(self.high_water, self.qsize())
+
+    async def put(self, item: Any) -> None:
+        """Put a status according to the overflow policy."""
+        if self.policy != OVERFLOW_BLOCK or not self.full():
+            self.put_nowait(item)
+            return
+
+        try:
+            await asyncio.wait_for(super().put(item), self.timeout)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            _LOGGER.debug(f"Status queue full, dropped {item}")
+
+    def _drop_oldest(self, item: Any) -> None:
+        """Evict the oldest status for the same avid, else the oldest status."""
+        avid = item.data.get("avid")
+        queued = self._queue  # type: ignore[attr-defined]
+        for index, status in enumerate(queued):
+            if status.data.get("avid") == avid:
+                del queued[index]
+                break
+        else:
+            queued.popleft()
+        # Keep join()/task_done() accounting consistent with the eviction
+        self.task_done()
+        self.dropped += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return the queue counters."""
+        return {
+            "depth": self.qsize(),
+            "dropped": self.dropped,
+            "high_water": self.high_water,
+        }
+
+
+class StatusDeduplicator:
+    """Recognize a status already delivered by another mesh link.
+
+    Every link hears the same mesh broadcasts; a status with the same values
+    from a different link within the window is the same report.
+    """
+
+    def __init__(self, window: float = STATUS_DEDUP_WINDOW) -> None:
+        """Initialize the deduplicator."""
+        self.window = window
+        # (avid, values) -> (link id, monotonic time first delivered)
+        self._seen: Dict[Tuple[Hashable, ...], Tuple[int, float]] = {}
+        self.duplicates = 0
+
+    def is_duplicate(self, link_id: int, data: dict) -> bool:
+        """Return True if another link delivered this status within the window."""
+        now = time.monotonic()
+        key = tuple(data.items())
+        seen = self._seen.get(key)
+        if seen is not None and seen[0] != link_id and now - seen[1] < self.window:
+            self.duplicates += 1
+            return True
+        self._seen[key] = (link_id, now)
+        if len(self._seen) > DEDUP_MAX_ENTRIES:
+            self._seen = {k: v for k, v in self._seen.items() if now - v[1] < self.window}
+        return False
+
+
+@dataclass(slots=True)
+class SelfAck:
+    """Status the mesh library reported for a command it sent, not heard from the mesh."""
+
+    data: dict
+
+
+class LinkStatusQueue:
+    """Status queue handed to one mesh handler, feeding the session's shared queue.
+
+    The mesh library reports the status a command sets right after sending
+    it, before the command is done. That status is forwarded as a SelfAck,
+    and kept out of deduplication so that the same values heard from a
+    device on another link still get through.
+    """
+
+    def __init__(
+        self,
+        link_id: int,
+        queue: BoundedStatusQueue,
+        on_status: Callable[[], None],
+        deduplicator: Optional[StatusDeduplicator] = None,
+    ) -> None:
+        """Initialize the queue."""
+        self.link_id = link_id
+        self._queue = queue
+        self._on_status = on_status
+        self._deduplicator = deduplicator
+        # Acknowledgement of the command being sent, until it arrives
+        self._ack: Optional[dict] = None
+
+    def expect_ack(self, ack: Optional[dict]) -> None:
+        """Expect the library's acknowledgement of the command being sent, or none."""
+        self._ack = ack
+
+    async def put(self, item: Any) -> None:
+        """Forward a status unless another link already delivered it."""
+        self._on_status()
+        if self._ack is not None and item.data == self._ack:
+            self._ack = None
+            await self._queue.put(SelfAck(item.data))
+        elif self._deduplicator is None or not self._deduplicator.is_duplicate(
+            self.link_id, item.data
+        ):
+            await self._queue.put(item)
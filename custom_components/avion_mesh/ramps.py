@@ -0,0 +1,162 @@
+"""Paced brightness and color temperature ramps for light transitions."""
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Collection, Dict, List, Optional, Tuple
+
+from .commands import LightCommand
+from .mesh_link import async_cancel
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds between ramp steps. Every ramp steps on the same grid, so lights
+# ramping alike send their steps together and can share group packets.
+RAMP_TICK = 0.25
+
+# location id, priority, intermediate steps, final values
+SendStep = Callable[[int, int, List[LightCommand], List[LightCommand]], Awaitable[None]]
+
+
+@dataclass
+class Ramp:
+    """A transition of one value of a device or group."""
+
+    location_id: int
+    target: LightCommand
+    start_value: int
+    # Monotonic times on the tick grid
+    start: float
+    end: float
+    priority: int
+    # Last value sent
+    sent: int
+
+    def value_at(self, now: float) -> int:
+        """Return the value the ramp reaches at a time."""
+        if now >= self.end:
+            return self.target.value
+        fraction = max(now - self.start, 0.0) / (self.end - self.start)
+        return round(self.start_value + (self.target.value - self.start_value) * fraction)
+
+
+class RampEngine:
+    """Transitions of every location, stepped together on a shared tick.
+
+    A step is only sent for values that changed since the previous step, so a
+    ramp takes at most one packet per unit its value changes by, plus its
+    final value. The final value is sent as a step of its own, which the
+    sender tracks like any command.
+    """
+
+    def __init__(self, send_step: SendStep, tick: float = RAMP_TICK) -> None:
+        """Initialize the engine."""
+        self._send_step = send_step
+        self.tick = tick
+        # (location id, command key) -> ramp
+        self._ramps: Dict[Tuple[int, Tuple[int, str]], Ramp] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.started = 0
+        self.replaced = 0
+        self.cancelled = 0
+        self.completed = 0
+        self.ticks = 0
+        self.steps = 0
+
+    def _next_tick(self, now: float) -> float:
+        """Return the first tick of the grid after now."""
+        return (math.floor(now / self.tick) + 1) * self.tick
+
+    def start(
+        self,
+        location_id: int,
+        targets: List[Tuple[LightCommand, int]],
+        duration: float,
+        priority: int,
+    ) -> None:
+        """Ramp each target from its start value to the command's value.
+
+        Ramps of the same duration started within one tick share every step.
+        A ramp replaces any ramp of the same value of its target.
+        """
+        start = self._next_tick(time.monotonic())
+        end = start + max(round(duration / self.tick), 1) * self.tick
+        for command, start_value in targets:
+            key = (location_id, command.key)
+            if key in self._ramps:
+                self.replaced += 1
+            self._ramps[key] = Ramp(
+                location_id, command, start_value, start, end, priority, start_value
+            )
+        self.started += len(targets)
+        if targets and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self, location_id: int, command_keys: Collection[Tuple[int, str]]) -> int:
+        """Stop the ramps of command keys where they are, returning how many there were.
+
+        A ramp of another value of the same target keeps going.
+        """
+        keys = [key for key in self._ramps if key[0] == location_id and key[1] in command_keys]
+        for key in keys:
+            del self._ramps[key]
+        self.cancelled += len(keys)
+        return len(keys)
+
+    async def _run(self) -> None:
+        """Send the steps of every ramp on each tick until none is left."""
+        try:
+            while self._ramps:
+                now = time.monotonic()
+                tick = self._next_tick(now)
+                await asyncio.sleep(tick - now)
+                await self._async_step(tick)
+        except asyncio.CancelledError:
+            _LOGGER.debug("Ramp engine cancelled")
+            raise
+        finally:
+            self._task = None
+
+    async def _async_step(self, tick: float) -> None:
+        """Send the values every ramp reaches at a tick."""
+        self.ticks += 1
+        # (location id, priority) -> intermediate steps, final values
+        batches: Dict[Tuple[int, int], Tuple[List[LightCommand], List[LightCommand]]] = {}
+        for key, ramp in list(self._ramps.items()):
+            value = ramp.value_at(tick)
+            steps, finals = batches.setdefault((ramp.location_id, ramp.priority), ([], []))
+            if tick >= ramp.end:
+                del self._ramps[key]
+                self.completed += 1
+                finals.append(ramp.target)
+            elif value != ramp.sent:
+                ramp.sent = value
+                steps.append(LightCommand(ramp.target.avid, ramp.target.op, value))
+
+        for (location_id, priority), (steps, finals) in batches.items():
+            if not steps and not finals:
+                continue
+            self.steps += len(steps) + len(finals)
+            try:
+                await self._send_step(location_id, priority, steps, finals)
+            except asyncio.QueueFull:
+                # A later step supersedes this one
+                _LOGGER.debug(f"Dropped a ramp step for location {location_id}: queue full")
+
+    async def async_stop(self) -> None:
+        """Stop every ramp where it is."""
+        self._ramps.clear()
+        await async_cancel(self._task)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the ramp counters."""
+        return {
+            "active": len(self._ramps),
+            "started": self.started,
+            "replaced": self.replaced,
+            "cancelled": self.cancelled,
+            "completed": self.completed,
+            "ticks": self.ticks,
+            "steps": self.steps,
+        }
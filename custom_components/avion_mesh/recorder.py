@@ -0,0 +1,244 @@
+"""Recording of the mesh traffic of a config entry, for offline replay.
+
+Every file of a capture, and every recording appended to an existing file,
+starts with a header, ``["#", version, started]``, naming the UTC time the
+recording started. Every other line is a JSON array
+starting with the kind of event and its monotonic time in seconds since the
+recording started:
+
+- ``["c", t, location_id, priority, [[avid, op, value], ...]]``: commands
+  requested together, still to be planned
+- ``["p", t, location_id, priority, [[avid, op, value], ...]]``: commands
+  requested already planned, e.g. a scene
+- ``["h", t, location_id, link_id, avid, op, value, wait]``: a command handed
+  to the mesh after waiting wait seconds
+- ``["s", t, location_id, status]``: a status the mesh reported
+
+Lines are collected in memory and appended from the executor. A file about
+to grow past its size bound is rotated to ``.1``, ``.2``, ... and the oldest
+is deleted, so a capture takes about (backups + 1) * max_bytes at most.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.util import dt as dt_util
+
+from .commands import LightCommand
+
+_LOGGER = logging.getLogger(__name__)
+
+CAPTURE_VERSION = 1
+
+EVENT_HEADER = "#"
+EVENT_COMMANDS = "c"
+EVENT_PLANNED = "p"
+EVENT_HANDOFF = "h"
+EVENT_STATUS = "s"
+
+# Bytes per capture file before it is rotated, and rotated files kept
+RECORDING_MAX_BYTES = 10 * 1024 * 1024
+RECORDING_BACKUPS = 3
+# Seconds to collect lines before appending them to the file
+RECORDING_FLUSH_INTERVAL = 1.0
+# Lines held while the executor is behind; more are dropped
+RECORDING_MAX_BUFFERED = 50_000
+
+
+def _time(t: float) -> float:
+    """Return a timestamp with the precision kept in the capture."""
+    return round(t, 4)
+
+
+def _encode(commands: Iterable[LightCommand]) -> List[list]:
+    """Return commands in their capture form."""
+    return [[command.avid, command.op, command.value] for command in commands]
+
+
+class TrafficRecorder:
+    """Append-only capture of the commands and statuses of the mesh sessions."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        path: str,
+        max_bytes: int = RECORDING_MAX_BYTES,
+        backups: int = RECORDING_BACKUPS,
+    ) -> None:
+        """Initialize the recorder; nothing is written until the first flush."""
+        self.hass = hass
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._started = time.monotonic()
+        self._started_utc = dt_util.utcnow().isoformat()
+        self._buffer: List[str] = []
+        self._cancel_flush: Optional[CALLBACK_TYPE] = None
+        self._writing: Optional[asyncio.Task] = None
+        # Bytes in the current file, and whether this recording's header is
+        # in it yet; only touched from the executor
+        self._size: Optional[int] = None
+        self._header_written = False
+        # Counters; only touched from the event loop
+        self.recorded = 0
+        self.dropped = 0
+        self.rotations = 0
+
+    def _record(self, event: list) -> None:
+        """Buffer an event and schedule a flush."""
+        if len(self._buffer) >= RECORDING_MAX_BUFFERED:
+            self.dropped += 1
+            return
+        self._buffer.append(json.dumps(event, separators=(",", ":")))
+        self.recorded += 1
+        if self._cancel_flush is None:
+            self._cancel_flush = async_call_later(
+                self.hass, RECORDING_FLUSH_INTERVAL, self._async_flush
+            )
+
+    def _now(self) -> float:
+        """Return the monotonic time since the recording started."""
+        return _time(time.monotonic() - self._started)
+
+    def record_commands(
+        self,
+        location_id: int,
+        commands: List[LightCommand],
+        priority: int,
+        planned: bool = False,
+    ) -> None:
+        """Record commands requested together for a location."""
+        self._record(
+            [
+                EVENT_PLANNED if planned else EVENT_COMMANDS,
+                self._now(),
+                location_id,
+                priority,
+                _encode(commands),
+            ]
+        )
+
+    def record_handoff(
+        self, location_id: int, link_id: int, command: LightCommand, enqueued_at: float
+    ) -> None:
+        """Record a command handed to the mesh."""
+        now = time.monotonic()
+        self._record(
+            [
+                EVENT_HANDOFF,
+                _time(now - self._started),
+                location_id,
+                link_id,
+                command.avid,
+                command.op,
+                command.value,
+                _time(now - enqueued_at),
+            ]
+        )
+
+    def record_status(self, location_id: int, status: dict) -> None:
+        """Record a status the mesh reported."""
+        self._record([EVENT_STATUS, self._now(), location_id, status])
+
+    @callback
+    def _async_flush(self, _now: object = None) -> None:
+        """Append the buffered lines from the executor, one write at a time."""
+        self._cancel_flush = None
+        if not self._buffer:
+            return
+        if self._writing is not None and not self._writing.done():
+            # Still writing the previous lines; keep collecting
+            self._cancel_flush = async_call_later(
+                self.hass, RECORDING_FLUSH_INTERVAL, self._async_flush
+            )
+            return
+        lines, self._buffer = self._buffer, []
+        self._writing = self.hass.async_create_task(self._async_write(lines))
+
+    async def _async_write(self, lines: List[str]) -> None:
+        """Append lines from the executor and count what it dropped and rotated."""
+        dropped, rotations = await self.hass.async_add_executor_job(self._write, lines)
+        self.dropped += dropped
+        self.rotations += rotations
+
+    def _write(self, lines: List[str]) -> Tuple[int, int]:
+        """Append lines to the capture, rotating it when it outgrows its bound.
+
+        Returns the number of lines dropped and of rotations.
+        """
+        rotations = 0
+        records = len(lines)
+        try:
+            if self._size is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if not self._header_written:
+                # Also when appending to an earlier recording, whose times
+                # started from 0 at its own header
+                lines = [self._header(), *lines]
+            data = "".join(line + "\n" for line in lines).encode()
+            if self._size and self._size + len(data) > self.max_bytes:
+                self._rotate()
+                rotations += 1
+                if self._header_written:
+                    data = (self._header() + "\n").encode() + data
+            with open(self.path, "ab") as capture:
+                capture.write(data)
+            self._size += len(data)
+            self._header_written = True
+        except OSError as e:
+            _LOGGER.warning(f"Failed to write mesh traffic to {self.path}: {e}")
+            return records, rotations
+        return 0, rotations
+
+    def _header(self) -> str:
+        """Return the header line of a capture file."""
+        return json.dumps([EVENT_HEADER, CAPTURE_VERSION, self._started_utc], separators=(",", ":"))
+
+    def _rotate(self) -> None:
+        """Shift the capture files by one, deleting the oldest."""
+        for index in range(self.backups, 0, -1):
+            source = f"{self.path}.{index - 1}" if index > 1 else self.path
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index}")
+        if not self.backups:
+            os.remove(self.path)
+        self._size = 0
+
+    async def async_stop(self) -> None:
+        """Write what is still buffered and stop recording."""
+        if self._cancel_flush is not None:
+            self._cancel_flush()
+            self._cancel_flush = None
+        if self._writing is not None:
+            await self._writing
+        if self._buffer:
+            lines, self._buffer = self._buffer, []
+            await self._async_write(lines)
+
+    def as_dict(self) -> dict:
+        """Return the recording counters."""
+        return {
+            "path": self.path,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+        }
+
+
+def capture_files(path: str) -> List[str]:
+    """Return the files of a capture, oldest first."""
+    files = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        files.append(f"{path}.{index}")
+        index += 1
+    files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
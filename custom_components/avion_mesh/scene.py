@@ -0,0 +1,190 @@
+"""Scene platform for Avi-on Mesh integration."""
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from homeassistant.components.light import ATTR_TRANSITION
+from homeassistant.components.scene import Scene
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .commands import LightCommand
+from .const import DOMAIN, SIGNAL_LOCATION_UPDATED, SIGNAL_SCENES_UPDATED
+from .device_index import DeviceIndex, IndexedDevice
+from .ha_service import AvionMeshService
+from .services import target_command
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CompiledScene:
+    """Mesh commands of a scene planned ahead, and the light states they set."""
+
+    # location id -> fewest commands setting every light of the scene
+    commands: Dict[int, List[LightCommand]]
+    # location id -> status per light, applied when the scene is activated
+    statuses: Dict[int, List[dict]]
+
+    @property
+    def packets(self) -> int:
+        """Return the number of mesh packets the scene takes."""
+        return sum(len(commands) for commands in self.commands.values())
+
+
+def _find_device(index: DeviceIndex, avid: int) -> Optional[IndexedDevice]:
+    """Return the device, group or 'all' entity with the given avid."""
+    if (device := index.get(avid)) is not None:
+        return device
+    return next((entity for entity in index.entities if entity.avid == avid), None)
+
+
+def compile_scene(service: AvionMeshService, scene: dict) -> CompiledScene:
+    """Compile a scene into the fewest mesh commands per location.
+
+    Lights sharing a value are grouped, and lights covering whole mesh groups
+    are addressed through the group. Lights no longer in their location are
+    skipped.
+    """
+    indexes = service.get_device_indexes()
+    commands: Dict[int, List[LightCommand]] = {}
+    for target in scene["targets"]:
+        location_id = target["location_id"]
+        if (index := indexes.get(location_id)) is None:
+            continue
+        if (device := _find_device(index, target["avid"])) is None:
+            continue
+        commands.setdefault(location_id, []).append(target_command(device, target))
+
+    return CompiledScene(
+        commands={
+            location_id: service.plan_commands(location_id, location_commands)
+            for location_id, location_commands in commands.items()
+        },
+        statuses={
+            location_id: [
+                {"avid": command.avid, **command.expected}
+                for command in location_commands
+            ]
+            for location_id, location_commands in commands.items()
+        },
+    )
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up scene entities for Avi-on Mesh."""
+    service: AvionMeshService = hass.data[DOMAIN][config_entry.entry_id]
+
+    entities: Dict[str, AvionMeshScene] = {
+        scene_id: AvionMeshScene(service, config_entry.entry_id, scene_id, scene)
+        for scene_id, scene in service.get_scenes().items()
+    }
+    if entities:
+        async_add_entities(list(entities.values()))
+        _LOGGER.info(f"Added {len(entities)} scene entities")
+
+    async def _async_scenes_updated() -> None:
+        """Add, update and remove scene entities after the scenes changed."""
+        scenes = service.get_scenes()
+
+        added = []
+        for scene_id, scene in scenes.items():
+            if (entity := entities.get(scene_id)) is not None:
+                entity.async_set_scene(scene)
+            else:
+                entity = AvionMeshScene(service, config_entry.entry_id, scene_id, scene)
+                entities[scene_id] = entity
+                added.append(entity)
+        if added:
+            async_add_entities(added)
+
+        entity_registry = er.async_get(hass)
+        for scene_id in [s for s in entities if s not in scenes]:
+            entity = entities.pop(scene_id)
+            _LOGGER.info(f"Removing scene entity {entity.name}")
+            if entity.registry_entry:
+                entity_registry.async_remove(entity.entity_id)
+            else:
+                await entity.async_remove(force_remove=True)
+
+    @callback
+    def _async_location_updated(diff: dict) -> None:
+        """Recompile the scenes against the changed devices and groups."""
+        for entity in entities.values():
+            entity.async_compile()
+
+    config_entry.async_on_unload(
+        async_dispatcher_connect(
+            hass,
+            SIGNAL_SCENES_UPDATED.format(entry_id=config_entry.entry_id),
+            _async_scenes_updated,
+        )
+    )
+    config_entry.async_on_unload(
+        async_dispatcher_connect(
+            hass,
+            SIGNAL_LOCATION_UPDATED.format(entry_id=config_entry.entry_id),
+            _async_location_updated,
+        )
+    )
+
+
+class AvionMeshScene(Scene):
+    """A snapshot of Avi-on light states, activated as few mesh packets."""
+
+    def __init__(
+        self, service: AvionMeshService, entry_id: str, scene_id: str, scene: dict
+    ) -> None:
+        """Initialize the scene."""
+        self.service = service
+        self._scene_id = scene_id
+        self._attr_unique_id = f"{entry_id}_scene_{scene_id}"
+        self._scene = scene
+        self._attr_name = scene.get("name", scene_id)
+        # Compiled once per definition and location change, not per activation
+        self._compiled = compile_scene(service, scene)
+
+    @callback
+    def async_set_scene(self, scene: dict) -> None:
+        """Adopt a new definition of this scene."""
+        self._scene = scene
+        self._attr_name = scene.get("name", self._scene_id)
+        self.async_compile()
+
+    @callback
+    def async_compile(self) -> None:
+        """Compile the scene again, e.g. after group membership changed."""
+        self._compiled = compile_scene(self.service, self._scene)
+        if self.hass is not None:
+            self.async_write_ha_state()
+
+    @property
+    def extra_state_attributes(self) -> Dict[str, Any]:
+        """Return the lights of the scene and the packets activating it takes."""
+        return {
+            "entity_id": [
+                target["entity_id"] for target in self._scene["targets"] if "entity_id" in target
+            ],
+            "mesh_packets": self._compiled.packets,
+        }
+
+    async def async_activate(self, **kwargs: Any) -> None:
+        """Activate the scene, over a transition if one is given."""
+        _LOGGER.debug(
+            f"Activating scene {self._attr_name} as {self._compiled.packets} mesh packets"
+        )
+        if transition := kwargs.get(ATTR_TRANSITION):
+            await self.service.async_transition(
+                self._compiled.commands, transition, self._context
+            )
+            return
+        await self.service.async_send_planned(
+            self._compiled.commands, self._compiled.statuses, self._context
+        )
@@ -0,0 +1,193 @@
+"""Diagnostic sensors exposing Avi-on mesh metrics."""
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, List, Optional, Set
+
+from homeassistant.components.sensor import (
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .const import DOMAIN, SIGNAL_LOCATION_UPDATED
+from .ha_service import AvionMeshService
+
+SCAN_INTERVAL = timedelta(seconds=30)
+
+
+@dataclass(frozen=True)
+class AvionMeshSensorEntityDescription(SensorEntityDescription):
+    """Describes an Avi-on mesh metric sensor."""
+
+    value_fn: Callable[[dict], Optional[float]] = lambda metrics: None
+
+
+SENSORS = (
+    AvionMeshSensorEntityDescription(
+        key="pending_commands",
+        name="Pending commands",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda m: m["commands"]["pending"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="status_queue_depth",
+        name="Status queue depth",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda m: m["statuses"]["depth"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="command_latency_p50",
+        name="Command latency p50",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda m: m["command_latency"]["p50_ms"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="command_latency_p95",
+        name="Command latency p95",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda m: m["command_latency"]["p95_ms"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="statuses_per_minute",
+        name="Status rate",
+        native_unit_of_measurement="statuses/min",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda m: round(m["statuses_per_minute"], 1),
+    ),
+    AvionMeshSensorEntityDescription(
+        key="devices_hydrated",
+        name="Devices hydrated",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda m: m["hydration"]["hydrated"] if m["hydration"] else None,
+    ),
+    AvionMeshSensorEntityDescription(
+        key="devices_offline",
+        name="Devices offline",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda m: m["liveness"]["offline"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="devices_went_offline",
+        name="Devices gone offline",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda m: m["liveness"]["went_offline"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="mesh_handler_restarts",
+        name="Mesh handler restarts",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda m: m["mesh_handler_restarts"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="mesh_outages",
+        name="Mesh outages",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda m: m["link"]["outages"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="last_outage",
+        name="Last outage duration",
+        native_unit_of_measurement=UnitOfTime.SECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda m: m["link"]["last_outage_s"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="time_to_reconnect",
+        name="Time to reconnect",
+        native_unit_of_measurement=UnitOfTime.SECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda m: m["link"]["last_reconnect_s"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="commands_collapsed",
+        name="Commands collapsed",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda m: m["commands"]["collapsed"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="commands_dropped",
+        name="Commands dropped",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda m: m["commands"]["dropped"],
+    ),
+    AvionMeshSensorEntityDescription(
+        key="state_writes_suppressed",
+        name="State writes suppressed",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda m: m["statuses"]["state_writes_suppressed"],
+    ),
+)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up metric sensors for every Avi-on location, and for locations found later."""
+    service: AvionMeshService = hass.data[DOMAIN][config_entry.entry_id]
+    location_ids: Set[int] = set()
+
+    @callback
+    def _async_add_sensors(_diff: Optional[dict] = None) -> None:
+        """Add the sensors of the locations that have none yet."""
+        added = service.get_locations().keys() - location_ids
+        location_ids.update(added)
+        entities: List[AvionMeshMetricSensor] = [
+            AvionMeshMetricSensor(service, config_entry, location_id, description)
+            for location_id in sorted(added)
+            for description in SENSORS
+        ]
+        if entities:
+            async_add_entities(entities, update_before_add=True)
+
+    _async_add_sensors()
+    config_entry.async_on_unload(
+        async_dispatcher_connect(
+            hass,
+            SIGNAL_LOCATION_UPDATED.format(entry_id=config_entry.entry_id),
+            _async_add_sensors,
+        )
+    )
+
+
+class AvionMeshMetricSensor(SensorEntity):
+    """A metric of one Avi-on mesh session."""
+
+    entity_description: AvionMeshSensorEntityDescription
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_has_entity_name = True
+
+    def __init__(
+        self,
+        service: AvionMeshService,
+        config_entry: ConfigEntry,
+        location_id: int,
+        description: AvionMeshSensorEntityDescription,
+    ):
+        """Initialize the sensor."""
+        self.service = service
+        self.entity_description = description
+        self._location_id = location_id
+        device_id = f"{config_entry.entry_id}_location_{location_id}"
+        self._attr_unique_id = f"{device_id}_{description.key}"
+        self._attr_device_info = {
+            "identifiers": {(DOMAIN, device_id)},
+            "name": f"Avi-on Mesh location {location_id + 1}",
+            "manufacturer": "Avi-on",
+            "model": "Mesh",
+        }
+
+    async def async_update(self) -> None:
+        """Read the metric from the service."""
+        metrics = self.service.get_metrics().get(self._location_id)
+        self._attr_available = metrics is not None
+        if metrics is not None:
+            self._attr_native_value = self.entity_description.value_fn(metrics)
@@ -0,0 +1,252 @@
+"""Domain services of the Avi-on Mesh integration."""
+import asyncio
+import logging
+from typing import Dict, List, Tuple
+
+import voluptuous as vol
+from homeassistant.components.light import (
+    ATTR_BRIGHTNESS,
+    ATTR_COLOR_MODE,
+    ATTR_COLOR_TEMP_KELVIN,
+    ATTR_TRANSITION,
+    ColorMode,
+)
+from homeassistant.const import ATTR_ENTITY_ID, ATTR_NAME, STATE_OFF
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers import entity_registry as er
+
+from .commands import LightCommand, color_temp, dimming
+from .const import DOMAIN
+from .device_index import IndexedDevice
+from .ha_service import AvionMeshService
+
+_LOGGER = logging.getLogger(__name__)
+
+SERVICE_SET_MANY = "set_many"
+SERVICE_CREATE_SCENE = "create_scene"
+SERVICE_DELETE_SCENE = "delete_scene"
+
+ATTR_TARGETS = "targets"
+ATTR_AVID = "avid"
+ATTR_LOCATION_ID = "location_id"
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+ATTR_STATE = "state"
+ATTR_SCENE_ID = "scene_id"
+
+TARGET_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Exclusive(ATTR_ENTITY_ID, "target"): cv.entity_id,
+            vol.Exclusive(ATTR_AVID, "target"): vol.All(vol.Coerce(int), vol.Range(min=0)),
+            vol.Optional(ATTR_LOCATION_ID, default=0): vol.All(
+                vol.Coerce(int), vol.Range(min=0)
+            ),
+            vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+            vol.Optional(ATTR_STATE): vol.In(("on", "off")),
+            vol.Optional(ATTR_BRIGHTNESS): vol.All(vol.Coerce(int), vol.Range(min=0, max=255)),
+            vol.Optional(ATTR_COLOR_TEMP_KELVIN): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        }
+    ),
+    cv.has_at_least_one_key(ATTR_ENTITY_ID, ATTR_AVID),
+)
+
+SET_MANY_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_TARGETS): vol.All(cv.ensure_list, vol.Length(min=1), [TARGET_SCHEMA]),
+        vol.Optional(ATTR_TRANSITION): cv.positive_float,
+    }
+)
+
+CREATE_SCENE_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_SCENE_ID): cv.slug,
+        vol.Optional(ATTR_NAME): cv.string,
+        vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+    }
+)
+
+DELETE_SCENE_SCHEMA = vol.Schema({vol.Required(ATTR_SCENE_ID): cv.slug})
+
+
+def target_command(device: IndexedDevice, target: dict) -> LightCommand:
+    """Return the mesh command setting a target the way its light entity would."""
+    if target.get(ATTR_STATE) == "off":
+        return dimming(device.avid, 0)
+    if ATTR_COLOR_TEMP_KELVIN in target and device.color_temp:
+        return color_temp(device.avid, target[ATTR_COLOR_TEMP_KELVIN])
+    if device.dimming:
+        return dimming(device.avid, target.get(ATTR_BRIGHTNESS, 255))
+    return dimming(device.avid, 255)
+
+
+class _TargetResolver:
+    """Look up the entry and device of set_many targets, indexing each entry once."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the resolver."""
+        self._services: Dict[str, AvionMeshService] = hass.data.get(DOMAIN, {})
+        self._entity_registry = er.async_get(hass)
+        # entry id -> pid / (location id, avid) -> device
+        self._by_pid: Dict[str, Dict[str, IndexedDevice]] = {}
+        self._by_avid: Dict[str, Dict[Tuple[int, int], IndexedDevice]] = {}
+
+    def _index(self, entry_id: str) -> None:
+        """Index the devices, groups and entities of an entry."""
+        if entry_id in self._by_pid:
+            return
+        by_pid: Dict[str, IndexedDevice] = {}
+        by_avid: Dict[Tuple[int, int], IndexedDevice] = {}
+        for location_id, index in self._services[entry_id].get_device_indexes().items():
+            for device in (*index.devices.values(), *index.groups.values(), *index.entities):
+                by_pid[device.pid] = device
+                by_avid[(location_id, device.avid)] = device
+        self._by_pid[entry_id] = by_pid
+        self._by_avid[entry_id] = by_avid
+
+    def resolve(self, target: dict) -> Tuple[str, IndexedDevice]:
+        """Return the entry and device a target addresses.
+
+        An avid must be found in exactly one entry, or in the given one.
+        """
+        if ATTR_ENTITY_ID in target:
+            entity_id = target[ATTR_ENTITY_ID]
+            entry = self._entity_registry.async_get(entity_id)
+            if entry is None or entry.config_entry_id not in self._services:
+                raise HomeAssistantError(f"{entity_id} is not an Avi-on Mesh light")
+            self._index(entry.config_entry_id)
+            if (device := self._by_pid[entry.config_entry_id].get(entry.unique_id)) is None:
+                raise HomeAssistantError(f"{entity_id} is not an Avi-on Mesh light")
+            return entry.config_entry_id, device
+
+        # An avid is only unique within a location of one account
+        key = (target[ATTR_LOCATION_ID], target[ATTR_AVID])
+        if ATTR_CONFIG_ENTRY_ID in target:
+            if target[ATTR_CONFIG_ENTRY_ID] not in self._services:
+                raise HomeAssistantError(
+                    f"{target[ATTR_CONFIG_ENTRY_ID]} is not an Avi-on Mesh config entry"
+                )
+            entry_ids = [target[ATTR_CONFIG_ENTRY_ID]]
+        else:
+            entry_ids = list(self._services)
+        found = []
+        for entry_id in entry_ids:
+            self._index(entry_id)
+            if (device := self._by_avid[entry_id].get(key)) is not None:
+                found.append((entry_id, device))
+        if not found:
+            raise HomeAssistantError(
+                f"No Avi-on Mesh device or group {key[1]} in location {key[0]}"
+            )
+        if len(found) > 1:
+            raise HomeAssistantError(
+                f"Avi-on Mesh device or group {key[1]} in location {key[0]} exists in "
+                f"several accounts; add the config_entry_id of one"
+            )
+        return found[0]
+
+
+async def _async_set_many(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Set many lights at once, as a single batch per location."""
+    resolver = _TargetResolver(hass)
+    # entry id -> location id -> commands; every target is validated before any is sent
+    batches: Dict[str, Dict[int, List[LightCommand]]] = {}
+    for target in call.data[ATTR_TARGETS]:
+        entry_id, device = resolver.resolve(target)
+        batches.setdefault(entry_id, {}).setdefault(device.location_id, []).append(
+            target_command(device, target)
+        )
+
+    _LOGGER.debug(f"Setting {len(call.data[ATTR_TARGETS])} targets in one batch")
+    services: Dict[str, AvionMeshService] = hass.data[DOMAIN]
+    if transition := call.data.get(ATTR_TRANSITION):
+        # Targets ramping alike share their steps
+        await asyncio.gather(
+            *(
+                services[entry_id].async_transition(commands, transition, call.context)
+                for entry_id, commands in batches.items()
+            )
+        )
+        return
+    await asyncio.gather(
+        *(
+            services[entry_id].async_send_many(commands, call.context)
+            for entry_id, commands in batches.items()
+        )
+    )
+
+
+def _snapshot(hass: HomeAssistant, entity_id: str, device: IndexedDevice) -> dict:
+    """Return the current state of a light as a scene target."""
+    target = {
+        ATTR_ENTITY_ID: entity_id,
+        ATTR_LOCATION_ID: device.location_id,
+        ATTR_AVID: device.avid,
+    }
+    if (state := hass.states.get(entity_id)) is None:
+        raise HomeAssistantError(f"{entity_id} has no state to snapshot")
+    attributes = state.attributes
+    if state.state == STATE_OFF:
+        target[ATTR_STATE] = "off"
+    elif (
+        attributes.get(ATTR_COLOR_MODE) == ColorMode.COLOR_TEMP
+        and attributes.get(ATTR_COLOR_TEMP_KELVIN) is not None
+    ):
+        target[ATTR_COLOR_TEMP_KELVIN] = attributes[ATTR_COLOR_TEMP_KELVIN]
+    elif attributes.get(ATTR_BRIGHTNESS) is not None:
+        target[ATTR_BRIGHTNESS] = attributes[ATTR_BRIGHTNESS]
+    else:
+        target[ATTR_STATE] = "on"
+    return target
+
+
+async def _async_create_scene(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Snapshot the current state of Avi-on lights as a scene."""
+    resolver = _TargetResolver(hass)
+    entry_ids = set()
+    targets = []
+    for entity_id in call.data[ATTR_ENTITY_ID]:
+        entry_id, device = resolver.resolve({ATTR_ENTITY_ID: entity_id})
+        entry_ids.add(entry_id)
+        targets.append(_snapshot(hass, entity_id, device))
+    if len(entry_ids) > 1:
+        raise HomeAssistantError("A scene can only include lights of one Avi-on account")
+
+    scene_id = call.data[ATTR_SCENE_ID]
+    service: AvionMeshService = hass.data[DOMAIN][entry_ids.pop()]
+    await service.async_set_scene(
+        scene_id, {"name": call.data.get(ATTR_NAME, scene_id), "targets": targets}
+    )
+
+
+async def _async_delete_scene(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Delete a scene created with create_scene."""
+    services: Dict[str, AvionMeshService] = hass.data.get(DOMAIN, {})
+    deleted = [
+        await service.async_delete_scene(call.data[ATTR_SCENE_ID])
+        for service in services.values()
+    ]
+    if not any(deleted):
+        raise HomeAssistantError(f"No Avi-on Mesh scene {call.data[ATTR_SCENE_ID]}")
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the domain services."""
+
+    async def async_set_many(call: ServiceCall) -> None:
+        await _async_set_many(hass, call)
+
+    async def async_create_scene(call: ServiceCall) -> None:
+        await _async_create_scene(hass, call)
+
+    async def async_delete_scene(call: ServiceCall) -> None:
+        await _async_delete_scene(hass, call)
+
+    hass.services.async_register(DOMAIN, SERVICE_SET_MANY, async_set_many, schema=SET_MANY_SCHEMA)
+    hass.services.async_register(
+        DOMAIN, SERVICE_CREATE_SCENE, async_create_scene, schema=CREATE_SCENE_SCHEMA
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_DELETE_SCENE, async_delete_scene, schema=DELETE_SCENE_SCHEMA
+    )
@@ -0,0 +1,184 @@
+"""Supervision of the Avi-on mesh handler: backoff, link state and node choice."""
+import random
+import time
+from typing import Dict, Iterable, List, Optional
+
+from homeassistant.components import bluetooth as ha_bluetooth
+from homeassistant.core import HomeAssistant
+
+# Delay (seconds) before restarting a failed mesh handler, doubling per failure
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 300.0
+
+# Seconds a command may wait for the mesh handler before the link counts as down
+LINK_TIMEOUT = 20.0
+# Seconds to connect through the preferred node before allowing any node
+PREFERRED_NODE_TIMEOUT = 45.0
+# Seconds between link checks
+LINK_CHECK_INTERVAL = 5.0
+# Seconds between looking for Bluetooth adapters registered since, while
+# they cap a location's links below the configured number
+LINK_RESCAN_INTERVAL = 60.0
+
+
+class Backoff:
+    """Exponential backoff with jitter, reset once the link is up."""
+
+    def __init__(self, initial: float = BACKOFF_INITIAL, maximum: float = BACKOFF_MAX) -> None:
+        """Initialize the backoff."""
+        self.initial = initial
+        self.maximum = maximum
+        self.failures = 0
+
+    def next_delay(self) -> float:
+        """Return the delay before the next attempt."""
+        delay = min(self.initial * 2**self.failures, self.maximum)
+        self.failures += 1
+        # Jitter so that several locations do not retry in lockstep
+        return delay * random.uniform(0.5, 1.0)
+
+    def reset(self) -> None:
+        """Start over after a success."""
+        self.failures = 0
+
+
+class LinkMonitor:
+    """Link state of a mesh connection, inferred from its traffic.
+
+    The mesh handler does not report (dis)connections, but it only takes
+    commands and delivers statuses while connected. Any of those marks the
+    link up; a command left waiting for LINK_TIMEOUT or a failed handler
+    marks it down.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the monitor; the link starts down."""
+        self.up = False
+        # A command went unanswered since the last traffic
+        self.failed = False
+        now = time.monotonic()
+        self.changed_at = now
+        # Start of the current outage / connection attempt
+        self.down_since: Optional[float] = now
+        self.connecting_since: float = now
+        self.connects = 0
+        self.outages = 0
+        self.last_outage_s: Optional[float] = None
+        self.total_outage_s = 0.0
+        self.last_reconnect_s: Optional[float] = None
+
+    def connecting(self) -> None:
+        """Record the start of a connection attempt."""
+        self.connecting_since = time.monotonic()
+
+    def activity(self) -> bool:
+        """Record traffic from the mesh, returning True if the link just came up."""
+        if self.up:
+            return False
+        now = time.monotonic()
+        self.up = True
+        self.failed = False
+        self.changed_at = now
+        self.connects += 1
+        self.last_reconnect_s = now - self.connecting_since
+        # The first connection is not an outage
+        if self.outages and self.down_since is not None:
+            self.last_outage_s = now - self.down_since
+            self.total_outage_s += self.last_outage_s
+        self.down_since = None
+        return True
+
+    def down(self, since: Optional[float] = None) -> bool:
+        """Record that the link went down, returning True if it was up."""
+        self.failed = True
+        if not self.up:
+            return False
+        now = time.monotonic()
+        self.up = False
+        self.changed_at = now
+        self.outages += 1
+        self.down_since = since if since is not None else now
+        self.connecting_since = now
+        return True
+
+    def as_dict(self) -> dict:
+        """Return the link state as a serializable dict."""
+        return {
+            "up": self.up,
+            "connects": self.connects,
+            "outages": self.outages,
+            "last_outage_s": self.last_outage_s,
+            "total_outage_s": self.total_outage_s,
+            "last_reconnect_s": self.last_reconnect_s,
+            "down_for_s": (
+                time.monotonic() - self.down_since if self.down_since is not None else None
+            ),
+        }
+
+
+def best_node(
+    hass: HomeAssistant, macs: Iterable[str], remembered: Optional[str] = None
+) -> Optional[str]:
+    """Return the node to connect through first.
+
+    That is the node that gave a working link before while it is still being
+    heard, else the node with the strongest advertisement RSSI.
+    """
+    best: Optional[str] = None
+    best_rssi = -1000
+    for mac in macs:
+        if (info := ha_bluetooth.async_last_service_info(hass, mac, connectable=True)) is None:
+            continue
+        if mac == remembered:
+            return mac
+        if info.rssi > best_rssi:
+            best, best_rssi = mac, info.rssi
+    return best or remembered
+
+
+def node_rssi(hass: HomeAssistant, mac: str) -> Optional[int]:
+    """Return the RSSI of the last advertisement heard from a node."""
+    info = ha_bluetooth.async_last_service_info(hass, mac, connectable=True)
+    return info.rssi if info is not None else None
+
+
+def partition_nodes(hass: HomeAssistant, macs: List[str], count: int) -> List[List[str]]:
+    """Split the nodes of a location between count links.
+
+    Nodes are kept together per Bluetooth adapter or proxy that hears them
+    best, so that each link connects through a different adapter where
+    possible and no two links compete for the same node.
+    """
+    by_source: Dict[str, List[str]] = {}
+    unheard: List[str] = []
+    for mac in macs:
+        info = ha_bluetooth.async_last_service_info(hass, mac, connectable=True)
+        if info is None:
+            unheard.append(mac)
+        else:
+            by_source.setdefault(info.source, []).append(mac)
+
+    partitions: List[List[str]] = [[] for _ in range(count)]
+    for index, source in enumerate(sorted(by_source, key=lambda s: -len(by_source[s]))):
+        partitions[index % count].extend(by_source[source])
+    for mac in unheard:
+        min(partitions, key=len).append(mac)
+    # More links than adapters: share the nodes of the busiest one
+    for partition in partitions:
+        largest = max(partitions, key=len)
+        if not partition and len(largest) > 1:
+            partition.append(largest.pop())
+    return partitions
+
+
+def summarize_links(monitors: List[LinkMonitor]) -> dict:
+    """Return the combined link state of several links as a serializable dict."""
+    latest = max(monitors, key=lambda monitor: monitor.changed_at)
+    return {
+        **latest.as_dict(),
+        "up": any(monitor.up for monitor in monitors),
+        "links_up": sum(monitor.up for monitor in monitors),
+        "connects": sum(monitor.connects for monitor in monitors),
+        "outages": sum(monitor.outages for monitor in monitors),
+        "total_outage_s": sum(monitor.total_outage_s for monitor in monitors),
+    }
@@ -0,0 +1 @@
+"""Tests for the Avi-on Mesh integration."""
@@ -0,0 +1,39 @@
+"""Shared fixtures for the Avi-on Mesh tests."""
+import sys
+from pathlib import Path
+
+import pytest
+
+# The replay driver and the fake mesh are imported as the benchmarks run them
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from custom_components.avion_mesh.device_index import DeviceIndex, MeshOptions  # noqa: E402
+
+# First avid of the devices in the test location
+FIRST_DEVICE_AVID = 40000
+
+
+@pytest.fixture
+def location() -> dict:
+    """Return a location of four devices, with groups 100 (devices 0-1) and 101 (2-3)."""
+    devices = [
+        {
+            "pid": f"d{i}",
+            "product_id": 134,
+            "avid": FIRST_DEVICE_AVID + i,
+            "name": f"Device {i}",
+            "mac_address": f"aa:bb:cc:dd:ee:{i:02x}",
+        }
+        for i in range(4)
+    ]
+    groups = [
+        {"pid": "g0", "product_id": 0, "avid": 100, "name": "Group 0", "devices": ["d0", "d1"]},
+        {"pid": "g1", "product_id": 0, "avid": 101, "name": "Group 1", "devices": ["d2", "d3"]},
+    ]
+    return {"passphrase": "secret", "devices": devices, "groups": groups}
+
+
+@pytest.fixture
+def index(location: dict) -> DeviceIndex:
+    """Return the device index of the test location."""
+    return DeviceIndex.build(0, location, MeshOptions())
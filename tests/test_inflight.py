@@ -0,0 +1,125 @@
+"""Tests for in-flight command tracking and status routing."""
+import asyncio
+
+import pytest
+
+from custom_components.avion_mesh import inflight
+from custom_components.avion_mesh.commands import dimming
+from custom_components.avion_mesh.const import AVID_ALL
+from custom_components.avion_mesh.device_index import DeviceIndex
+from custom_components.avion_mesh.inflight import InFlightCommands
+from custom_components.avion_mesh.mesh_session import MeshStatusRouter
+
+from .conftest import FIRST_DEVICE_AVID
+
+
+@pytest.fixture(autouse=True)
+def short_confirm_timeout(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Give up on unconfirmed commands quickly."""
+    monkeypatch.setattr(inflight, "CONFIRM_TIMEOUT", 0.05)
+
+
+def test_wait_for_confirmation_starts_when_sent() -> None:
+    """A command still queued past the timeout is not unconfirmed yet."""
+
+    async def run() -> None:
+        unconfirmed = []
+        tracker = InFlightCommands(unconfirmed.append)
+        tracker.track(dimming(1, 10))
+        await asyncio.sleep(0.1)
+        assert unconfirmed == []
+
+        tracker.sent(1, {"brightness": 10})
+        await asyncio.sleep(0.1)
+        assert unconfirmed == [1]
+        assert tracker.stats()["confirm_timeouts"] == 1
+
+    asyncio.run(run())
+
+
+def test_self_ack_does_not_confirm() -> None:
+    """The library's acknowledgement is withheld but the device still has to confirm."""
+
+    async def run() -> None:
+        unconfirmed = []
+        tracker = InFlightCommands(unconfirmed.append)
+        tracker.track(dimming(1, 10))
+        tracker.sent(1, {"brightness": 10})
+
+        assert tracker.reconcile(1, {"avid": 1, "brightness": 10}, self_ack=True) is None
+        assert tracker.stats()["in_flight"] == 1
+        assert tracker.reconcile(1, {"avid": 1, "brightness": 10}) is None
+        assert tracker.stats()["in_flight"] == 0
+
+        await asyncio.sleep(0.1)
+        assert unconfirmed == []
+        assert tracker.stats()["self_acks"] == 1
+        assert tracker.stats()["echoes_absorbed"] == 1
+
+    asyncio.run(run())
+
+
+def test_stale_status_is_ignored_and_other_values_delivered() -> None:
+    """Values contradicting the command are dropped, values it does not set pass."""
+
+    async def run() -> None:
+        tracker = InFlightCommands(lambda avid: None)
+        tracker.track(dimming(1, 10))
+        delivered = tracker.reconcile(1, {"avid": 1, "brightness": 200, "color_temp": 3000})
+        assert delivered == {"avid": 1, "color_temp": 3000}
+        assert tracker.stats()["stale_ignored"] == 1
+        tracker.clear()
+
+    asyncio.run(run())
+
+
+def test_dropped_command_gives_up_at_once() -> None:
+    """A command dropped unsent is reported so that the state is re-read."""
+
+    async def run() -> None:
+        unconfirmed = []
+        tracker = InFlightCommands(unconfirmed.append)
+        tracker.track(dimming(1, 10))
+        tracker.drop(1)
+        assert unconfirmed == [1]
+        assert tracker.stats()["in_flight"] == 0
+        assert tracker.stats()["dropped_unsent"] == 1
+
+    asyncio.run(run())
+
+
+def test_self_ack_is_no_sign_of_life(index: DeviceIndex) -> None:
+    """Self-acks reach the listeners, as ramp steps do, without counting as reports."""
+
+    async def run() -> None:
+        router = MeshStatusRouter(InFlightCommands(lambda avid: None))
+        router.set_index(index)
+        statuses = []
+        router.async_add_listener(FIRST_DEVICE_AVID, lambda status: statuses.append(status) or True)
+        status = {"avid": FIRST_DEVICE_AVID, "brightness": 50}
+
+        assert not router.async_route(status, self_ack=True)
+        assert router.async_route(status)
+        assert statuses == [status, status]
+
+    asyncio.run(run())
+
+
+def test_group_status_fans_out_to_members(index: DeviceIndex) -> None:
+    """A group echo confirms the commands of its members."""
+
+    async def run() -> None:
+        router = MeshStatusRouter(InFlightCommands(lambda avid: None))
+        router.set_index(index)
+        router.async_track([dimming(FIRST_DEVICE_AVID, 80), dimming(FIRST_DEVICE_AVID + 1, 80)])
+        delivered = []
+        router.async_add_listener(
+            FIRST_DEVICE_AVID + 2, lambda status: delivered.append(status) or True
+        )
+
+        router.async_route({"avid": 100, "brightness": 80})
+        router.async_route({"avid": AVID_ALL, "brightness": 80})
+        assert router.inflight.stats()["in_flight"] == 0
+        assert delivered == [{"avid": AVID_ALL, "brightness": 80}]
+
+    asyncio.run(run())
@@ -0,0 +1,112 @@
+"""Tests for device liveness."""
+from typing import List
+
+import pytest
+
+from custom_components.avion_mesh import liveness
+from custom_components.avion_mesh.const import AVID_ALL
+from custom_components.avion_mesh.device_index import DeviceIndex
+from custom_components.avion_mesh.liveness import PROBE_GRACE, LivenessTracker
+
+from .conftest import FIRST_DEVICE_AVID
+
+D0, D1, D2, D3 = range(FIRST_DEVICE_AVID, FIRST_DEVICE_AVID + 4)
+TIMEOUT = 60.0
+
+
+class _Clock:
+    """Monotonic clock moved by the test."""
+
+    def __init__(self) -> None:
+        """Initialize the clock."""
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        """Return the time the test moved the clock to."""
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> _Clock:
+    """Drive the tracker's clock by hand."""
+    clock = _Clock()
+    monkeypatch.setattr(liveness, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def probes() -> List[int]:
+    """Return the locations probed."""
+    return []
+
+
+@pytest.fixture
+def tracker(clock: _Clock, probes: List[int], index: DeviceIndex) -> LivenessTracker:
+    """Return a tracker watching the test location, its wheel ticked by hand."""
+    tracker = LivenessTracker(None, TIMEOUT, probes.append)
+    tracker.set_index(index)
+    return tracker
+
+
+def _advance(tracker: LivenessTracker, clock: _Clock, seconds: float) -> None:
+    """Move the clock and tick the wheel."""
+    clock.now += seconds
+    tracker._async_tick()
+
+
+def test_silent_device_is_probed_then_offline(
+    tracker: LivenessTracker, clock: _Clock, probes: List[int]
+) -> None:
+    """A device is probed once its silence ran out, and offline if it stays silent."""
+    tracker.async_seen(0, [D0, D1, D2])
+    _advance(tracker, clock, TIMEOUT + tracker.resolution)
+    assert probes == [0]
+    assert tracker.is_available(0, D3)
+
+    tracker.async_seen(0, [D0, D1, D2])
+    _advance(tracker, clock, PROBE_GRACE + tracker.resolution)
+    assert not tracker.is_available(0, D3)
+    assert tracker.offline_devices(0) == [D3]
+    assert tracker.stats(0)["went_offline"] == 1
+
+
+def test_report_brings_a_device_back(tracker: LivenessTracker, clock: _Clock) -> None:
+    """An offline device is available again as soon as it reports."""
+    changes = []
+    tracker.async_add_listener(0, D3, lambda: changes.append(tracker.is_available(0, D3)))
+    _advance(tracker, clock, TIMEOUT + tracker.resolution)
+    _advance(tracker, clock, PROBE_GRACE + tracker.resolution)
+    tracker.async_seen(0, [D3])
+    assert changes == [False, True]
+    assert tracker.stats(0)["came_online"] == 1
+
+
+def test_group_is_available_while_any_member_is(tracker: LivenessTracker, clock: _Clock) -> None:
+    """A group, and the 'all' avid, stay available until every member is offline."""
+    _advance(tracker, clock, TIMEOUT + tracker.resolution)
+    tracker.async_seen(0, [D3])
+    _advance(tracker, clock, PROBE_GRACE + tracker.resolution)
+    assert not tracker.is_available(0, 100)
+    assert tracker.is_available(0, 101)
+    assert tracker.is_available(0, AVID_ALL)
+
+
+def test_group_report_does_not_keep_members_alive(
+    tracker: LivenessTracker, clock: _Clock
+) -> None:
+    """A status for a group avid does not tell which members heard it."""
+    _advance(tracker, clock, TIMEOUT + tracker.resolution)
+    tracker.async_seen(0, [100])
+    _advance(tracker, clock, PROBE_GRACE + tracker.resolution)
+    assert not tracker.is_available(0, D0)
+
+
+def test_timeout_of_zero_keeps_every_device_available(
+    tracker: LivenessTracker, clock: _Clock
+) -> None:
+    """Turning the timeout off brings offline devices back."""
+    _advance(tracker, clock, TIMEOUT + tracker.resolution)
+    _advance(tracker, clock, PROBE_GRACE + tracker.resolution)
+    assert tracker.stats(0)["offline"] == 4
+    tracker.async_set_timeout(0)
+    assert tracker.stats(0)["offline"] == 0
@@ -0,0 +1,50 @@
+"""Tests for the group command planner."""
+from custom_components.avion_mesh.commands import READ_ALL, color_temp, dimming
+from custom_components.avion_mesh.const import AVID_ALL
+from custom_components.avion_mesh.device_index import DeviceIndex
+from custom_components.avion_mesh.planner import GroupCommandPlanner
+
+from .conftest import FIRST_DEVICE_AVID
+
+D0, D1, D2, D3 = range(FIRST_DEVICE_AVID, FIRST_DEVICE_AVID + 4)
+
+
+def _planner(index: DeviceIndex) -> GroupCommandPlanner:
+    """Return a planner for the test location."""
+    planner = GroupCommandPlanner()
+    planner.set_index(index)
+    return planner
+
+
+def test_whole_group_is_addressed_through_the_group(index: DeviceIndex) -> None:
+    """Devices covering a group with the same value become one group command."""
+    planner = _planner(index)
+    planned = planner.plan([dimming(D0, 50), dimming(D1, 50), dimming(D2, 50)])
+    assert planned == [dimming(100, 50), dimming(D2, 50)]
+    assert planner.stats() == {"commands_planned": 3, "packets_planned": 2}
+
+
+def test_every_device_is_addressed_through_all(index: DeviceIndex) -> None:
+    """The same value for every device becomes one command to the 'all' avid."""
+    planned = _planner(index).plan([dimming(avid, 0) for avid in (D0, D1, D2, D3)])
+    assert planned == [dimming(AVID_ALL, 0)]
+
+
+def test_values_are_planned_apart(index: DeviceIndex) -> None:
+    """Only devices sharing a packet kind and value are grouped."""
+    planned = _planner(index).plan(
+        [dimming(D0, 50), dimming(D1, 60), color_temp(D0, 3000), color_temp(D1, 3000)]
+    )
+    assert planned == [dimming(D0, 50), dimming(D1, 60), color_temp(100, 3000)]
+
+
+def test_latest_command_per_target_wins(index: DeviceIndex) -> None:
+    """An earlier command for the same target and kind is planned away."""
+    planned = _planner(index).plan([dimming(D0, 50), dimming(D1, 50), dimming(D0, 80)])
+    assert planned == [dimming(D1, 50), dimming(D0, 80)]
+
+
+def test_reads_and_group_commands_pass_through(index: DeviceIndex) -> None:
+    """Commands not addressed to a single device are kept as they are."""
+    planned = _planner(index).plan([READ_ALL, dimming(101, 10)])
+    assert planned == [READ_ALL, dimming(101, 10)]
@@ -0,0 +1,167 @@
+"""Tests for the mesh command and status queues."""
+import asyncio
+import time
+
+import pytest
+
+from custom_components.avion_mesh.commands import color_temp, dimming
+from custom_components.avion_mesh.mesh_session import MeshStatus
+from custom_components.avion_mesh.queues import (
+    OVERFLOW_BLOCK,
+    PRIORITY_INTERACTIVE,
+    BoundedStatusQueue,
+    CoalescingCommandQueue,
+    LinkStatusQueue,
+    SelfAck,
+    StatusDeduplicator,
+    TokenBucket,
+)
+
+
+async def _drain(queue: CoalescingCommandQueue) -> list:
+    """Return the pending commands in dispatch order."""
+    commands = []
+    while len(queue):
+        _, command, _ = await queue.get()
+        commands.append(command)
+    return commands
+
+
+def test_newest_command_for_a_target_wins() -> None:
+    """A pending command is replaced by a newer one of the same kind for its avid."""
+
+    async def run() -> None:
+        queue = CoalescingCommandQueue()
+        await queue.put(dimming(1, 10))
+        await queue.put(color_temp(1, 3000))
+        await queue.put(dimming(1, 20))
+        assert await _drain(queue) == [color_temp(1, 3000), dimming(1, 20)]
+        assert queue.stats()["collapsed"] == 1
+
+    asyncio.run(run())
+
+
+def test_interactive_before_bulk_and_avids_take_turns() -> None:
+    """Interactive commands go first; within a class, avids alternate."""
+
+    async def run() -> None:
+        queue = CoalescingCommandQueue()
+        await queue.put(dimming(1, 10))
+        await queue.put(color_temp(1, 3000))
+        await queue.put(dimming(2, 20))
+        await queue.put(dimming(3, 30), priority=PRIORITY_INTERACTIVE)
+        assert [command.avid for command in await _drain(queue)] == [3, 1, 2, 1]
+
+    asyncio.run(run())
+
+
+def test_drop_oldest_evicts_same_avid_then_bulk() -> None:
+    """A full queue drops the oldest command for the avid, else the oldest bulk one."""
+
+    async def run() -> None:
+        queue = CoalescingCommandQueue(2)
+        dropped = []
+        queue.on_drop = dropped.append
+        await queue.put(dimming(1, 10), priority=PRIORITY_INTERACTIVE)
+        await queue.put(dimming(2, 20))
+        await queue.put(color_temp(1, 3000), priority=PRIORITY_INTERACTIVE)
+        assert dropped == [dimming(1, 10)]
+        await queue.put(dimming(3, 30))
+        assert dropped == [dimming(1, 10), dimming(2, 20)]
+        assert await _drain(queue) == [color_temp(1, 3000), dimming(3, 30)]
+        assert queue.stats()["dropped"] == 2
+
+    asyncio.run(run())
+
+
+def test_block_policy_times_out_with_queue_full() -> None:
+    """Under the block policy a put on a full queue raises QueueFull after the timeout."""
+
+    async def run() -> None:
+        queue = CoalescingCommandQueue(1, OVERFLOW_BLOCK, timeout=0.01)
+        dropped = []
+        queue.on_drop = dropped.append
+        await queue.put(dimming(1, 10))
+        # A newer command for a pending target always fits
+        await queue.put(dimming(1, 20))
+        with pytest.raises(asyncio.QueueFull):
+            await queue.put(dimming(2, 20))
+        assert dropped == [dimming(2, 20)]
+        assert await _drain(queue) == [dimming(1, 20)]
+
+    asyncio.run(run())
+
+
+def test_status_queue_drops_oldest_status_of_the_avid() -> None:
+    """A full status queue evicts the oldest status of the same avid first."""
+
+    async def run() -> None:
+        queue = BoundedStatusQueue(2)
+        await queue.put(MeshStatus({"avid": 1, "brightness": 10}))
+        await queue.put(MeshStatus({"avid": 2, "brightness": 20}))
+        await queue.put(MeshStatus({"avid": 1, "brightness": 30}))
+        statuses = [queue.get_nowait().data for _ in range(queue.qsize())]
+        assert statuses == [{"avid": 2, "brightness": 20}, {"avid": 1, "brightness": 30}]
+        assert queue.stats()["dropped"] == 1
+
+    asyncio.run(run())
+
+
+def test_token_bucket_limits_the_rate() -> None:
+    """Past its burst, the bucket lets packets through at the rate."""
+
+    async def run() -> None:
+        bucket = TokenBucket(100)
+        start = time.monotonic()
+        for _ in range(110):
+            await bucket.acquire()
+        assert time.monotonic() - start >= 0.09
+        assert bucket.throttled > 0
+
+    asyncio.run(run())
+
+
+def test_token_bucket_without_rate_never_waits() -> None:
+    """A rate of 0 disables the limit."""
+
+    async def run() -> None:
+        bucket = TokenBucket(0)
+        for _ in range(1000):
+            await bucket.acquire()
+        assert bucket.throttled == 0
+
+    asyncio.run(run())
+
+
+def test_deduplicator_drops_the_same_status_from_another_link() -> None:
+    """The same values from another link within the window are one report."""
+    deduplicator = StatusDeduplicator()
+    status = {"avid": 1, "brightness": 10}
+    assert not deduplicator.is_duplicate(0, status)
+    assert deduplicator.is_duplicate(1, status)
+    # The same link reporting again is a new report
+    assert not deduplicator.is_duplicate(0, status)
+
+
+def test_link_status_queue_forwards_the_self_ack() -> None:
+    """The library's acknowledgement is forwarded as a SelfAck and not deduplicated."""
+
+    async def run() -> None:
+        shared = BoundedStatusQueue()
+        deduplicator = StatusDeduplicator()
+        sending = LinkStatusQueue(0, shared, lambda: None, deduplicator)
+        other = LinkStatusQueue(1, shared, lambda: None, deduplicator)
+        status = {"avid": 1, "brightness": 10}
+
+        sending.expect_ack(dimming(1, 10).ack)
+        await sending.put(MeshStatus(dict(status)))
+        # The device's own report, heard through another link
+        await other.put(MeshStatus(dict(status)))
+        await sending.put(MeshStatus(dict(status)))
+
+        items = [shared.get_nowait() for _ in range(shared.qsize())]
+        assert [type(item) for item in items] == [SelfAck, MeshStatus]
+        assert deduplicator.duplicates == 1
+
+    asyncio.run(run())
+
@@ -0,0 +1,77 @@
+"""Tests for the traffic recorder and the replay driver's capture loading."""
+import asyncio
+import json
+from pathlib import Path
+from typing import List
+
+from homeassistant.core import HomeAssistant
+from replay_traffic import load_capture
+
+from custom_components.avion_mesh.commands import dimming
+from custom_components.avion_mesh.recorder import (
+    EVENT_COMMANDS,
+    EVENT_HEADER,
+    EVENT_STATUS,
+    TrafficRecorder,
+    capture_files,
+)
+
+
+def _lines(path: Path) -> List[list]:
+    """Return the events of a capture file."""
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+async def _record(hass: HomeAssistant, path: Path, brightness: int) -> None:
+    """Record a command and a status, then stop the recording."""
+    recorder = TrafficRecorder(hass, str(path))
+    recorder.record_commands(0, [dimming(1, brightness)], 1)
+    await asyncio.sleep(0.01)
+    recorder.record_status(0, {"avid": 1, "brightness": brightness})
+    await recorder.async_stop()
+    assert recorder.as_dict()["recorded"] == 2
+
+
+def test_restarted_recording_starts_with_a_header(tmp_path: Path) -> None:
+    """A recording appended to an existing capture gets its own header."""
+    path = tmp_path / "capture.jsonl"
+
+    async def run() -> None:
+        hass = HomeAssistant(str(tmp_path))
+        await _record(hass, path, 10)
+        await _record(hass, path, 20)
+        await hass.async_stop(force=True)
+
+    asyncio.run(run())
+    kinds = [event[0] for event in _lines(path)]
+    assert kinds == [EVENT_HEADER, EVENT_COMMANDS, EVENT_STATUS] * 2
+
+    # Replayed one after the other, not on top of each other
+    events = load_capture(str(path))
+    assert [event[4][0][2] for event in events if event[0] == EVENT_COMMANDS] == [10, 20]
+    times = [event[1] for event in events]
+    assert times == sorted(times)
+
+
+def test_full_capture_is_rotated(tmp_path: Path) -> None:
+    """A capture outgrowing its bound moves to a backup and starts a new file with a header."""
+    path = tmp_path / "capture.jsonl"
+    recorder = TrafficRecorder(None, str(path), max_bytes=200, backups=1)
+    line = json.dumps([EVENT_STATUS, 0.0, 0, {"avid": 1, "brightness": 10}])
+
+    assert recorder._write([line] * 2) == (0, 0)
+    assert recorder._write([line] * 2) == (0, 1)
+    assert recorder._write([line] * 2) == (0, 1)
+
+    assert capture_files(str(path)) == [f"{path}.1", str(path)]
+    for file in capture_files(str(path)):
+        events = _lines(Path(file))
+        assert events[0][0] == EVENT_HEADER
+        assert [event[0] for event in events[1:]] == [EVENT_STATUS] * 2
+
+
+def test_failed_write_counts_the_lines_dropped(tmp_path: Path) -> None:
+    """Lines that could not be written are reported as dropped."""
+    recorder = TrafficRecorder(None, str(tmp_path / "missing" / "dir" / "capture.jsonl"))
+    (tmp_path / "missing").write_text("")
+    assert recorder._write(["[]"] * 3) == (3, 0)